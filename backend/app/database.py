@@ -1,26 +1,251 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+"""
+Database engines and sessions, partitioned by airport.
+
+Without DATABASE_SHARDS everything lives in the one DATABASE_URL database.
+DATABASE_SHARDS adds shards as a JSON object of
+name -> {"url", "airports": [codes], "id_base"}, e.g.
+
+    {"east": {"url": "postgresql://.../east", "airports": ["JFK", "ATL"], "id_base": 100000000}}
+
+An airport's terminals, gates, restaurants, orders and agents all live in its
+shard; airports not listed (and agents without an airport) stay in the
+"default" shard at DATABASE_URL. Each shard hands out primary keys from its
+own range starting above id_base, so an ID alone says which shard a row is in
+and requests for /orders/{id}, /restaurants/{id} or /agents/{id} are routed
+without a lookup. Space the bases far enough apart that no shard outgrows its
+range.
+
+get_routed_db() is the request dependency that opens a session on the right
+shard; scatter() runs a function against every shard for cross-airport
+queries.
+
+Read replicas: a shard's "replicas" (for the default shard,
+DATABASE_REPLICA_URLS, comma-separated) serve GET/HEAD requests routed by
+get_routed_db(); everything else goes to the primary. A replica more than
+DATABASE_REPLICA_MAX_LAG seconds behind is skipped. A client that just wrote
+sends back the read-after token it was given (see
+app.services.read_your_writes) and is only served by a replica that has
+replayed that write, otherwise by the primary. Lag and replay position are
+measured on PostgreSQL; replicas on other backends (e.g. the same SQLite file
+opened read-only, for local testing) are taken to be current.
+"""
+import json
+import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
 from dotenv import load_dotenv
+from fastapi import Request
+from sqlalchemy import create_engine, event, func, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import ORMExecuteState, Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Database URL - defaults to SQLite for development
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./airport_delivery.db")
+DATABASE_SHARDS = os.getenv("DATABASE_SHARDS", "")
+DEFAULT_SHARD = "default"
+DATABASE_REPLICA_URLS = os.getenv("DATABASE_REPLICA_URLS", "")
+REPLICA_MAX_LAG = float(os.getenv("DATABASE_REPLICA_MAX_LAG", "5"))  # seconds
+REPLICA_CHECK_INTERVAL = float(os.getenv("DATABASE_REPLICA_CHECK_INTERVAL", "1"))  # seconds
+
+READ_METHODS = {"GET", "HEAD"}
+
+# Path and body parameters a request is routed by, in order of preference
+ROUTING_PARAMS = ("airport_code", "order_id", "restaurant_id", "agent_id")
+
+T = TypeVar("T")
+
+
+def create_db_engine(url: str) -> Engine:
+    if url.startswith("sqlite"):
+        return create_engine(url, connect_args={"check_same_thread": False})
+    return create_engine(url)
+
+
+# A write a client must be able to read back: (primary WAL position or None, time.time() of the write)
+WritePosition = Tuple[Optional[int], float]
+
+
+class Replica:
+    """A read-only copy of a shard, with its replication lag as last measured"""
+
+    def __init__(self, shard_name: str, url: str):
+        self.url = url
+        self.engine = create_db_engine(url)
+        self.SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=self.engine, info={"shard": shard_name, "replica": True}
+        )
+        self.position: Optional[int] = None  # WAL replayed so far (PostgreSQL)
+        self.lag: Optional[float] = None  # seconds behind the primary; None while unreachable
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False):
+        """Re-measure lag and position, at most every REPLICA_CHECK_INTERVAL unless forced"""
+        if not force and time.monotonic() - self.checked_at < REPLICA_CHECK_INTERVAL:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self.checked_at < REPLICA_CHECK_INTERVAL:
+                return
+            try:
+                with self.engine.connect() as conn:
+                    if self.engine.dialect.name == "postgresql":
+                        # Fully replayed what it received = current, however long ago the last write was
+                        position, lag = conn.execute(text(
+                            "SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() "
+                            "ELSE pg_current_wal_lsn() END - '0/0', "
+                            "CASE WHEN NOT pg_is_in_recovery() "
+                            "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+                        )).one()
+                        self.position = int(position) if position is not None else None
+                        self.lag = float(lag) if lag is not None else None
+                    else:
+                        conn.execute(text("SELECT 1"))
+                        self.lag = 0.0
+            except Exception:
+                logger.warning("Replica %s is unreachable", self.engine.url, exc_info=True)
+                self.lag = None
+            self.checked_at = time.monotonic()
 
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        DATABASE_URL, connect_args={"check_same_thread": False}
-    )
-else:
-    engine = create_engine(DATABASE_URL)
+    def serves(self, read_after: Optional[WritePosition]) -> bool:
+        """Within the lag limit, and has replayed read_after (when given)"""
+        if self.lag is None or self.lag > REPLICA_MAX_LAG:
+            return False
+        if read_after is None:
+            return True
+        position, written_at = read_after
+        if position is not None and self.position is not None:
+            return self.position >= position
+        return time.time() - written_at >= self.lag
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class Shard:
+    """One database: the airports it serves, the start of its ID range and its read replicas"""
+
+    def __init__(self, name: str, url: str, airports: List[str], id_base: int = 0, replicas: List[str] = ()):
+        self.name = name
+        self.url = url
+        self.airports = {code.upper() for code in airports}
+        self.id_base = id_base
+        self.engine = create_db_engine(url)
+        self.SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=self.engine, info={"shard": name}
+        )
+        self.replicas = [Replica(name, replica_url) for replica_url in replicas]
+        self._next_replica = 0
+
+    def __repr__(self) -> str:
+        return f"Shard({self.name!r})"
+
+    def reader(self, read_after: Optional[WritePosition] = None) -> Optional[Replica]:
+        """
+        A replica to read from (round robin over the healthy ones), or None to
+        read from the primary. When no replica is known to have read_after
+        yet, their positions are re-measured once before giving up.
+        """
+        if not self.replicas:
+            return None
+        start = self._next_replica = (self._next_replica + 1) % len(self.replicas)
+        candidates = self.replicas[start:] + self.replicas[:start]
+        for force in (False, True) if read_after is not None else (False,):
+            for replica in candidates:
+                replica.refresh(force)
+                if replica.serves(read_after):
+                    return replica
+        return None
+
+    def write_position(self) -> Optional[int]:
+        """The primary's current WAL position (PostgreSQL; None elsewhere)"""
+        if self.engine.dialect.name != "postgresql":
+            return None
+        with self.engine.connect() as conn:
+            return int(conn.execute(text("SELECT pg_current_wal_lsn() - '0/0'")).scalar())
+
+
+def load_shards() -> Dict[str, Shard]:
+    default_replicas = [url.strip() for url in DATABASE_REPLICA_URLS.split(",") if url.strip()]
+    shards = {DEFAULT_SHARD: Shard(DEFAULT_SHARD, DATABASE_URL, [], replicas=default_replicas)}
+    for name, spec in (json.loads(DATABASE_SHARDS) if DATABASE_SHARDS else {}).items():
+        if name == DEFAULT_SHARD:
+            raise ValueError(f"DATABASE_SHARDS can't redefine the {DEFAULT_SHARD!r} shard (use DATABASE_URL)")
+        shards[name] = Shard(
+            name, spec["url"], spec.get("airports", []), int(spec["id_base"]), spec.get("replicas", [])
+        )
+
+    bases = sorted(shard.id_base for shard in shards.values())
+    if len(set(bases)) != len(bases) or bases[0] != 0:
+        raise ValueError("Every shard needs its own positive id_base")
+    listed: Dict[str, str] = {}
+    for shard in shards.values():
+        for code in shard.airports:
+            if code in listed:
+                raise ValueError(f"Airport {code} is in both the {listed[code]!r} and {shard.name!r} shards")
+            listed[code] = shard.name
+    return shards
+
+
+shards = load_shards()
+_by_airport = {code: shard for shard in shards.values() for code in shard.airports}
+_by_id_base = sorted(shards.values(), key=lambda shard: shard.id_base, reverse=True)
+
+# The default shard, for code that isn't airport-specific
+engine = shards[DEFAULT_SHARD].engine
+SessionLocal = shards[DEFAULT_SHARD].SessionLocal
 
 Base = declarative_base()
 
 
+def all_shards() -> List[Shard]:
+    return list(shards.values())
+
+
+def shard_for_airport(code: Optional[str]) -> Shard:
+    return _by_airport.get((code or "").upper(), shards[DEFAULT_SHARD])
+
+
+def shard_for_id(row_id: int) -> Shard:
+    """The shard whose ID range contains row_id (any table)"""
+    for shard in _by_id_base:
+        if row_id > shard.id_base:
+            return shard
+    return shards[DEFAULT_SHARD]
+
+
+def shard_of(db: Session) -> Shard:
+    return shards[db.info.get("shard", DEFAULT_SHARD)]
+
+
+def has_replicas() -> bool:
+    return any(shard.replicas for shard in shards.values())
+
+
+def staleness(db: Session) -> float:
+    """How far behind the primary db's reads may be, in seconds"""
+    return REPLICA_MAX_LAG if db.info.get("replica") else 0.0
+
+
+class ReadAfter:
+    """A request's read-your-writes state: writes it must see, and shards it wrote to"""
+
+    def __init__(self, tokens: Dict[str, WritePosition]):
+        self.tokens = tokens
+        self.written: Set[str] = set()
+
+
+# Set per request by app.services.read_your_writes
+request_read_after: ContextVar[Optional[ReadAfter]] = ContextVar("request_read_after", default=None)
+
+
 def get_db():
     """Dependency for getting database session"""
     db = SessionLocal()
@@ -30,4 +255,148 @@ def get_db():
         db.close()
 
 
+async def request_shard(request: Request) -> Shard:
+    """Shard for a request, from the airport or row ID in its path, or restaurant_id in its JSON body"""
+    params = request.path_params
+    if "airport_code" in params:
+        return shard_for_airport(params["airport_code"])
+    for name in ROUTING_PARAMS[1:]:
+        if name in params:
+            try:
+                return shard_for_id(int(params[name]))
+            except ValueError:
+                break  # the endpoint's own validation answers 422
+    if len(shards) > 1 and request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = await request.json()  # cached on the request; the endpoint reuses it
+        except ValueError:
+            body = None
+        if isinstance(body, dict) and isinstance(body.get("restaurant_id"), int):
+            return shard_for_id(body["restaurant_id"])
+    return shards[DEFAULT_SHARD]
+
+
+async def get_routed_db(request: Request):
+    """
+    Dependency for a session on the shard that owns the request's airport,
+    order, restaurant or agent: on a replica for reads when one is caught up
+    enough, on the primary otherwise
+    """
+    shard = await request_shard(request)
+    replica = None
+    if shard.replicas and request.method in READ_METHODS:
+        read_after = request_read_after.get()
+        replica = await run_in_threadpool(shard.reader, read_after.tokens.get(shard.name) if read_after else None)
+    db = (replica or shard).SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def scatter(fn: Callable[[Session], T], targets: Optional[List[Shard]] = None, readonly: bool = False) -> List[T]:
+    """
+    Run fn(session) against each shard (default: all) concurrently, each with
+    its own session, and return the results in shard order. readonly reads
+    from replicas where get_routed_db() would.
+    """
+    targets = all_shards() if targets is None else targets
+    read_after = request_read_after.get()  # worker threads don't inherit the request's context
+
+    def run(shard: Shard) -> T:
+        replica = shard.reader(read_after.tokens.get(shard.name) if read_after else None) if readonly else None
+        db = (replica or shard).SessionLocal()
+        try:
+            return fn(db)
+        finally:
+            db.close()
+
+    if len(targets) == 1:
+        return [run(targets[0])]
+    with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="scatter") as pool:
+        return list(pool.map(run, targets))
+
+
+# (shard, table) pairs known to have rows in the shard's ID range
+_in_range = set()
+
+
+@event.listens_for(Session, "before_flush")
+def _start_id_range(session: Session, flush_context, instances):
+    """
+    On backends without sequences, give a shard's first row in each table an
+    ID above its id_base; the database's max(id) + 1 keeps later rows in range.
+    (PostgreSQL sequences are moved into range by app.migrate instead.)
+    """
+    shard = shard_of(session)
+    if shard.id_base == 0 or session.get_bind().dialect.name == "postgresql":
+        return
+    next_ids: Dict[object, int] = {}
+    for obj in session.new:
+        table = getattr(obj, "__table__", None)
+        if (
+            table is None or "id" not in table.c or getattr(obj, "id", None) is not None
+            or (shard.name, table.name) in _in_range
+        ):
+            continue
+        if table not in next_ids:
+            highest = session.execute(select(func.max(table.c.id))).scalar() or 0
+            if highest > shard.id_base:
+                _in_range.add((shard.name, table.name))
+                continue
+            next_ids[table] = shard.id_base + 1
+        if table in next_ids:
+            obj.id = next_ids[table]
+            next_ids[table] += 1
+
+
+def stash(session: Session, key: str, items: Iterable):
+    """Add items to what session hands to key's apply() when it commits (see on_commit)"""
+    session.info.setdefault(key, []).extend(items)
+
+
+def on_commit(
+    key: str,
+    apply: Callable[[Session, list], None],
+    collect: Optional[Callable[[Session], Iterable]] = None,
+):
+    """
+    Act on a session's changes only once they are committed. collect(session)
+    runs after every flush and returns items to stash under session.info[key]
+    (stash() adds others, e.g. for bulk statements the unit of work doesn't
+    see); after commit, apply(session, items) gets them all, and a rollback
+    drops them.
+    """
+    if collect is not None:
+        @event.listens_for(Session, "after_flush")
+        def _collect(session: Session, flush_context):
+            items = collect(session)
+            if items:
+                stash(session, key, items)
+
+    @event.listens_for(Session, "after_commit")
+    def _apply(session: Session):
+        items = session.info.pop(key, None)
+        if items:
+            apply(session, items)
+
+    @event.listens_for(Session, "after_rollback")
+    def _discard(session: Session):
+        session.info.pop(key, None)
+
+
+# Which shards a request committed writes to, for its read-after token
+
+def _record_write(session: Session, _):
+    read_after = request_read_after.get()
+    if read_after is not None:
+        read_after.written.add(session.info.get("shard", DEFAULT_SHARD))
+
+
+on_commit("wrote", _record_write, collect=lambda session: [True])
+
 
+@event.listens_for(Session, "do_orm_execute")
+def _note_statement(state: ORMExecuteState):
+    if state.is_insert or state.is_update or state.is_delete:
+        stash(state.session, "wrote", [True])
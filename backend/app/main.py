@@ -1,19 +1,72 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import airports, restaurants, orders, websocket, agents, admin
-from app.database import engine, Base
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm.exc import StaleDataError
+from app.routers import airports, restaurants, orders, websocket, agents, admin, flights
+from app.services.compute import compute
+from app.services.jobs import jobs
+from app.services.notifications import notifier
+from app.services.idempotency import REPLAYED_HEADER, IdempotencyMiddleware
+from app.services.live_counts import live_counts
+from app.services.order_cache import listener as order_cache_listener
+from app.services.read_your_writes import READ_AFTER_HEADER, ReadYourWritesMiddleware
+from app.services.scheduler import scheduler
+from app.services.snapshots import warm_start
+from app.services.tracing import TRACEPARENT_HEADER, TracingMiddleware, tracer
+import asyncio
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# No database I/O at import time: the schema is managed by Alembic
+# (python -m app.migrate), run once per deploy before workers start.
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Export sampled spans in batches (TRACE_EXPORTER)
+    tracer.start()
+    # Ping open sockets and reap idle ones for the life of the worker
+    websocket.manager.start_heartbeat()
+    # Post-commit side effects (broadcasts) run here, off the request path
+    jobs.start()
+    # CPU-heavy optimization runs in worker processes, off the event loop's GIL
+    compute.start()
+    # Batch customer notifications per recipient
+    notifier.start()
+    # Drop cached orders written by other workers (PostgreSQL LISTEN/NOTIFY)
+    order_cache_listener.start()
+    # Serve orders still waiting for an agent, most urgent flight first
+    scheduler.start(orders.notify_assigned)
+    # Re-read the dashboard counters periodically (they pick up other workers' writes)
+    live_counts.start()
+    # Restore distance tables and demand rings from the last snapshot, then catch up (see /ready)
+    warm_start.start()
+    yield
+    # Snapshot for the next start
+    await warm_start.stop()
+    await live_counts.stop()
+    await scheduler.stop()
+    await notifier.stop()
+    # Finish queued broadcasts and notifications while the sockets are still open
+    await jobs.stop()
+    await compute.stop()
+    await notifier.close()
+    await asyncio.to_thread(order_cache_listener.stop)
+    # Close sockets gracefully so clients reconnect to a healthy worker
+    await websocket.manager.drain()
+    # Last, so spans of the jobs drained above are exported too
+    await tracer.stop()
+
 
 app = FastAPI(
     title="Airport Food Delivery API",
     description="Backend API for airport food delivery coordination platform",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS configuration - allow frontend URL from environment or default to localhost
@@ -28,6 +81,14 @@ allowed_origins = [
 if os.getenv("FRONTEND_URL"):
     allowed_origins.append(os.getenv("FRONTEND_URL"))
 
+# Read-after tokens for clients that just wrote, so replica reads see their writes
+# (inside idempotency, so replayed responses carry the token too)
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Replay responses to retried writes sent with an Idempotency-Key header
+# (added before CORS so replays still get CORS headers)
+app.add_middleware(IdempotencyMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -35,13 +96,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", REPLAYED_HEADER, READ_AFTER_HEADER, TRACEPARENT_HEADER],
 )
 
+# A span per request, around everything else (continues a caller's traceparent)
+app.add_middleware(TracingMiddleware)
+
+
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(request: Request, exc: StaleDataError):
+    # An ORM flush lost a compare-and-swap on Order.version
+    return ORJSONResponse(status_code=409, content={"detail": "Order was modified concurrently"})
+
+
 # Include routers
 app.include_router(airports.router, prefix="/api/airports", tags=["airports"])
 app.include_router(restaurants.router, prefix="/api/restaurants", tags=["restaurants"])
 app.include_router(orders.router, prefix="/api/orders", tags=["orders"])
 app.include_router(agents.router, prefix="/api/agents", tags=["agents"])
+app.include_router(flights.router, prefix="/api/flights", tags=["flights"])
 app.include_router(websocket.router, prefix="/ws", tags=["websocket"])
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 
@@ -55,3 +128,10 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+
+@app.get("/ready")
+async def ready():
+    # Unlike /health: 503 until this worker has restored its snapshot and caught up
+    status = warm_start.status()
+    return ORJSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
@@ -0,0 +1,95 @@
+"""
+Schema management. Alembic migrations are the only way tables get created or
+changed; the app itself never touches the schema at import or startup.
+
+    python -m app.migrate              # upgrade to head (run before starting workers)
+    python -m app.migrate --reset      # drop everything and rebuild (development only)
+    python -m app.migrate --shard east # only one shard (default: every shard)
+
+Databases created by the old Base.metadata.create_all() have the baseline
+tables but no alembic_version table; they are stamped at the baseline
+revision first so the upgrade only applies what they're missing.
+
+On PostgreSQL shards the ID sequences are then moved up to the shard's
+id_base, so new rows get IDs in the shard's range.
+"""
+import argparse
+import os
+import sys
+from typing import List, Optional
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+from app.database import Shard, all_shards, shards
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_REVISION = "0001"
+
+# Tables with a serial id column
+ID_TABLES = ["airports", "terminals", "gates", "restaurants", "delivery_agents", "orders"]
+
+
+def alembic_config(shard: Shard) -> Config:
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "migrations"))
+    config.attributes["url"] = shard.url
+    return config
+
+
+def adopt_legacy_database(config: Config, shard: Shard):
+    """Stamp a create_all()-built database at the baseline revision"""
+    tables = set(inspect(shard.engine).get_table_names())
+    if "airports" in tables and "alembic_version" not in tables:
+        print(f"[{shard.name}] Existing schema without migration history; stamping at {BASELINE_REVISION}")
+        command.stamp(config, BASELINE_REVISION)
+
+
+def align_id_sequences(shard: Shard):
+    """Start a PostgreSQL shard's sequences at its id_base (never moves one backwards)"""
+    if shard.id_base == 0 or shard.engine.dialect.name != "postgresql":
+        return
+    existing = set(inspect(shard.engine).get_table_names())
+    with shard.engine.begin() as conn:
+        for table in ID_TABLES:
+            if table not in existing:
+                continue
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"GREATEST((SELECT COALESCE(MAX(id), 0) FROM {table}), :base))"
+            ), {"base": shard.id_base})
+
+
+def upgrade(revision: str = "head", targets: Optional[List[Shard]] = None):
+    for shard in targets or all_shards():
+        config = alembic_config(shard)
+        adopt_legacy_database(config, shard)
+        command.upgrade(config, revision)
+        align_id_sequences(shard)
+
+
+def reset(targets: Optional[List[Shard]] = None):
+    for shard in targets or all_shards():
+        config = alembic_config(shard)
+        adopt_legacy_database(config, shard)
+        command.downgrade(config, "base")
+        command.upgrade(config, "head")
+        align_id_sequences(shard)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument("revision", nargs="?", default="head", help="Target revision (default: head)")
+    parser.add_argument("--reset", action="store_true", help="Downgrade to base, then upgrade to head")
+    parser.add_argument("--shard", choices=sorted(shards), help="Only this shard (default: all)")
+    args = parser.parse_args()
+
+    targets = [shards[args.shard]] if args.shard else None
+    if args.reset:
+        reset(targets)
+    else:
+        upgrade(args.revision, targets)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
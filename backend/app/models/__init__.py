@@ -2,8 +2,9 @@ from app.models.airport import Airport, Terminal, Gate
 from app.models.restaurant import Restaurant
 from app.models.order import Order
 from app.models.delivery_agent import DeliveryAgent
+from app.models.idempotency import IdempotencyKey
 
-__all__ = ["Airport", "Terminal", "Gate", "Restaurant", "Order", "DeliveryAgent"]
+__all__ = ["Airport", "Terminal", "Gate", "Restaurant", "Order", "DeliveryAgent", "IdempotencyKey"]
 
 
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, JSON
+from sqlalchemy import Column, String, Integer, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -22,7 +22,7 @@ class Terminal(Base):
     __tablename__ = "terminals"
 
     id = Column(Integer, primary_key=True, index=True)
-    airport_id = Column(Integer, ForeignKey("airports.id"), nullable=False)
+    airport_id = Column(Integer, ForeignKey("airports.id"), nullable=False, index=True)
     name = Column(String(100), nullable=False)  # e.g., "Terminal 1", "Terminal A"
     layout_data = Column(JSON)  # Store SVG path or coordinate data
 
@@ -33,6 +33,9 @@ class Terminal(Base):
 
 class Gate(Base):
     __tablename__ = "gates"
+    __table_args__ = (
+        Index("ix_gates_terminal_gate_number", "terminal_id", "gate_number"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     terminal_id = Column(Integer, ForeignKey("terminals.id"), nullable=False)
@@ -1,7 +1,11 @@
-from sqlalchemy import Column, String, Integer, Enum as SQLEnum
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from app.database import Base
 import enum
+import os
+
+# Orders an agent may carry at once unless set per agent
+AGENT_DEFAULT_CAPACITY = int(os.getenv("AGENT_DEFAULT_CAPACITY", "3"))
 
 
 class AgentStatus(str, enum.Enum):
@@ -19,8 +23,12 @@ class DeliveryAgent(Base):
     agent_code = Column(String(20), unique=True, nullable=False)  # Unique agent code for login
     password = Column(String(255), nullable=True)  # For future authentication
     status = Column(SQLEnum(AgentStatus), default=AgentStatus.AVAILABLE, nullable=False)
-    current_location = Column(String(100))  # Terminal or gate location
+    airport_id = Column(Integer, ForeignKey("airports.id"), index=True)  # Where the agent works (None: not placed yet)
+    current_location = Column(String(100))  # Gate in that airport (gate numbers repeat across airports)
     contact = Column(String(255))
+    capacity = Column(Integer, default=AGENT_DEFAULT_CAPACITY, nullable=False)  # Max active orders
+    shift_start = Column(DateTime(timezone=True))  # Dispatchable from (None: no limit)
+    shift_end = Column(DateTime(timezone=True))  # Dispatchable until (None: no limit)
 
     orders = relationship("Order", back_populates="delivery_agent")
 
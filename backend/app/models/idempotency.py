@@ -0,0 +1,15 @@
+from sqlalchemy import Column, String, Integer, Float, JSON, LargeBinary
+from app.database import Base
+
+
+class IdempotencyKey(Base):
+    """Stored outcome of a request sent with an Idempotency-Key header"""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(64), primary_key=True)  # sha256 of method, path and the client's key
+    fingerprint = Column(String(64), nullable=False)  # sha256 of query string and body
+    status_code = Column(Integer, nullable=True)  # None while the first request is still running
+    headers = Column(JSON, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(Float, nullable=False)  # Unix time
+    expires_at = Column(Float, nullable=False, index=True)
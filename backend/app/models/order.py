@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Enum as SQLEnum
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Index, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -17,6 +17,13 @@ class OrderStatus(str, enum.Enum):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Agent order lists: newest first, keyset on id
+        Index("ix_orders_agent_id", "delivery_agent_id", "id"),
+        Index("ix_orders_status", "status"),
+        # Gate-change ingest: active orders on a flight
+        Index("ix_orders_flight_number", "flight_number", "status"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     order_confirmation = Column(String(50), unique=True, index=True, nullable=False)  # User's order number from restaurant
@@ -31,7 +38,18 @@ class Order(Base):
     delivery_otp = Column(String(6), nullable=True)  # 6-digit OTP for delivery verification
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Bumped by every write; ORM flushes and status transitions are conditional on it
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     restaurant = relationship("Restaurant", back_populates="orders")
     delivery_agent = relationship("DeliveryAgent", back_populates="orders")
 
+    __mapper_args__ = {"version_id_col": version}
+
+    @property
+    def restaurant_name(self):
+        return self.restaurant.name if self.restaurant else None
+
+    @property
+    def delivery_agent_name(self):
+        return self.delivery_agent.name if self.delivery_agent else None
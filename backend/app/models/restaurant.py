@@ -1,10 +1,15 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, JSON, Integer as SQLInteger
+from sqlalchemy import Column, String, Integer, ForeignKey, JSON, Index, Integer as SQLInteger
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 
 class Restaurant(Base):
     __tablename__ = "restaurants"
+    __table_args__ = (
+        # Keyset pagination by ID within an airport's terminals, and cuisine filtering
+        Index("ix_restaurants_terminal_id_id", "terminal_id", "id"),
+        Index("ix_restaurants_terminal_cuisine", "terminal_id", "cuisine_type"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     terminal_id = Column(Integer, ForeignKey("terminals.id"), nullable=False)
@@ -1,17 +1,24 @@
 """
 Admin/utility endpoints for database management
 """
-from fastapi import APIRouter, HTTPException
-from app.database import SessionLocal
-from app.models.airport import Airport, Terminal, Gate
-from app.models.restaurant import Restaurant
-from app.models.delivery_agent import DeliveryAgent
-import sys
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
+from app.database import scatter
+from app.models.airport import Airport
+from app.services.agent_load import agent_load
+from app.services.compute import compute
+from app.services.demand import demand
+from app.services.jobs import jobs
+from app.services.live_counts import live_counts
+from app.services.notifications import notifier
+from app.services.idempotency import store as idempotency_store
+from app.services.order_cache import order_cache
+from app.services.scheduler import scheduler
+from app.services.simulation import recorded_demand
+from app.services.tracing import tracer
 import os
 
-# Add parent directory to path to import seed_data
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-
 router = APIRouter()
 
 # Simple secret key check (you can set this in environment variables)
@@ -36,284 +43,28 @@ async def seed_database(secret: str = None):
             detail="Invalid secret key. Use ?secret=seed-me-please"
         )
     
-    db = SessionLocal()
-    
+    # Check the database itself: the counters are per worker and may lag another worker's seed
+    seeded = await run_in_threadpool(scatter, lambda db: db.query(Airport.id).limit(1).first() is not None)
+    if any(seeded):
+        return {"message": "Database already seeded", **live_counts.totals()}
+
     try:
-        # Check if data already exists
-        airports_count = db.query(Airport).count()
-        if airports_count > 0:
-            return {
-                "message": "Database already seeded",
-                "airports": airports_count,
-                "restaurants": db.query(Restaurant).count(),
-                "agents": db.query(DeliveryAgent).count()
-            }
-        
-        # JFK Airport
-        jfk = Airport(
-            code="JFK", name="John F. Kennedy International Airport",
-            city="New York", state="NY", timezone="America/New_York",
-            latitude="40.6413", longitude="-73.7781"
-        )
-        db.add(jfk)
-        db.flush()
-        
-        jfk_terminal1 = Terminal(airport_id=jfk.id, name="Terminal 1", layout_data={"width": 800, "height": 600})
-        db.add(jfk_terminal1)
-        db.flush()
-        
-        jfk_gates = [
-            Gate(terminal_id=jfk_terminal1.id, gate_number="A1", coordinates={"x": 100, "y": 200}),
-            Gate(terminal_id=jfk_terminal1.id, gate_number="A2", coordinates={"x": 150, "y": 200}),
-            Gate(terminal_id=jfk_terminal1.id, gate_number="A3", coordinates={"x": 200, "y": 200}),
-            Gate(terminal_id=jfk_terminal1.id, gate_number="A10", coordinates={"x": 500, "y": 200}),
-            Gate(terminal_id=jfk_terminal1.id, gate_number="A11", coordinates={"x": 550, "y": 200}),
-            Gate(terminal_id=jfk_terminal1.id, gate_number="A12", coordinates={"x": 600, "y": 200}),
-        ]
-        db.add_all(jfk_gates)
-        db.flush()
-        
-        jfk_restaurants = [
-            Restaurant(terminal_id=jfk_terminal1.id, name="Chipotle", cuisine_type="Mexican",
-                      location={"x": 520, "y": 300}, nearby_gates=["A10", "A11", "A12", "A13"],
-                      estimated_prep_time=15, mock_ordering_slug="chipotle", description="Fresh Mexican food"),
-            Restaurant(terminal_id=jfk_terminal1.id, name="McDonald's", cuisine_type="Fast Food",
-                      location={"x": 200, "y": 300}, nearby_gates=["A1", "A2", "A3", "A4"],
-                      estimated_prep_time=10, mock_ordering_slug="mcdonalds", description="Classic fast food"),
-            Restaurant(terminal_id=jfk_terminal1.id, name="Starbucks", cuisine_type="Coffee",
-                      location={"x": 350, "y": 300}, nearby_gates=["A5", "A6", "A7", "A8"],
-                      estimated_prep_time=5, mock_ordering_slug="starbucks", description="Coffee and light snacks"),
-        ]
-        db.add_all(jfk_restaurants)
-        
-        # LAX Airport
-        lax = Airport(code="LAX", name="Los Angeles International Airport", city="Los Angeles", state="CA",
-                      timezone="America/Los_Angeles", latitude="33.9425", longitude="-118.4081")
-        db.add(lax)
-        db.flush()
-        
-        lax_terminal1 = Terminal(airport_id=lax.id, name="Terminal 1", layout_data={"width": 800, "height": 600})
-        db.add(lax_terminal1)
-        db.flush()
-        
-        lax_gates = [
-            Gate(terminal_id=lax_terminal1.id, gate_number="B1", coordinates={"x": 100, "y": 200}),
-            Gate(terminal_id=lax_terminal1.id, gate_number="B2", coordinates={"x": 150, "y": 200}),
-            Gate(terminal_id=lax_terminal1.id, gate_number="B10", coordinates={"x": 500, "y": 200}),
-            Gate(terminal_id=lax_terminal1.id, gate_number="B11", coordinates={"x": 550, "y": 200}),
-        ]
-        db.add_all(lax_gates)
-        db.flush()
-        
-        lax_restaurants = [
-            Restaurant(terminal_id=lax_terminal1.id, name="Chipotle", cuisine_type="Mexican",
-                      location={"x": 520, "y": 300}, nearby_gates=["B10", "B11", "B12"],
-                      estimated_prep_time=15, mock_ordering_slug="chipotle", description="Fresh Mexican food"),
-            Restaurant(terminal_id=lax_terminal1.id, name="Subway", cuisine_type="Sandwiches",
-                      location={"x": 200, "y": 300}, nearby_gates=["B1", "B2", "B3"],
-                      estimated_prep_time=8, mock_ordering_slug="subway", description="Fresh sandwiches"),
-        ]
-        db.add_all(lax_restaurants)
-        
-        # ATL Airport
-        atl = Airport(code="ATL", name="Hartsfield-Jackson Atlanta International Airport", city="Atlanta", state="GA",
-                      timezone="America/New_York", latitude="33.6407", longitude="-84.4277")
-        db.add(atl)
-        db.flush()
-        
-        atl_terminal1 = Terminal(airport_id=atl.id, name="Terminal S", layout_data={"width": 800, "height": 600})
-        db.add(atl_terminal1)
-        db.flush()
-        
-        atl_gates = [
-            Gate(terminal_id=atl_terminal1.id, gate_number="S1", coordinates={"x": 100, "y": 200}),
-            Gate(terminal_id=atl_terminal1.id, gate_number="S2", coordinates={"x": 150, "y": 200}),
-            Gate(terminal_id=atl_terminal1.id, gate_number="S10", coordinates={"x": 500, "y": 200}),
-            Gate(terminal_id=atl_terminal1.id, gate_number="S11", coordinates={"x": 550, "y": 200}),
-        ]
-        db.add_all(atl_gates)
-        db.flush()
-        
-        atl_restaurants = [
-            Restaurant(terminal_id=atl_terminal1.id, name="Chipotle", cuisine_type="Mexican",
-                      location={"x": 520, "y": 300}, nearby_gates=["S10", "S11", "S12"],
-                      estimated_prep_time=15, mock_ordering_slug="chipotle", description="Fresh Mexican food"),
-            Restaurant(terminal_id=atl_terminal1.id, name="McDonald's", cuisine_type="Fast Food",
-                      location={"x": 200, "y": 300}, nearby_gates=["S1", "S2", "S3"],
-                      estimated_prep_time=10, mock_ordering_slug="mcdonalds", description="Classic fast food"),
-        ]
-        db.add_all(atl_restaurants)
-        
-        # ORD Airport
-        ord = Airport(code="ORD", name="Chicago O'Hare International Airport", city="Chicago", state="IL",
-                      timezone="America/Chicago", latitude="41.9786", longitude="-87.9048")
-        db.add(ord)
-        db.flush()
-        
-        ord_terminal1 = Terminal(airport_id=ord.id, name="Terminal 1", layout_data={"width": 800, "height": 600})
-        db.add(ord_terminal1)
-        db.flush()
-        
-        ord_gates = [
-            Gate(terminal_id=ord_terminal1.id, gate_number="C1", coordinates={"x": 100, "y": 200}),
-            Gate(terminal_id=ord_terminal1.id, gate_number="C2", coordinates={"x": 150, "y": 200}),
-            Gate(terminal_id=ord_terminal1.id, gate_number="C10", coordinates={"x": 500, "y": 200}),
-            Gate(terminal_id=ord_terminal1.id, gate_number="C11", coordinates={"x": 550, "y": 200}),
-        ]
-        db.add_all(ord_gates)
-        db.flush()
-        
-        ord_restaurants = [
-            Restaurant(terminal_id=ord_terminal1.id, name="Starbucks", cuisine_type="Coffee",
-                      location={"x": 350, "y": 300}, nearby_gates=["C5", "C6", "C7"],
-                      estimated_prep_time=5, mock_ordering_slug="starbucks", description="Coffee and light snacks"),
-            Restaurant(terminal_id=ord_terminal1.id, name="Subway", cuisine_type="Sandwiches",
-                      location={"x": 200, "y": 300}, nearby_gates=["C1", "C2", "C3"],
-                      estimated_prep_time=8, mock_ordering_slug="subway", description="Fresh sandwiches"),
-        ]
-        db.add_all(ord_restaurants)
-        
-        # DFW Airport
-        dfw = Airport(code="DFW", name="Dallas/Fort Worth International Airport", city="Dallas", state="TX",
-                      timezone="America/Chicago", latitude="32.8998", longitude="-97.0403")
-        db.add(dfw)
-        db.flush()
-        
-        dfw_terminal1 = Terminal(airport_id=dfw.id, name="Terminal A", layout_data={"width": 800, "height": 600})
-        db.add(dfw_terminal1)
-        db.flush()
-        
-        dfw_gates = [
-            Gate(terminal_id=dfw_terminal1.id, gate_number="A1", coordinates={"x": 100, "y": 200}),
-            Gate(terminal_id=dfw_terminal1.id, gate_number="A2", coordinates={"x": 150, "y": 200}),
-            Gate(terminal_id=dfw_terminal1.id, gate_number="A10", coordinates={"x": 500, "y": 200}),
-            Gate(terminal_id=dfw_terminal1.id, gate_number="A11", coordinates={"x": 550, "y": 200}),
-        ]
-        db.add_all(dfw_gates)
-        db.flush()
-        
-        dfw_restaurants = [
-            Restaurant(terminal_id=dfw_terminal1.id, name="Chipotle", cuisine_type="Mexican",
-                      location={"x": 520, "y": 300}, nearby_gates=["A10", "A11", "A12"],
-                      estimated_prep_time=15, mock_ordering_slug="chipotle", description="Fresh Mexican food"),
-            Restaurant(terminal_id=dfw_terminal1.id, name="McDonald's", cuisine_type="Fast Food",
-                      location={"x": 200, "y": 300}, nearby_gates=["A1", "A2", "A3"],
-                      estimated_prep_time=10, mock_ordering_slug="mcdonalds", description="Classic fast food"),
-        ]
-        db.add_all(dfw_restaurants)
-        
-        # SFO Airport
-        sfo = Airport(code="SFO", name="San Francisco International Airport", city="San Francisco", state="CA",
-                      timezone="America/Los_Angeles", latitude="37.6213", longitude="-122.3790")
-        db.add(sfo)
-        db.flush()
-        
-        sfo_terminal1 = Terminal(airport_id=sfo.id, name="Terminal 1", layout_data={"width": 800, "height": 600})
-        db.add(sfo_terminal1)
-        db.flush()
-        
-        sfo_gates = [
-            Gate(terminal_id=sfo_terminal1.id, gate_number="B1", coordinates={"x": 100, "y": 200}),
-            Gate(terminal_id=sfo_terminal1.id, gate_number="B2", coordinates={"x": 150, "y": 200}),
-            Gate(terminal_id=sfo_terminal1.id, gate_number="B10", coordinates={"x": 500, "y": 200}),
-            Gate(terminal_id=sfo_terminal1.id, gate_number="B11", coordinates={"x": 550, "y": 200}),
-        ]
-        db.add_all(sfo_gates)
-        db.flush()
-        
-        sfo_restaurants = [
-            Restaurant(terminal_id=sfo_terminal1.id, name="Starbucks", cuisine_type="Coffee",
-                      location={"x": 350, "y": 300}, nearby_gates=["B5", "B6", "B7"],
-                      estimated_prep_time=5, mock_ordering_slug="starbucks", description="Coffee and light snacks"),
-            Restaurant(terminal_id=sfo_terminal1.id, name="Subway", cuisine_type="Sandwiches",
-                      location={"x": 200, "y": 300}, nearby_gates=["B1", "B2", "B3"],
-                      estimated_prep_time=8, mock_ordering_slug="subway", description="Fresh sandwiches"),
-        ]
-        db.add_all(sfo_restaurants)
-        
-        # MIA Airport
-        mia = Airport(code="MIA", name="Miami International Airport", city="Miami", state="FL",
-                      timezone="America/New_York", latitude="25.7959", longitude="-80.2870")
-        db.add(mia)
-        db.flush()
-        
-        mia_terminal1 = Terminal(airport_id=mia.id, name="Concourse D", layout_data={"width": 800, "height": 600})
-        db.add(mia_terminal1)
-        db.flush()
-        
-        mia_gates = [
-            Gate(terminal_id=mia_terminal1.id, gate_number="D1", coordinates={"x": 100, "y": 200}),
-            Gate(terminal_id=mia_terminal1.id, gate_number="D2", coordinates={"x": 150, "y": 200}),
-            Gate(terminal_id=mia_terminal1.id, gate_number="D10", coordinates={"x": 500, "y": 200}),
-            Gate(terminal_id=mia_terminal1.id, gate_number="D11", coordinates={"x": 550, "y": 200}),
-        ]
-        db.add_all(mia_gates)
-        db.flush()
-        
-        mia_restaurants = [
-            Restaurant(terminal_id=mia_terminal1.id, name="Chipotle", cuisine_type="Mexican",
-                      location={"x": 520, "y": 300}, nearby_gates=["D10", "D11", "D12"],
-                      estimated_prep_time=15, mock_ordering_slug="chipotle", description="Fresh Mexican food"),
-            Restaurant(terminal_id=mia_terminal1.id, name="McDonald's", cuisine_type="Fast Food",
-                      location={"x": 200, "y": 300}, nearby_gates=["D1", "D2", "D3"],
-                      estimated_prep_time=10, mock_ordering_slug="mcdonalds", description="Classic fast food"),
-        ]
-        db.add_all(mia_restaurants)
-        
-        # DEN Airport
-        den = Airport(code="DEN", name="Denver International Airport", city="Denver", state="CO",
-                      timezone="America/Denver", latitude="39.8561", longitude="-104.6737")
-        db.add(den)
-        db.flush()
-        
-        den_terminal1 = Terminal(airport_id=den.id, name="Concourse A", layout_data={"width": 800, "height": 600})
-        db.add(den_terminal1)
-        db.flush()
-        
-        den_gates = [
-            Gate(terminal_id=den_terminal1.id, gate_number="A1", coordinates={"x": 100, "y": 200}),
-            Gate(terminal_id=den_terminal1.id, gate_number="A2", coordinates={"x": 150, "y": 200}),
-            Gate(terminal_id=den_terminal1.id, gate_number="A10", coordinates={"x": 500, "y": 200}),
-            Gate(terminal_id=den_terminal1.id, gate_number="A11", coordinates={"x": 550, "y": 200}),
-        ]
-        db.add_all(den_gates)
-        db.flush()
-        
-        den_restaurants = [
-            Restaurant(terminal_id=den_terminal1.id, name="Starbucks", cuisine_type="Coffee",
-                      location={"x": 350, "y": 300}, nearby_gates=["A5", "A6", "A7"],
-                      estimated_prep_time=5, mock_ordering_slug="starbucks", description="Coffee and light snacks"),
-            Restaurant(terminal_id=den_terminal1.id, name="Subway", cuisine_type="Sandwiches",
-                      location={"x": 200, "y": 300}, nearby_gates=["A1", "A2", "A3"],
-                      estimated_prep_time=8, mock_ordering_slug="subway", description="Fresh sandwiches"),
-        ]
-        db.add_all(den_restaurants)
-        
-        # Create Delivery Agent
-        agent = DeliveryAgent(
-            name="Delivery Agent 1",
-            agent_code="AGENT001",
-            status="available",
-            contact="agent1@airportdelivery.com"
-        )
-        db.add(agent)
-        
-        db.commit()
-        
-        return {
-            "message": "Database seeded successfully!",
-            "airports": 8,
-            "terminals": 8,
-            "gates": 40,
-            "restaurants": 20,
-            "agents": 1
-        }
-        
+        # Imported here: only needed on this rarely-called endpoint, not at worker boot
+        from app.services.seeding import seed_shards
+        counts = seed_shards()
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=f"Error seeding database: {str(e)}")
-    finally:
-        db.close()
+    # Seeding writes with bulk statements the counters don't see
+    live_counts.reconcile_all()
+
+    return {
+        "message": "Database seeded successfully!",
+        "airports": counts["airports"],
+        "terminals": counts["terminals"],
+        "gates": counts["gates"],
+        "restaurants": counts["restaurants"],
+        "agents": counts["agents"]
+    }
 
 
 @router.get("/seed-status")
@@ -322,18 +73,80 @@ async def check_seed_status():
     Check if database has been seeded.
     Visit: https://your-api.onrender.com/api/admin/seed-status
     """
-    db = SessionLocal()
-    try:
-        airports_count = db.query(Airport).count()
-        restaurants_count = db.query(Restaurant).count()
-        agents_count = db.query(DeliveryAgent).count()
-        
-        return {
-            "seeded": airports_count > 0,
-            "airports": airports_count,
-            "restaurants": restaurants_count,
-            "agents": agents_count
-        }
-    finally:
-        db.close()
+    counts = live_counts.totals()
+    return {"seeded": counts["airports"] > 0, **counts}
+
+
+@router.get("/stats")
+async def live_stats():
+    """
+    Airports, restaurants, agents per status and orders per airport and status,
+    from this worker's live counters (no table scans)
+    """
+    return live_counts.snapshot()
+
+
+@router.get("/dispatch-queue")
+async def dispatch_queue():
+    """
+    Orders waiting for an agent, in the order they will be dispatched
+    (least slack before their flight's delivery deadline first).
+    """
+    return scheduler.snapshot()
+
+
+@router.get("/order-cache")
+async def order_cache_stats():
+    """Hit/miss counters and size of this worker's order response cache"""
+    return order_cache.stats()
+
+
+@router.get("/idempotency")
+async def idempotency_stats():
+    """Stored responses and replay counts for Idempotency-Key requests on this worker"""
+    return idempotency_store.stats()
+
+
+@router.get("/jobs")
+async def job_stats():
+    """Background job queue depth, outcomes and latency on this worker"""
+    return jobs.stats()
+
+
+@router.get("/compute")
+async def compute_stats():
+    """Process pool for CPU-heavy tasks: calls, timeouts and latency per task, shared memory in use"""
+    return compute.stats()
+
+
+@router.get("/tracing")
+async def tracing_stats():
+    """Trace sampling and span export on this worker (spans recorded, dropped, exported)"""
+    return tracer.stats()
+
+
+@router.get("/notifications")
+async def notification_stats():
+    """Customer notifications received, coalesced and sent per provider on this worker"""
+    return notifier.stats()
+
+
+@router.get("/agent-load")
+async def agent_load_stats():
+    """Active orders per agent tracked in memory, and how often they were re-read, on this worker"""
+    return agent_load.stats()
+
+
+@router.get("/demand")
+async def demand_stats():
+    """Restaurants, gates and orders in the in-memory demand history on this worker"""
+    return demand.stats()
+
 
+@router.get("/recorded-demand")
+async def export_recorded_demand(hours: float = Query(24, gt=0, le=24 * 14, description="How far back to export")):
+    """Recent orders as simulation demand, for python simulate.py --demand"""
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    shards = await run_in_threadpool(scatter, lambda db: recorded_demand(db, since), readonly=True)
+    demand = [spec for shard_demand in shards for spec in shard_demand]
+    return sorted(demand, key=lambda spec: spec["minute"])
@@ -1,13 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import func, not_
+from sqlalchemy.orm import Session, joinedload
+from starlette.concurrency import run_in_threadpool
+from typing import Callable, List, Optional, Tuple
+from datetime import datetime
 from pydantic import BaseModel
-from app.database import get_db
+from app.database import get_routed_db
 from app.models.order import Order, OrderStatus
 from app.models.delivery_agent import DeliveryAgent
-from app.models.restaurant import Restaurant
+from app.schemas.delivery_agent import AgentShiftUpdate
 from app.schemas.order import OrderResponse
-from app.services.otp_service import generate_otp, verify_otp
+from app.services.agent_load import agent_load
+from app.services.dispatch import as_utc
+from app.services.jobs import jobs
+from app.services.notifications import notify_order
+from app.services.order_cache import refresh_order
+from app.services.order_service import load_order, load_orders
+from app.services.order_state import transition
+from app.services.otp_service import generate_otp
+from app.services.scheduler import scheduler
+from app.services.pagination import (
+    NEXT_CURSOR_HEADER, after_cursor, cursor_param, decode_cursor, limit_param, split_page
+)
+from app.services.serialization import order_payload, order_list_payload, json_response
+from app.services.trips import current_trip, plan_trip
 from app.routers.websocket import broadcast_order_update
 
 router = APIRouter()
@@ -17,110 +33,118 @@ class DeliverRequest(BaseModel):
     otp: str
 
 
+class TripPickupRequest(BaseModel):
+    order_ids: Optional[List[int]] = None  # default: every order on the trip still to collect
+
+
+class TripDelivery(BaseModel):
+    order_id: int
+    otp: str
+
+
+class TripDeliverRequest(BaseModel):
+    deliveries: List[TripDelivery]
+
+
 @router.get("/{agent_id}/orders", response_model=List[OrderResponse])
-async def get_agent_orders(agent_id: int, db: Session = Depends(get_db)):
-    """Get all orders assigned to a delivery agent"""
+async def get_agent_orders(
+    agent_id: int,
+    status: Optional[List[OrderStatus]] = Query(None, description="Only these statuses (default: all active)"),
+    created_after: Optional[datetime] = Query(None, description="Only orders created at or after this time"),
+    created_before: Optional[datetime] = Query(None, description="Only orders created before this time"),
+    limit: int = limit_param(),
+    cursor: Optional[str] = cursor_param(),
+    db: Session = Depends(get_routed_db)
+):
+    """
+    Get orders assigned to a delivery agent, newest first.
+    When more orders exist, the next page's cursor is returned in the X-Next-Cursor header.
+    """
     agent = db.query(DeliveryAgent).filter(DeliveryAgent.id == agent_id).first()
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
-    # Get all orders assigned to this agent (excluding delivered and cancelled)
-    from sqlalchemy import not_
-    orders = db.query(Order).filter(
-        Order.delivery_agent_id == agent_id
-    ).filter(
-        not_(Order.status.in_([
+    query = db.query(Order).options(
+        joinedload(Order.restaurant),
+        joinedload(Order.delivery_agent)
+    ).filter(Order.delivery_agent_id == agent_id)
+    
+    if status:
+        query = query.filter(Order.status.in_(status))
+    else:
+        # Default: all orders excluding delivered and cancelled
+        query = query.filter(not_(Order.status.in_([
             OrderStatus.DELIVERED,
             OrderStatus.CANCELLED
-        ]))
-    ).order_by(Order.created_at.desc()).all()
+        ])))
+    if created_after:
+        query = query.filter(Order.created_at >= created_after)
+    if created_before:
+        query = query.filter(Order.created_at < created_before)
     
-    result = []
-    for order in orders:
-        restaurant = db.query(Restaurant).filter(Restaurant.id == order.restaurant_id).first()
-        response = OrderResponse.model_validate(order)
-        if restaurant:
-            response.restaurant_name = restaurant.name
-        if order.delivery_agent:
-            response.delivery_agent_name = order.delivery_agent.name
-        result.append(response)
+    # IDs increase with creation time, so id descending is newest first
+    # and pages straight off ix_orders_agent_id
+    if cursor:
+        query = query.filter(after_cursor([Order.id], decode_cursor(cursor, 1), descending=True))
+    orders = query.order_by(Order.id.desc()).limit(limit + 1).all()
+    orders, next_cursor = split_page(orders, limit, key=lambda o: (o.id,))
     
-    return result
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return json_response(order_list_payload(orders), headers=headers)
 
 
 @router.put("/orders/{order_id}/pickup")
 async def mark_picked_up(
     order_id: int, 
     agent_id: int = Query(..., description="Agent ID"),
-    db: Session = Depends(get_db)
+    version: Optional[int] = Query(None, description="Expected order version (409 if it has changed)"),
+    db: Session = Depends(get_routed_db)
 ):
     """Mark order as picked up and generate OTP"""
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    if order.delivery_agent_id != agent_id:
-        raise HTTPException(status_code=403, detail="Order not assigned to this agent")
-    
-    # Generate OTP when order is picked up
-    if not order.delivery_otp:
-        order.delivery_otp = generate_otp()
-    
-    order.status = OrderStatus.PICKED_UP
-    db.commit()
-    db.refresh(order)
+    # Generate OTP when order is picked up (kept if one was already issued)
+    transition(
+        db, order_id, OrderStatus.PICKED_UP, agent_id=agent_id, expected_version=version,
+        delivery_otp=func.coalesce(Order.delivery_otp, generate_otp())
+    )
+    order = load_order(db, Order.id == order_id)
     
-    restaurant = db.query(Restaurant).filter(Restaurant.id == order.restaurant_id).first()
-    response = OrderResponse.model_validate(order)
-    if restaurant:
-        response.restaurant_name = restaurant.name
-    if order.delivery_agent:
-        response.delivery_agent_name = order.delivery_agent.name
+    payload = order_payload(order)
+    refresh_order(order, payload)
     
     # Broadcast update to all connected clients (customer tracking page)
-    order_dict = response.model_dump(mode='json')
-    await broadcast_order_update(order_id, "picked_up", order_dict)
+    jobs.enqueue(broadcast_order_update, order_id, "picked_up", payload, key=order_id)
+    # The customer gets the OTP to hand over at the gate
+    notify_order(payload, "picked_up", otp=order.delivery_otp)
     
-    return {
+    return json_response({
         "message": "Order marked as picked up",
-        "order": response,
+        "order": payload,
         "otp": order.delivery_otp  # Return OTP for agent to share
-    }
+    })
 
 
 @router.put("/orders/{order_id}/transit")
 async def mark_in_transit(
     order_id: int, 
     agent_id: int = Query(..., description="Agent ID"),
-    db: Session = Depends(get_db)
+    version: Optional[int] = Query(None, description="Expected order version (409 if it has changed)"),
+    db: Session = Depends(get_routed_db)
 ):
     """Mark order as in transit"""
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
+    transition(db, order_id, OrderStatus.IN_TRANSIT, agent_id=agent_id, expected_version=version)
+    order = load_order(db, Order.id == order_id)
     
-    if order.delivery_agent_id != agent_id:
-        raise HTTPException(status_code=403, detail="Order not assigned to this agent")
-    
-    order.status = OrderStatus.IN_TRANSIT
-    db.commit()
-    db.refresh(order)
-    
-    restaurant = db.query(Restaurant).filter(Restaurant.id == order.restaurant_id).first()
-    response = OrderResponse.model_validate(order)
-    if restaurant:
-        response.restaurant_name = restaurant.name
-    if order.delivery_agent:
-        response.delivery_agent_name = order.delivery_agent.name
+    payload = order_payload(order)
+    refresh_order(order, payload)
     
     # Broadcast update to all connected clients (customer tracking page)
-    order_dict = response.model_dump(mode='json')
-    await broadcast_order_update(order_id, "in_transit", order_dict)
+    jobs.enqueue(broadcast_order_update, order_id, "in_transit", payload, key=order_id)
+    notify_order(payload, "in_transit")
     
-    return {
+    return json_response({
         "message": "Order marked as in transit",
-        "order": response
-    }
+        "order": payload
+    })
 
 
 @router.post("/orders/{order_id}/deliver")
@@ -128,55 +152,171 @@ async def mark_delivered(
     order_id: int,
     agent_id: int = Query(..., description="Agent ID"),
     request: DeliverRequest = Body(...),
-    db: Session = Depends(get_db)
+    version: Optional[int] = Query(None, description="Expected order version (409 if it has changed)"),
+    db: Session = Depends(get_routed_db)
 ):
     """Mark order as delivered after OTP verification"""
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
+    # The OTP is checked in the UPDATE itself; a miss is explained afterwards
+    transition(db, order_id, OrderStatus.DELIVERED, agent_id=agent_id, otp=request.otp, expected_version=version)
+    order = load_order(db, Order.id == order_id)
     
-    if order.delivery_agent_id != agent_id:
-        raise HTTPException(status_code=403, detail="Order not assigned to this agent")
-    
-    if not order.delivery_otp:
-        raise HTTPException(status_code=400, detail="OTP not generated for this order")
-    
-    if not verify_otp(request.otp, order.delivery_otp):
-        raise HTTPException(status_code=400, detail="Invalid OTP")
-    
-    order.status = OrderStatus.DELIVERED
-    db.commit()
-    db.refresh(order)
-    
-    restaurant = db.query(Restaurant).filter(Restaurant.id == order.restaurant_id).first()
-    response = OrderResponse.model_validate(order)
-    if restaurant:
-        response.restaurant_name = restaurant.name
-    if order.delivery_agent:
-        response.delivery_agent_name = order.delivery_agent.name
+    payload = order_payload(order)
+    refresh_order(order, payload)
     
     # Broadcast update to all connected clients (customer tracking page)
-    order_dict = response.model_dump(mode='json')
-    await broadcast_order_update(order_id, "delivered", order_dict)
+    jobs.enqueue(broadcast_order_update, order_id, "delivered", payload, key=order_id)
+    notify_order(payload, "delivered")
     
-    return {
+    return json_response({
         "message": "Order delivered successfully",
-        "order": response
-    }
+        "order": payload
+    })
+
+
+def get_agent_or_404(db: Session, agent_id: int) -> DeliveryAgent:
+    agent = db.query(DeliveryAgent).filter(DeliveryAgent.id == agent_id).first()
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return agent
+
+
+def transition_each(
+    db: Session, agent_id: int, target: OrderStatus, order_ids: List[int], arguments: Callable[[int], dict]
+) -> Tuple[List[int], List[dict]]:
+    """
+    transition() each order on its own, for the bulk trip calls; arguments(order_id)
+    gives its other keyword arguments (OTP, values). Returns the IDs moved and a
+    {"order_id", "detail"} per order that wasn't, as explain_miss() put it.
+    """
+    moved, failed = [], []
+    for order_id in dict.fromkeys(order_ids):
+        try:
+            transition(db, order_id, target, agent_id=agent_id, **arguments(order_id))
+            moved.append(order_id)
+        except HTTPException as miss:
+            failed.append({"order_id": order_id, "detail": miss.detail})
+    return moved, failed
+
+
+@router.get("/{agent_id}/trip")
+async def get_agent_trip(agent_id: int, db: Session = Depends(get_routed_db)):
+    """
+    The agent's current trip: up to TRIP_MAX_ORDERS orders in one airport, with
+    pickup and drop-off stops in the planned order and an ETA for each
+    """
+    agent = get_agent_or_404(db, agent_id)
+    return json_response(await run_in_threadpool(plan_trip, db, agent))
+
+
+@router.put("/{agent_id}/trip/pickup")
+async def pick_up_trip(
+    agent_id: int,
+    request: Optional[TripPickupRequest] = Body(None),
+    db: Session = Depends(get_routed_db)
+):
+    """
+    Mark several orders as picked up at once and generate their OTPs. Each
+    order moves on its own; those that can't are reported under "failed".
+    """
+    get_agent_or_404(db, agent_id)
+    if request and request.order_ids:
+        order_ids = request.order_ids
+    else:
+        _, trip, _ = current_trip(db, agent_id)
+        order_ids = [o.id for o in trip if o.status == OrderStatus.AGENT_ASSIGNED]
+
+    # A fresh OTP per order, kept if one was already issued
+    moved, failed = transition_each(
+        db, agent_id, OrderStatus.PICKED_UP, order_ids,
+        lambda _: {"delivery_otp": func.coalesce(Order.delivery_otp, generate_otp())}
+    )
+
+    picked_up = []
+    for order in load_orders(db, Order.id.in_(moved)):
+        payload = order_payload(order)
+        refresh_order(order, payload)
+        jobs.enqueue(broadcast_order_update, order.id, "picked_up", payload, key=order.id)
+        notify_order(payload, "picked_up", otp=order.delivery_otp)
+        picked_up.append({"order": payload, "otp": order.delivery_otp})
+
+    return json_response({
+        "message": f"{len(picked_up)} orders marked as picked up",
+        "orders": picked_up,
+        "failed": failed
+    })
+
+
+@router.post("/{agent_id}/trip/deliver")
+async def deliver_trip(
+    agent_id: int,
+    request: TripDeliverRequest = Body(...),
+    db: Session = Depends(get_routed_db)
+):
+    """
+    Deliver several orders at once, each with its own OTP. Each order moves on
+    its own; those that can't (wrong OTP, not this agent's, ...) are reported
+    under "failed", the rest are delivered.
+    """
+    get_agent_or_404(db, agent_id)
+    otps = {d.order_id: d.otp for d in request.deliveries}
+    delivered, failed = transition_each(
+        db, agent_id, OrderStatus.DELIVERED, list(otps), lambda order_id: {"otp": otps[order_id]}
+    )
+
+    payloads = []
+    for order in load_orders(db, Order.id.in_(delivered)):
+        payload = order_payload(order)
+        refresh_order(order, payload)
+        jobs.enqueue(broadcast_order_update, order.id, "delivered", payload, key=order.id)
+        notify_order(payload, "delivered")
+        payloads.append(payload)
+
+    return json_response({
+        "message": f"{len(payloads)} orders delivered",
+        "orders": payloads,
+        "failed": failed
+    })
 
 
 @router.get("/{agent_id}")
-async def get_agent(agent_id: int, db: Session = Depends(get_db)):
+async def get_agent(agent_id: int, db: Session = Depends(get_routed_db)):
     """Get agent details"""
     agent = db.query(DeliveryAgent).filter(DeliveryAgent.id == agent_id).first()
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
+    return agent_details(db, agent)
+
+
+@router.put("/{agent_id}/shift")
+async def update_agent_shift(agent_id: int, update: AgentShiftUpdate, db: Session = Depends(get_routed_db)):
+    """Set an agent's capacity, shift window or status; waiting orders are re-dispatched"""
+    agent = get_agent_or_404(db, agent_id)
+    changes = update.model_dump(exclude_unset=True)
+    if "capacity" in changes and changes["capacity"] is None:
+        raise HTTPException(status_code=400, detail="Capacity cannot be null")
+    shift_start = as_utc(changes.get("shift_start", agent.shift_start))
+    shift_end = as_utc(changes.get("shift_end", agent.shift_end))
+    if shift_start and shift_end and shift_end <= shift_start:
+        raise HTTPException(status_code=400, detail="Shift must end after it starts")
+    for field, value in changes.items():
+        setattr(agent, field, value)
+    db.commit()
+    scheduler.wake()
+    return agent_details(db, agent)
+
+
+def agent_details(db: Session, agent: DeliveryAgent) -> dict:
     return {
         "id": agent.id,
         "name": agent.name,
         "agent_code": agent.agent_code,
         "status": agent.status,
-        "current_location": agent.current_location
+        "airport_id": agent.airport_id,
+        "current_location": agent.current_location,
+        "capacity": agent.capacity,
+        "shift_start": agent.shift_start,
+        "shift_end": agent.shift_end,
+        "active_orders": agent_load.load(db, agent.id)
     }
 
@@ -1,27 +1,184 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
-from app.models.airport import Airport
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session, load_only, selectinload
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, List, Optional
+from app.database import get_routed_db, scatter
+from app.models.airport import Airport, Terminal, Gate
+from app.models.restaurant import Restaurant
 from app.schemas.airport import AirportResponse
+from app.services.pagination import (
+    NEXT_CURSOR_HEADER, after_cursor, cursor_param, decode_cursor, limit_param, split_page
+)
+from app.services.projection import (
+    AIRPORT_COLUMNS, TERMINAL_COLUMNS, GATE_COLUMNS,
+    columns, depth_param, fields_param, parse_fields, project
+)
+from app.services.demand import DEMAND_BUCKET_MINUTES, demand, staging_plan
+from app.services.distance import calculate_walking_time
+from app.services.routing import gate_node, restaurant_node
+from app.services.transit import prepare_airport_transit
+from app.services.serialization import json_response
 
 router = APIRouter()
 
+# depth: 0 = airport only, 1 = with terminals, 2 = with terminals and gates
+FULL_DEPTH = 2
+AIRPORT_LEVELS = {"": AIRPORT_COLUMNS, "terminals": TERMINAL_COLUMNS, "gates": GATE_COLUMNS}
+
+
+def airport_load_options(selection: Dict[str, List[str]], depth: int) -> list:
+    """Load only the selected columns, and only the relationships within depth"""
+    options = [load_only(*columns(Airport, selection[""]))]
+    if depth >= 1:
+        terminals = selectinload(Airport.terminals).load_only(*columns(Terminal, selection["terminals"]))
+        if depth >= 2:
+            terminals = terminals.selectinload(Terminal.gates).load_only(*columns(Gate, selection["gates"]))
+        options.append(terminals)
+    return options
+
+
+def airport_payload(airport: Airport, selection: Dict[str, List[str]], depth: int) -> dict:
+    data = project(airport, selection[""])
+    if depth >= 1:
+        data["terminals"] = []
+        for terminal in airport.terminals:
+            terminal_data = project(terminal, selection["terminals"])
+            if depth >= 2:
+                terminal_data["gates"] = [project(gate, selection["gates"]) for gate in terminal.gates]
+            data["terminals"].append(terminal_data)
+    return data
+
 
 @router.get("/", response_model=List[AirportResponse])
-async def get_airports(db: Session = Depends(get_db)):
-    """Get all available airports"""
-    airports = db.query(Airport).all()
-    return airports
+async def get_airports(
+    limit: Optional[int] = limit_param(None),
+    cursor: Optional[str] = cursor_param(),
+    state: Optional[str] = Query(None, description="Filter by state, e.g. CA"),
+    fields: Optional[str] = fields_param(),
+    depth: int = depth_param(FULL_DEPTH, FULL_DEPTH)
+):
+    """
+    Get available airports, ordered by IATA code.
+    Use ?fields=code,name,city&depth=0 for list views that don't need terminals or gates.
+    Every airport is returned unless a limit is given; then, when more exist,
+    the next page's cursor is returned in the X-Next-Cursor header.
+    """
+    selection = parse_fields(fields, AIRPORT_LEVELS)
+    after = decode_cursor(cursor, 1) if cursor else None
+
+    def page(db: Session) -> list:
+        query = db.query(Airport).options(*airport_load_options(selection, depth))
+        if state:
+            query = query.filter(Airport.state == state.upper())
+        if after:
+            query = query.filter(after_cursor([Airport.code], after))
+        query = query.order_by(Airport.code)
+        airports = query.all() if limit is None else query.limit(limit + 1).all()
+        return [(a.code, airport_payload(a, selection, depth)) for a in airports]
+
+    # Each shard's airports after the cursor (its first limit + 1, if paged), merged by code
+    shards = await run_in_threadpool(scatter, page, readonly=True)
+    airports = sorted((item for items in shards for item in items), key=lambda item: item[0])
+    if limit is None:
+        next_cursor = None
+    else:
+        airports, next_cursor = split_page(airports[:limit + 1], limit, key=lambda item: (item[0],))
+
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return json_response([payload for _, payload in airports], headers=headers)
 
 
 @router.get("/{airport_code}", response_model=AirportResponse)
-async def get_airport(airport_code: str, db: Session = Depends(get_db)):
+async def get_airport(
+    airport_code: str,
+    fields: Optional[str] = fields_param(),
+    depth: int = depth_param(FULL_DEPTH, FULL_DEPTH),
+    db: Session = Depends(get_routed_db)
+):
     """Get airport details by code (e.g., JFK, LAX)"""
-    airport = db.query(Airport).filter(Airport.code == airport_code.upper()).first()
+    selection = parse_fields(fields, AIRPORT_LEVELS)
+    airport = db.query(Airport).options(
+        *airport_load_options(selection, depth)
+    ).filter(Airport.code == airport_code.upper()).first()
     if not airport:
         raise HTTPException(status_code=404, detail="Airport not found")
-    return airport
+    return json_response(airport_payload(airport, selection, depth))
+
+
+@router.get("/{airport_code}/route")
+async def get_walking_route(
+    airport_code: str,
+    from_gate: str = Query(..., description="Starting gate, e.g. A1"),
+    to_gate: Optional[str] = Query(None, description="Destination gate"),
+    restaurant_id: Optional[int] = Query(None, description="Destination restaurant"),
+    db: Session = Depends(get_routed_db)
+):
+    """Shortest walkway route, across terminals via transfers if needed, for map display and ETAs"""
+    if (to_gate is None) == (restaurant_id is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of to_gate or restaurant_id")
+
+    gate = db.query(Gate).join(Terminal).join(Airport).filter(
+        Airport.code == airport_code.upper(),
+        Gate.gate_number == from_gate.upper()
+    ).first()
+    if not gate:
+        raise HTTPException(status_code=404, detail="Gate not found")
+
+    if restaurant_id is not None:
+        terminal_id = db.query(Restaurant.terminal_id).filter(Restaurant.id == restaurant_id).scalar()
+        target = restaurant_node(restaurant_id)
+    else:
+        terminal_id = db.query(Gate.terminal_id).join(Terminal).join(Airport).filter(
+            Airport.code == airport_code.upper(),
+            Gate.gate_number == to_gate.upper()
+        ).scalar()
+        target = gate_node(to_gate)
+    if terminal_id is None:
+        raise HTTPException(status_code=404, detail="Destination not found")
+
+    transit = await prepare_airport_transit(db, gate.terminal.airport_id)
+    distance, path = transit.shortest_path((gate.terminal_id, gate_node(gate.gate_number)), (terminal_id, target))
+    if not path:
+        raise HTTPException(status_code=404, detail="No walkway route between these points")
+
+    return {
+        "distance": round(distance, 2),
+        "walking_time": calculate_walking_time(distance),
+        "path": [
+            {"terminal_id": tid, "node": key, "x": x, "y": y}
+            for (tid, key), (x, y) in ((node, transit.point(node)) for node in path)
+        ]
+    }
+
+
+def airport_id_or_404(db: Session, airport_code: str) -> int:
+    airport_id = db.query(Airport.id).filter(Airport.code == airport_code.upper()).scalar()
+    if airport_id is None:
+        raise HTTPException(status_code=404, detail="Airport not found")
+    return airport_id
+
+
+def horizon_param():
+    return Query(60, ge=DEMAND_BUCKET_MINUTES, le=24 * 60, description="Forecast horizon in minutes")
+
 
+@router.get("/{airport_code}/demand")
+async def get_demand_forecast(
+    airport_code: str,
+    horizon_minutes: int = horizon_param(),
+    db: Session = Depends(get_routed_db)
+):
+    """Expected orders per restaurant and per gate over the coming time buckets"""
+    forecast = demand.forecast(db, airport_id_or_404(db, airport_code), horizon_minutes)
+    return json_response(forecast.payload())
 
 
+@router.get("/{airport_code}/staging")
+async def get_agent_staging(
+    airport_code: str,
+    horizon_minutes: int = horizon_param(),
+    agents: Optional[int] = Query(None, ge=0, description="Agents to place (default: those on shift at the airport)"),
+    db: Session = Depends(get_routed_db)
+):
+    """Recommended agents per terminal and the gates to wait at, from the demand forecast"""
+    return json_response(await staging_plan(db, airport_id_or_404(db, airport_code), horizon_minutes, agents))
@@ -0,0 +1,129 @@
+import codecs
+import hmac
+import os
+import time
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from typing import AsyncIterator, List
+from app.database import scatter, shard_of
+from app.models.order import Order
+from app.schemas.flight import GateChangeBatch, GateChangeList
+from app.services.flights import normalize_flight_number
+from app.services.gate_changes import apply_gate_changes, parse_lines, split_by_shard
+from app.services.jobs import jobs
+from app.services.notifications import notify_order
+from app.services.order_service import load_orders
+from app.services.serialization import order_payload, json_response
+from app.routers.websocket import agent_channel, broadcast_agent_update, broadcast_order_update
+
+router = APIRouter()
+
+# Service token of the flight-ops feed, sent as "Authorization: Bearer <token>"
+GATE_FEED_TOKEN = os.getenv("GATE_FEED_TOKEN", "")
+
+
+def require_feed_token(authorization: str = Header(None)):
+    """Only the flight-ops feed may move orders between gates"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Missing feed token", headers={"WWW-Authenticate": "Bearer"})
+    if not GATE_FEED_TOKEN or not hmac.compare_digest(token.encode(), GATE_FEED_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid feed token")
+
+
+async def stream_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a streamed body into lines as it arrives"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+async def read_changes(request: Request) -> List:
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("application/json"):
+            body = orjson.loads(await request.body())
+            if isinstance(body, list):
+                return GateChangeList.validate_python(body)
+            return GateChangeBatch.model_validate(body).changes
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None:
+                raise HTTPException(status_code=400, detail="Upload the feed as a 'file' field")
+            lines = (await upload.read()).decode("utf-8").splitlines()
+        else:
+            # text/csv, application/x-ndjson, ...: read the stream line by line
+            lines = [line async for line in stream_lines(request.stream())]
+        return GateChangeList.validate_python(list(parse_lines(lines)))
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed feed: {e}")
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+
+@router.post("/gate-changes", dependencies=[Depends(require_feed_token)])
+async def ingest_gate_changes(request: Request):
+    """
+    Apply a batch of gate changes to every active order on the affected flights.
+
+    Accepts JSON ({"changes": [{"flight_number", "new_gate", "airport"?}]} or a bare
+    list), a streamed CSV (header flight_number,new_gate[,airport]) or NDJSON body,
+    or the same CSV/NDJSON uploaded as a 'file' form field. Tracking pages and the
+    agents carrying those orders are notified with the new gate, distance and ETA.
+    Callers authenticate with the GATE_FEED_TOKEN service token; with none
+    configured the endpoint refuses every request.
+    """
+    started = time.perf_counter()
+    changes = await read_changes(request)
+    by_shard = split_by_shard(changes)
+
+    def apply(db: Session) -> tuple:
+        result = apply_gate_changes(db, by_shard[shard_of(db)])
+        updates = {update["order_id"]: update for update in result["updates"]}
+        payloads = []
+        for order in load_orders(db, Order.id.in_(list(updates))):
+            update = updates[order.id]
+            payload = order_payload(order)
+            payload.update(
+                previous_gate=update["previous_gate"],
+                distance_to_gate=update["distance_to_gate"],
+                eta=update["eta"],
+            )
+            payloads.append(payload)
+        return result, payloads
+
+    results = await run_in_threadpool(scatter, apply, list(by_shard)) if by_shard else []
+    applied_ms = (time.perf_counter() - started) * 1000
+
+    updates, unknown_gates = [], []
+    for result, payloads in results:
+        updates.extend(result["updates"])
+        unknown_gates.extend(result["unknown_gates"])
+        for payload in payloads:
+            jobs.enqueue(broadcast_order_update, payload["id"], "gate_changed", payload, key=payload["id"])
+            notify_order(payload, "gate_changed")
+        for agent_id, trip in result["trips"].items():
+            jobs.enqueue(broadcast_agent_update, agent_id, "gate_changed", {
+                "orders": [u for u in result["updates"] if u["delivery_agent_id"] == agent_id],
+                "trip": trip,
+            }, key=agent_channel(agent_id))
+
+    return json_response({
+        "received": len(changes),
+        "flights": len({normalize_flight_number(change.flight_number) for change in changes} - {""}),
+        "orders_updated": len(updates),
+        "updates": updates,
+        "unknown_gates": unknown_gates,
+        "applied_ms": round(applied_ms, 1),
+    })
@@ -1,38 +1,76 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+from app.database import get_routed_db, scatter, shard_for_id, staleness
 from app.models.order import Order, OrderStatus
 from app.models.restaurant import Restaurant
 from app.models.delivery_agent import DeliveryAgent, AgentStatus
 from app.schemas.order import OrderCreate, OrderResponse, OrderStatusUpdate
-from app.services.order_service import assign_delivery_agent
+from app.services.flights import normalize_flight_number
+from app.services.jobs import jobs
+from app.services.notifications import notify_order
+from app.services.order_cache import order_cache, refresh_order
+from app.services.order_service import load_order, load_orders
+from app.services.order_state import STATUS_ENDPOINT_TARGETS, transition
+from app.services.scheduler import scheduler
+from app.services.serialization import encode, order_payload, json_response, raw_json_response
+from app.routers.websocket import broadcast_order_update
 
 router = APIRouter()
 
 
+def cached_order_response(db: Session, body: Optional[bytes], *criteria):
+    """Serve a cache hit, or load the order, cache its body and serve that"""
+    if body is None:
+        token = order_cache.token(staleness(db))
+        order = load_order(db, *criteria)
+        if not order:
+            raise HTTPException(status_code=404, detail="Order not found")
+        body = encode(order_payload(order))
+        order_cache.put(order.id, order.order_confirmation, body, token)
+    return raw_json_response(body)
+
+
+def notify_assigned(order_ids: List[int]):
+    """Tell tracking pages about orders the dispatcher just gave an agent (run as a background job)"""
+    by_shard = {}
+    for order_id in order_ids:
+        by_shard.setdefault(shard_for_id(order_id), []).append(order_id)
+    for shard, shard_order_ids in by_shard.items():
+        db = shard.SessionLocal()
+        try:
+            for order in load_orders(db, Order.id.in_(shard_order_ids)):
+                payload = order_payload(order)
+                refresh_order(order, payload)
+                jobs.enqueue(broadcast_order_update, order.id, "agent_assigned", payload, key=order.id)
+                notify_order(payload, "agent_assigned")
+        finally:
+            db.close()
+
+
 @router.post("/", response_model=OrderResponse)
-async def create_order(order_data: OrderCreate, db: Session = Depends(get_db)):
+async def create_order(order_data: OrderCreate, db: Session = Depends(get_routed_db)):
     """Create a new delivery coordination order"""
     # Validate restaurant_id
     if not order_data.restaurant_id or order_data.restaurant_id <= 0:
         raise HTTPException(status_code=400, detail="Invalid restaurant ID")
-    
+
     # Verify restaurant exists
     restaurant = db.query(Restaurant).filter(Restaurant.id == order_data.restaurant_id).first()
     if not restaurant:
         raise HTTPException(
-            status_code=404, 
+            status_code=404,
             detail=f"Restaurant with ID {order_data.restaurant_id} not found. Please check if the restaurant exists."
         )
-    
+
     # Check if order confirmation already exists
     existing = db.query(Order).filter(
         Order.order_confirmation == order_data.order_confirmation
     ).first()
     if existing:
         raise HTTPException(status_code=400, detail="Order confirmation number already exists")
-    
+
     # Create order
     new_order = Order(
         order_confirmation=order_data.order_confirmation,
@@ -40,84 +78,75 @@ async def create_order(order_data: OrderCreate, db: Session = Depends(get_db)):
         user_name=order_data.user_name,
         user_contact=order_data.user_contact,
         boarding_gate=order_data.boarding_gate,
-        flight_number=order_data.flight_number,
+        flight_number=normalize_flight_number(order_data.flight_number) or None,
         estimated_pickup_time=order_data.estimated_pickup_time,
         status=OrderStatus.ORDER_PLACED
     )
-    
+
     db.add(new_order)
     db.commit()
     db.refresh(new_order)
-    
-    # Automatically assign delivery agent (simulated)
-    assign_delivery_agent(new_order.id, db)
-    
+
+    # Assign this order now unless more urgent ones are waiting; then it keeps
+    # its place in the queue and the background dispatcher serves it in turn
+    await run_in_threadpool(scheduler.dispatch_order, db, new_order.id)
+
     # Refresh to get agent info
     db.refresh(new_order)
-    
-    response = OrderResponse.model_validate(new_order)
-    response.restaurant_name = restaurant.name
-    if new_order.delivery_agent:
-        response.delivery_agent_name = new_order.delivery_agent.name
-    
-    return response
+
+    payload = order_payload(new_order)
+    refresh_order(new_order, payload)
+    return json_response(payload)
 
 
 @router.get("/{order_id}", response_model=OrderResponse)
-async def get_order(order_id: int, db: Session = Depends(get_db)):
+async def get_order(order_id: int, db: Session = Depends(get_routed_db)):
     """Get order details by ID"""
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    restaurant = db.query(Restaurant).filter(Restaurant.id == order.restaurant_id).first()
-    response = OrderResponse.model_validate(order)
-    if restaurant:
-        response.restaurant_name = restaurant.name
-    if order.delivery_agent:
-        response.delivery_agent_name = order.delivery_agent.name
-    
-    return response
+    return cached_order_response(db, order_cache.get(order_id), Order.id == order_id)
 
 
 @router.get("/confirmation/{order_confirmation}", response_model=OrderResponse)
-async def get_order_by_confirmation(order_confirmation: str, db: Session = Depends(get_db)):
-    """Get order by confirmation number"""
-    order = db.query(Order).filter(Order.order_confirmation == order_confirmation).first()
-    if not order:
+async def get_order_by_confirmation(order_confirmation: str):
+    """Get order by confirmation number (the code doesn't say which shard it's in, so all are asked)"""
+    body = order_cache.get_by_confirmation(order_confirmation)
+    if body is not None:
+        return raw_json_response(body)
+
+    def lookup(db: Session) -> Optional[bytes]:
+        token = order_cache.token(staleness(db))
+        order = load_order(db, Order.order_confirmation == order_confirmation)
+        if not order:
+            return None
+        body = encode(order_payload(order))
+        order_cache.put(order.id, order.order_confirmation, body, token)
+        return body
+
+    bodies = await run_in_threadpool(scatter, lookup, readonly=True)
+    body = next((body for body in bodies if body is not None), None)
+    if body is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    
-    restaurant = db.query(Restaurant).filter(Restaurant.id == order.restaurant_id).first()
-    response = OrderResponse.model_validate(order)
-    if restaurant:
-        response.restaurant_name = restaurant.name
-    if order.delivery_agent:
-        response.delivery_agent_name = order.delivery_agent.name
-    
-    return response
+    return raw_json_response(body)
 
 
 @router.put("/{order_id}/status", response_model=OrderResponse)
 async def update_order_status(
     order_id: int,
     status_update: OrderStatusUpdate,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_routed_db)
 ):
-    """Update order status"""
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    order.status = status_update.status
-    db.commit()
-    db.refresh(order)
-    
-    restaurant = db.query(Restaurant).filter(Restaurant.id == order.restaurant_id).first()
-    response = OrderResponse.model_validate(order)
-    if restaurant:
-        response.restaurant_name = restaurant.name
-    if order.delivery_agent:
-        response.delivery_agent_name = order.delivery_agent.name
-    
-    return response
+    """
+    Update order status: restaurant_preparing or cancelled, and only when the
+    order state machine allows the move. Assignment, pickup and delivery go
+    through dispatch and the agent endpoints. Pass the version last read to
+    fail with 409 if the order has changed since.
+    """
+    if status_update.status not in STATUS_ENDPOINT_TARGETS:
+        allowed = ", ".join(sorted(status.value for status in STATUS_ENDPOINT_TARGETS))
+        raise HTTPException(status_code=400, detail=f"Status can only be set to {allowed} here")
+    transition(db, order_id, status_update.status, expected_version=status_update.version)
+    order = load_order(db, Order.id == order_id)
 
+    payload = order_payload(order)
+    refresh_order(order, payload)
+    notify_order(payload, order.status.value)
+    return json_response(payload)
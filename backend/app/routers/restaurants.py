@@ -1,76 +1,159 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from app.database import get_db
+import math
+from sqlalchemy.orm import Session, load_only, selectinload
+from typing import Dict, List, Optional
+from app.database import get_routed_db
 from app.models.restaurant import Restaurant
-from app.models.airport import Terminal, Gate
+from app.models.airport import Airport, Terminal, Gate
 from app.schemas.restaurant import RestaurantResponse, RestaurantListResponse
-from app.services.distance import calculate_distance
+from app.services.routing import gate_node, restaurant_node
+from app.services.transit import prepare_airport_transit
+from app.services.pagination import after_cursor, cursor_param, decode_cursor, limit_param, split_page
+from app.services.projection import (
+    RESTAURANT_COLUMNS, RESTAURANT_TERMINAL_COLUMNS,
+    columns, depth_param, fields_param, parse_fields, project
+)
+from app.services.serialization import restaurant_list_payload, json_response
 
 router = APIRouter()
 
+# depth: 0 = restaurant only, 1 = with its terminal (id, name)
+RESTAURANT_LEVELS = {"": RESTAURANT_COLUMNS, "terminal": RESTAURANT_TERMINAL_COLUMNS}
+
+
+def restaurant_load_options(selection: Dict[str, List[str]], depth: int, with_location: bool = False) -> list:
+    names = list(selection[""])
+    if with_location:
+        # Needed to compute distance_from_gate even if not returned
+        names += [name for name in ("location", "terminal_id") if name not in names]
+    options = [load_only(*columns(Restaurant, names))]
+    if depth >= 1:
+        options.append(
+            selectinload(Restaurant.terminal).load_only(*columns(Terminal, selection["terminal"]))
+        )
+    return options
+
+
+def restaurant_payload(restaurant: Restaurant, selection: Dict[str, List[str]], depth: int) -> dict:
+    data = project(restaurant, selection[""])
+    if "distance_from_gate" in restaurant.__dict__:
+        data["distance_from_gate"] = restaurant.distance_from_gate
+    if depth >= 1:
+        data["terminal"] = project(restaurant.terminal, selection["terminal"]) if restaurant.terminal else None
+    return data
+
 
 @router.get("/airport/{airport_code}", response_model=RestaurantListResponse)
 async def get_restaurants_by_airport(
     airport_code: str,
     gate: Optional[str] = Query(None, description="Filter restaurants near this gate"),
-    db: Session = Depends(get_db)
+    cuisine: Optional[str] = Query(None, description="Exact cuisine type, e.g. Mexican"),
+    terminal: Optional[str] = Query(None, description="Terminal name, e.g. Terminal 1"),
+    limit: Optional[int] = limit_param(None),
+    cursor: Optional[str] = cursor_param(),
+    fields: Optional[str] = fields_param(),
+    depth: int = depth_param(0, 1),
+    db: Session = Depends(get_routed_db)
 ):
-    """Get all restaurants in an airport, optionally filtered by gate proximity"""
-    # Get terminal for the airport (simplified - in real app, you'd join properly)
-    from app.models.airport import Airport
+    """
+    Get restaurants in an airport, optionally filtered by cuisine and terminal.
+    With a gate, results are sorted by distance from it; otherwise by ID.
+    Every match is returned unless a limit is given; then pass next_cursor
+    back as cursor to fetch the following page. total counts all matches.
+    """
+    selection = parse_fields(fields, RESTAURANT_LEVELS) if fields or depth else None
     airport = db.query(Airport).filter(Airport.code == airport_code.upper()).first()
     if not airport:
         raise HTTPException(status_code=404, detail="Airport not found")
-    
-    # Get all terminals for this airport
-    terminals = db.query(Terminal).filter(Terminal.airport_id == airport.id).all()
-    terminal_ids = [t.id for t in terminals]
-    
-    # Get restaurants in these terminals
-    restaurants = db.query(Restaurant).filter(Restaurant.terminal_id.in_(terminal_ids)).all()
-    
-    # If gate is provided, calculate distances and filter
+
+    # Restaurants in this airport's terminals, filters pushed into SQL
+    query = db.query(Restaurant).join(Terminal).filter(Terminal.airport_id == airport.id)
+    if terminal:
+        query = query.filter(Terminal.name == terminal)
+    if cuisine:
+        query = query.filter(Restaurant.cuisine_type == cuisine)
+
+    # Find the gate
+    gate_obj = None
     if gate:
-        # Find the gate
-        gate_obj = None
-        for terminal in terminals:
-            gate_obj = db.query(Gate).filter(
-                Gate.terminal_id == terminal.id,
-                Gate.gate_number == gate.upper()
-            ).first()
-            if gate_obj:
-                break
-        
-        if gate_obj and gate_obj.coordinates:
-            # Calculate distance for each restaurant
-            gate_coords = gate_obj.coordinates
-            restaurants_with_distance = []
-            
-            for restaurant in restaurants:
-                if restaurant.location:
-                    distance = calculate_distance(
-                        gate_coords,
-                        restaurant.location
-                    )
-                    restaurant.distance_from_gate = distance
-                    restaurants_with_distance.append(restaurant)
-            
-            # Sort by distance
-            restaurants_with_distance.sort(key=lambda r: r.distance_from_gate or float('inf'))
-            restaurants = restaurants_with_distance
-    
-    return RestaurantListResponse(
-        restaurants=[RestaurantResponse.model_validate(r) for r in restaurants],
-        total=len(restaurants)
-    )
+        gate_obj = db.query(Gate).join(Terminal).filter(
+            Terminal.airport_id == airport.id,
+            Gate.gate_number == gate.upper()
+        ).first()
+
+    if selection:
+        query = query.options(*restaurant_load_options(selection, depth, with_location=bool(gate_obj)))
+
+    if not (gate_obj and gate_obj.coordinates):
+        # Stable ID order: keyset pagination straight from the index
+        matching = query
+        if cursor:
+            query = query.filter(after_cursor([Restaurant.id], decode_cursor(cursor, 1)))
+        query = query.order_by(Restaurant.id)
+        if limit is None:
+            restaurants, next_cursor = query.all(), None
+        else:
+            restaurants, next_cursor = split_page(query.limit(limit + 1).all(), limit, key=lambda r: (r.id,))
+        # Only a partial result needs its own COUNT
+        total = len(restaurants) if not cursor and next_cursor is None else matching.count()
+    else:
+        # Distance is computed per request, so sort and page the (small, per-airport) set in memory
+        restaurants_with_distance = []
+        candidates = [r for r in query.all() if r.location]
+
+        # Walkway distances across every terminal (transfers included) in one bulk lookup
+        transit = await prepare_airport_transit(db, airport.id)
+        distances = transit.distances_from(
+            (gate_obj.terminal_id, gate_node(gate_obj.gate_number)),
+            [(r.terminal_id, restaurant_node(r.id)) for r in candidates]
+        )
+        for restaurant, distance in zip(candidates, distances.tolist()):
+            if math.isfinite(distance):
+                restaurant.distance_from_gate = round(distance, 2)
+                restaurants_with_distance.append(restaurant)
+
+        # Sort by distance, ID as tie-breaker keeps the order stable across pages
+        restaurants_with_distance.sort(key=lambda r: (r.distance_from_gate, r.id))
+        total = len(restaurants_with_distance)
+        if cursor:
+            after = tuple(decode_cursor(cursor, 2))
+            restaurants_with_distance = [
+                r for r in restaurants_with_distance if (r.distance_from_gate, r.id) > after
+            ]
+        if limit is None:
+            restaurants, next_cursor = restaurants_with_distance, None
+        else:
+            restaurants, next_cursor = split_page(
+                restaurants_with_distance[:limit + 1], limit, key=lambda r: (r.distance_from_gate, r.id)
+            )
+
+    if selection:
+        payload = [restaurant_payload(r, selection, depth) for r in restaurants]
+    else:
+        payload = restaurant_list_payload(restaurants)
+
+    return json_response({
+        "restaurants": payload,
+        "total": total,
+        "next_cursor": next_cursor
+    })
 
 
 @router.get("/{restaurant_id}", response_model=RestaurantResponse)
-async def get_restaurant(restaurant_id: int, db: Session = Depends(get_db)):
+async def get_restaurant(
+    restaurant_id: int,
+    fields: Optional[str] = fields_param(),
+    depth: int = depth_param(0, 1),
+    db: Session = Depends(get_routed_db)
+):
     """Get restaurant details by ID"""
-    restaurant = db.query(Restaurant).filter(Restaurant.id == restaurant_id).first()
+    selection = parse_fields(fields, RESTAURANT_LEVELS) if fields or depth else None
+    query = db.query(Restaurant)
+    if selection:
+        query = query.options(*restaurant_load_options(selection, depth))
+    restaurant = query.filter(Restaurant.id == restaurant_id).first()
     if not restaurant:
         raise HTTPException(status_code=404, detail="Restaurant not found")
-    return restaurant
-
+    if selection:
+        return json_response(restaurant_payload(restaurant, selection, depth))
+    return json_response(RestaurantResponse.model_validate(restaurant).model_dump())
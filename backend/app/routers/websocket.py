@@ -1,87 +1,314 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import Dict, List
+from fastapi import status as ws_status
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Hashable, List, Optional
+import asyncio
 import json
+import logging
+import os
+import resource
+import sys
+import time
 from datetime import datetime
-from app.database import SessionLocal
+from app.database import shard_for_id
+from app.models.delivery_agent import DeliveryAgent
 from app.models.order import Order
-from app.schemas.order import OrderResponse
+from app.services.order_service import load_order
+from app.services.trips import plan_trip
+from app.services.serialization import order_payload, dumps
+from app.services.tracing import tracer
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Heartbeat / reaping configuration (seconds)
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "25"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "75"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+
+# Connection caps (0 disables a cap)
+WS_MAX_PER_ORDER = int(os.getenv("WS_MAX_PER_ORDER", "5"))
+WS_MAX_PER_IP = int(os.getenv("WS_MAX_PER_IP", "20"))
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "5000"))
+
+
+def agent_channel(agent_id: int) -> str:
+    """Channel key for an agent's sockets (order sockets are keyed by the bare order id)"""
+    return f"agent:{agent_id}"
+
+
+class ConnectionInfo:
+    """Bookkeeping for one open socket"""
+    __slots__ = ("order_id", "client_ip", "connected_at", "last_seen")
+
+    def __init__(self, order_id: Hashable, client_ip: str):
+        self.order_id = order_id
+        self.client_ip = client_ip
+        self.connected_at = time.monotonic()
+        self.last_seen = self.connected_at
+
+
+def get_client_ip(websocket: WebSocket) -> str:
+    """Resolve the client IP, honouring the proxy header set by Render/Railway"""
+    forwarded = websocket.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    if websocket.client:
+        return websocket.client.host
+    return "unknown"
+
+
 # Store active WebSocket connections
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[int, List[WebSocket]] = {}  # order_id -> [websockets]
-    
-    async def connect(self, websocket: WebSocket, order_id: int):
+        self.active_connections: Dict[Hashable, List[WebSocket]] = {}  # order_id or agent channel -> [websockets]
+        self.connections: Dict[WebSocket, ConnectionInfo] = {}
+        self.ip_counts: Dict[str, int] = {}
+        self.rejected_total = 0
+        self.reaped_total = 0
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._draining = False
+
+    def _over_capacity(self, order_id: Hashable, client_ip: str) -> Optional[str]:
+        if self._draining:
+            return "server shutting down"
+        if WS_MAX_CONNECTIONS and len(self.connections) >= WS_MAX_CONNECTIONS:
+            return "worker connection limit reached"
+        if WS_MAX_PER_ORDER and len(self.active_connections.get(order_id, [])) >= WS_MAX_PER_ORDER:
+            return "too many connections for this order"
+        if WS_MAX_PER_IP and self.ip_counts.get(client_ip, 0) >= WS_MAX_PER_IP:
+            return "too many connections from this client"
+        return None
+
+    async def connect(self, websocket: WebSocket, order_id: Hashable) -> bool:
+        """Accept the socket unless a cap is exceeded. Returns False if rejected."""
+        client_ip = get_client_ip(websocket)
+        reason = self._over_capacity(order_id, client_ip)
+        # Accept even to refuse: a close before the handshake is sent as HTTP 403, not the 1013 code
         await websocket.accept()
+        if reason:
+            self.rejected_total += 1
+            await websocket.close(code=ws_status.WS_1013_TRY_AGAIN_LATER, reason=reason)
+            return False
+
         if order_id not in self.active_connections:
             self.active_connections[order_id] = []
         self.active_connections[order_id].append(websocket)
-    
-    def disconnect(self, websocket: WebSocket, order_id: int):
+        self.connections[websocket] = ConnectionInfo(order_id, client_ip)
+        self.ip_counts[client_ip] = self.ip_counts.get(client_ip, 0) + 1
+        return True
+
+    def disconnect(self, websocket: WebSocket, order_id: Hashable):
+        info = self.connections.pop(websocket, None)
+        if info:
+            remaining = self.ip_counts.get(info.client_ip, 1) - 1
+            if remaining > 0:
+                self.ip_counts[info.client_ip] = remaining
+            else:
+                self.ip_counts.pop(info.client_ip, None)
         if order_id in self.active_connections:
-            self.active_connections[order_id].remove(websocket)
+            if websocket in self.active_connections[order_id]:
+                self.active_connections[order_id].remove(websocket)
             if not self.active_connections[order_id]:
                 del self.active_connections[order_id]
-    
+
+    def touch(self, websocket: WebSocket):
+        """Record activity (any client frame, including pong) on a socket"""
+        info = self.connections.get(websocket)
+        if info:
+            info.last_seen = time.monotonic()
+
+    async def _close(self, websocket: WebSocket, code: int, reason: str = ""):
+        info = self.connections.get(websocket)
+        if info:
+            self.disconnect(websocket, info.order_id)
+        try:
+            await asyncio.wait_for(websocket.close(code=code, reason=reason), WS_SEND_TIMEOUT)
+        except Exception:
+            # Socket already gone (half-open or closed by peer)
+            pass
+
+    async def _send(self, websocket: WebSocket, text: str) -> bool:
+        """Send with a timeout so a stalled peer can't block the caller"""
+        # Traced only as part of a broadcast's trace (heartbeat pings start none)
+        with tracer.span("ws send", "producer", {"messaging.message.body.size": len(text)}, new_trace=False) as span:
+            try:
+                await asyncio.wait_for(websocket.send_text(text), WS_SEND_TIMEOUT)
+                return True
+            except Exception as exc:
+                span.record_exception(exc)
+                await self._close(websocket, ws_status.WS_1011_INTERNAL_ERROR)
+                return False
+
     async def send_personal_message(self, message: dict, websocket: WebSocket):
-        await websocket.send_json(message)
-    
-    async def broadcast_to_order(self, order_id: int, message: dict):
+        await websocket.send_text(dumps(message))
+
+    async def broadcast_to_order(self, order_id: Hashable, message: dict):
         if order_id in self.active_connections:
-            for connection in self.active_connections[order_id]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    # Connection closed, remove it
-                    self.active_connections[order_id].remove(connection)
+            with tracer.span("ws broadcast", "producer", {
+                "messaging.destination.name": str(order_id),
+                "ws.connections": len(self.active_connections[order_id]),
+            }) as span:
+                # Encode once, then fan out the same text frame
+                text = dumps(message)
+                # Sockets are sent to concurrently (each send has its own timeout), from a copy
+                # of the list since failed sends remove themselves from it
+                delivered = await asyncio.gather(*(
+                    self._send(connection, text) for connection in list(self.active_connections[order_id])
+                ))
+                span.set_attribute("ws.delivered", sum(delivered))
+
+    async def heartbeat_once(self):
+        """Reap idle sockets and ping the rest, all at once so a slow client can't hold up the others"""
+        now = time.monotonic()
+        ping = dumps({"type": "ping", "ts": datetime.utcnow()})
+        pending = []
+        for websocket, info in list(self.connections.items()):
+            if now - info.last_seen > WS_IDLE_TIMEOUT:
+                self.reaped_total += 1
+                pending.append(self._close(websocket, ws_status.WS_1001_GOING_AWAY, "idle timeout"))
+            else:
+                pending.append(self._send(websocket, ping))
+        # _send and _close each time out after WS_SEND_TIMEOUT, so neither does the round
+        await asyncio.gather(*pending)
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_INTERVAL)
+            try:
+                await self.heartbeat_once()
+            except Exception:
+                logger.exception("WebSocket heartbeat failed")
+
+    def start_heartbeat(self):
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._draining = False
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def drain(self):
+        """Stop accepting sockets and close the open ones (used on shutdown)"""
+        self._draining = True
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        for websocket in list(self.connections):
+            await self._close(websocket, ws_status.WS_1001_GOING_AWAY, "server shutting down")
+
+    def stats(self) -> dict:
+        """Gauges for open sockets and memory used per connection"""
+        open_connections = len(self.connections)
+        registry_bytes = (
+            sys.getsizeof(self.active_connections)
+            + sys.getsizeof(self.connections)
+            + sys.getsizeof(self.ip_counts)
+            + sum(sys.getsizeof(sockets) for sockets in self.active_connections.values())
+            + sum(sys.getsizeof(info) + sys.getsizeof(info.client_ip) for info in self.connections.values())
+        )
+        # ru_maxrss is reported in kilobytes on Linux
+        peak_rss_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return {
+            "open_connections": open_connections,
+            "orders_tracked": sum(1 for key in self.active_connections if not isinstance(key, str)),
+            "agents_tracked": sum(1 for key in self.active_connections if isinstance(key, str)),
+            "unique_clients": len(self.ip_counts),
+            "rejected_total": self.rejected_total,
+            "reaped_total": self.reaped_total,
+            "registry_bytes": registry_bytes,
+            "registry_bytes_per_connection": registry_bytes // open_connections if open_connections else 0,
+            "peak_rss_bytes": peak_rss_bytes,
+            "limits": {
+                "max_per_order": WS_MAX_PER_ORDER,
+                "max_per_ip": WS_MAX_PER_IP,
+                "max_connections": WS_MAX_CONNECTIONS,
+                "heartbeat_interval": WS_HEARTBEAT_INTERVAL,
+                "idle_timeout": WS_IDLE_TIMEOUT,
+            },
+        }
 
 manager = ConnectionManager()
 
 
+@router.get("/stats")
+async def websocket_stats():
+    """Open socket and memory gauges for this worker"""
+    return manager.stats()
+
+
+async def listen(websocket: WebSocket):
+    """Keep the connection alive: record pongs, ack anything else"""
+    while True:
+        data = await websocket.receive_text()
+        manager.touch(websocket)
+        try:
+            message = json.loads(data)
+        except ValueError:
+            message = None
+        if isinstance(message, dict) and message.get("type") == "pong":
+            continue
+        # Echo back or handle client messages if needed
+        await manager.send_personal_message({
+            "type": "ack",
+            "message": "Message received"
+        }, websocket)
+
+
 @router.websocket("/order/{order_id}")
 async def websocket_order_tracking(websocket: WebSocket, order_id: int):
     """WebSocket endpoint for real-time order tracking"""
-    await manager.connect(websocket, order_id)
-    
+    if not await manager.connect(websocket, order_id):
+        return
+
     try:
         # Send initial order status
-        db = SessionLocal()
+        db = shard_for_id(order_id).SessionLocal()
         try:
-            order = db.query(Order).filter(Order.id == order_id).first()
+            order = load_order(db, Order.id == order_id)
             if order:
-                from app.models.restaurant import Restaurant
-                restaurant = db.query(Restaurant).filter(Restaurant.id == order.restaurant_id).first()
-                response = OrderResponse.model_validate(order)
-                if restaurant:
-                    response.restaurant_name = restaurant.name
-                if order.delivery_agent:
-                    response.delivery_agent_name = order.delivery_agent.name
-                
-                # Convert to dict with JSON-compatible serialization
-                order_dict = response.model_dump(mode='json')
-                
                 await manager.send_personal_message({
                     "type": "order_status",
-                    "data": order_dict
+                    "data": order_payload(order)
                 }, websocket)
         finally:
             db.close()
         
         # Keep connection alive and listen for messages
-        while True:
-            data = await websocket.receive_text()
-            # Echo back or handle client messages if needed
-            await manager.send_personal_message({
-                "type": "ack",
-                "message": "Message received"
-            }, websocket)
-            
-    except WebSocketDisconnect:
+        await listen(websocket)
+
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: socket was closed server-side (reaped or drained)
+        pass
+    finally:
         manager.disconnect(websocket, order_id)
 
 
+@router.websocket("/agent/{agent_id}")
+async def websocket_agent(websocket: WebSocket, agent_id: int):
+    """WebSocket endpoint for an agent's app: current trip, then pushed changes to it"""
+    channel = agent_channel(agent_id)
+    if not await manager.connect(websocket, channel):
+        return
+
+    try:
+        db = shard_for_id(agent_id).SessionLocal()
+        try:
+            agent = db.query(DeliveryAgent).filter(DeliveryAgent.id == agent_id).first()
+            if agent:
+                await manager.send_personal_message({
+                    "type": "trip",
+                    "data": await run_in_threadpool(plan_trip, db, agent)
+                }, websocket)
+        finally:
+            db.close()
+
+        await listen(websocket)
+
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        manager.disconnect(websocket, channel)
+
+
 # Function to broadcast order status updates (can be called from other parts of the app)
 async def broadcast_order_update(order_id: int, status: str, data: dict):
     """Broadcast order status update to all connected clients"""
@@ -92,3 +319,11 @@ async def broadcast_order_update(order_id: int, status: str, data: dict):
         "data": data  # Full order object
     })
 
+
+async def broadcast_agent_update(agent_id: int, event: str, data: dict):
+    """Push a change affecting an agent's work (e.g. a gate change on their trip)"""
+    await manager.broadcast_to_order(agent_channel(agent_id), {
+        "type": "agent_update",
+        "event": event,
+        "data": data
+    })
@@ -1,18 +1,26 @@
-from app.schemas.airport import AirportResponse, TerminalResponse, GateResponse
-from app.schemas.restaurant import RestaurantResponse, RestaurantListResponse
-from app.schemas.order import OrderCreate, OrderResponse, OrderStatusUpdate
-from app.schemas.delivery_agent import DeliveryAgentResponse
+from app.schemas.airport import AirportResponse, AirportResponseList, TerminalResponse, GateResponse
+from app.schemas.restaurant import RestaurantResponse, RestaurantResponseList, RestaurantListResponse
+from app.schemas.order import OrderCreate, OrderResponse, OrderResponseList, OrderStatusUpdate
+from app.schemas.delivery_agent import DeliveryAgentResponse, AgentShiftUpdate
+from app.schemas.flight import GateChange, GateChangeBatch, GateChangeList
 
 __all__ = [
     "AirportResponse",
+    "AirportResponseList",
     "TerminalResponse",
     "GateResponse",
     "RestaurantResponse",
+    "RestaurantResponseList",
     "RestaurantListResponse",
     "OrderCreate",
     "OrderResponse",
+    "OrderResponseList",
     "OrderStatusUpdate",
     "DeliveryAgentResponse",
+    "AgentShiftUpdate",
+    "GateChange",
+    "GateChangeBatch",
+    "GateChangeList",
 ]
 
 
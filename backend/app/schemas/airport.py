@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 from typing import List, Optional, Dict, Any
 
 
@@ -36,4 +36,4 @@ class AirportResponse(BaseModel):
         from_attributes = True
 
 
-
+AirportResponseList = TypeAdapter(List[AirportResponse])
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from datetime import datetime
+from pydantic import BaseModel, Field
 from app.models.delivery_agent import AgentStatus
 
 
@@ -6,11 +7,23 @@ class DeliveryAgentResponse(BaseModel):
     id: int
     name: str
     status: AgentStatus
+    airport_id: int | None
     current_location: str | None
     contact: str | None
+    capacity: int
+    shift_start: datetime | None
+    shift_end: datetime | None
 
     class Config:
         from_attributes = True
 
 
+class AgentShiftUpdate(BaseModel):
+    """Fields left out are unchanged; send null to clear a shift bound"""
+    capacity: int | None = Field(None, ge=0, description="Most orders the agent carries at once")
+    shift_start: datetime | None = None
+    shift_end: datetime | None = None
+    status: AgentStatus | None = Field(None, description="OFFLINE takes the agent out of dispatch")
+
+
 
@@ -0,0 +1,16 @@
+from pydantic import BaseModel, TypeAdapter
+from typing import List, Optional
+
+
+class GateChange(BaseModel):
+    flight_number: str
+    new_gate: str
+    airport: Optional[str] = None  # IATA code; omit to apply wherever the flight number appears
+
+
+class GateChangeBatch(BaseModel):
+    changes: List[GateChange]
+
+
+# Precompiled adapter for streamed lines (CSV/NDJSON rows validated in one call)
+GateChangeList = TypeAdapter(List[GateChange])
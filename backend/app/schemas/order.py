@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, TypeAdapter
+from typing import List, Optional
 from datetime import datetime
 from app.models.order import OrderStatus
 
@@ -16,6 +16,7 @@ class OrderCreate(BaseModel):
 
 class OrderStatusUpdate(BaseModel):
     status: OrderStatus
+    version: Optional[int] = None  # expected current version; the update fails with 409 if it has moved on
 
 
 class OrderResponse(BaseModel):
@@ -34,7 +35,11 @@ class OrderResponse(BaseModel):
     delivery_otp: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
+    version: int
 
     class Config:
         from_attributes = True
 
+
+# Precompiled adapter: validates a whole list of ORM orders in one call
+OrderResponseList = TypeAdapter(List[OrderResponse])
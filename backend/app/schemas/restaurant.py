@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 from typing import List, Optional, Dict, Any
 
 
@@ -19,7 +19,8 @@ class RestaurantResponse(BaseModel):
 
 class RestaurantListResponse(BaseModel):
     restaurants: List[RestaurantResponse]
-    total: int
-
+    total: int  # Restaurants matching the filters, across all pages
+    next_cursor: Optional[str] = None  # Pass as ?cursor= to get the next page
 
 
+RestaurantResponseList = TypeAdapter(List[RestaurantResponse])
@@ -0,0 +1,172 @@
+"""
+Live delivery agent load.
+
+Dispatch needs every candidate agent's active orders (assigned, not yet
+delivered or cancelled) on each decision. Instead of counting orders per
+candidate, each worker keeps active order -> agent in memory per database
+shard, updated when a transaction that assigns or closes an order commits:
+ORM flushes are seen directly, bulk UPDATEs report through note_assigned()
+and note_closed(). The map is re-read from the database every
+AGENT_LOAD_RECONCILE seconds, which also picks up other workers' writes;
+assign_delivery_agent() re-checks the chosen agent in the database before
+committing, so a stale count never oversubscribes anyone.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, inspect, not_
+from sqlalchemy.orm import Session
+from app.database import DEFAULT_SHARD, on_commit, shard_of, stash
+from app.models.order import Order
+from app.services.trips import CLOSED_STATUSES
+
+AGENT_LOAD_RECONCILE = float(os.getenv("AGENT_LOAD_RECONCILE", "30"))
+
+# Session.info key for (order id, agent id or None when closed) written in the current transaction
+_PENDING_KEY = "agent_load_pending"
+
+
+class ShardLoad:
+    """Active orders per agent in one shard"""
+
+    def __init__(self):
+        self.agents: Dict[int, int] = {}  # active order id -> agent id
+        self.counts: Dict[int, int] = {}  # agent id -> active orders
+        self.loaded_at = time.monotonic()
+
+    def assign(self, order_id: int, agent_id: int):
+        if self.agents.get(order_id) == agent_id:
+            return
+        self.release(order_id)
+        self.agents[order_id] = agent_id
+        self.counts[agent_id] = self.counts.get(agent_id, 0) + 1
+
+    def release(self, order_id: int) -> Optional[int]:
+        agent_id = self.agents.pop(order_id, None)
+        if agent_id is not None:
+            self.counts[agent_id] -= 1
+            if not self.counts[agent_id]:
+                del self.counts[agent_id]
+        return agent_id
+
+
+class AgentLoadTracker:
+    def __init__(self, reconcile_interval: float = AGENT_LOAD_RECONCILE):
+        self.reconcile_interval = reconcile_interval
+        self._shards: Dict[str, ShardLoad] = {}
+        self._lock = threading.Lock()
+        self._on_release: List[Callable[[], None]] = []
+        self.reconciled = 0
+        self.assigned = 0
+        self.released = 0
+
+    def loads(self, db: Session, agent_ids: Iterable[int]) -> Dict[int, int]:
+        """agent id -> active orders, for agents in db's shard"""
+        shard = self._current(db)
+        with self._lock:
+            return {agent_id: shard.counts.get(agent_id, 0) for agent_id in agent_ids}
+
+    def load(self, db: Session, agent_id: int) -> int:
+        return self.loads(db, [agent_id])[agent_id]
+
+    def _current(self, db: Session) -> ShardLoad:
+        shard = self._shards.get(shard_of(db).name)
+        if shard is None or time.monotonic() - shard.loaded_at >= self.reconcile_interval:
+            shard = self.reconcile(db)
+        return shard
+
+    def reconcile(self, db: Session) -> ShardLoad:
+        """Re-read the shard's active orders from the database"""
+        fresh = ShardLoad()
+        for order_id, agent_id in db.query(Order.id, Order.delivery_agent_id).filter(
+            Order.delivery_agent_id.isnot(None),
+            not_(Order.status.in_(CLOSED_STATUSES))
+        ):
+            fresh.assign(order_id, agent_id)
+        with self._lock:
+            self._shards[shard_of(db).name] = fresh
+            self.reconciled += 1
+        return fresh
+
+    def apply(self, shard_name: str, changes: List[Tuple[int, Optional[int]]]):
+        """Committed assignments (order, agent) and closures (order, None)"""
+        freed = False
+        with self._lock:
+            shard = self._shards.get(shard_name)
+            if shard is None:
+                return  # not loaded yet; the first reconcile counts these
+            for order_id, agent_id in changes:
+                if agent_id is not None:
+                    shard.assign(order_id, agent_id)
+                    self.assigned += 1
+                elif shard.release(order_id) is not None:
+                    self.released += 1
+                    freed = True
+        if freed:
+            for callback in self._on_release:
+                callback()
+
+    def on_release(self, callback: Callable[[], None]):
+        """Call callback (from any thread) whenever a commit frees agent capacity"""
+        if callback not in self._on_release:
+            self._on_release.append(callback)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "shards": {
+                    name: {
+                        "active_orders": len(shard.agents),
+                        "busy_agents": len(shard.counts),
+                        "age_seconds": round(time.monotonic() - shard.loaded_at, 1),
+                    }
+                    for name, shard in self._shards.items()
+                },
+                "reconcile_seconds": self.reconcile_interval,
+                "reconciled": self.reconciled,
+                "assigned": self.assigned,
+                "released": self.released,
+            }
+
+
+agent_load = AgentLoadTracker()
+
+
+def active_orders(db: Session, agent_id: int) -> int:
+    """An agent's active orders, counted in the database"""
+    return db.query(func.count(Order.id)).filter(
+        Order.delivery_agent_id == agent_id,
+        not_(Order.status.in_(CLOSED_STATUSES))
+    ).scalar()
+
+
+def note_assigned(db: Session, order_id: int, agent_id: int):
+    """Count the order against the agent when db commits (for bulk UPDATEs the session doesn't track)"""
+    stash(db, _PENDING_KEY, [(order_id, agent_id)])
+
+
+def note_closed(db: Session, order_id: int):
+    """Free the order's agent capacity when db commits"""
+    stash(db, _PENDING_KEY, [(order_id, None)])
+
+
+def _collect_load_changes(session: Session) -> List[Tuple[int, Optional[int]]]:
+    changes = []
+    for obj in (*session.new, *session.dirty):
+        if not isinstance(obj, Order):
+            continue
+        attrs = inspect(obj).attrs
+        if obj.status in CLOSED_STATUSES:
+            if attrs.status.history.has_changes():
+                changes.append((obj.id, None))
+        elif obj.delivery_agent_id is not None and attrs.delivery_agent_id.history.has_changes():
+            changes.append((obj.id, obj.delivery_agent_id))
+    return changes
+
+
+on_commit(
+    _PENDING_KEY,
+    lambda session, changes: agent_load.apply(session.info.get("shard", DEFAULT_SHARD), changes),
+    collect=_collect_load_changes,
+)
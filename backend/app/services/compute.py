@@ -0,0 +1,541 @@
+"""
+Process pool for CPU-heavy work (route and staging optimization, walkway
+distance precomputation), so it never holds the GIL the event loop and the
+WebSockets need.
+
+Tasks are module-level functions registered with @compute.task(name). Callers
+on the event loop `await compute.run(name, ...)`, or start several with
+compute.submit() and await them together; compute.call() blocks, so it is for
+worker threads only (routers hand sync paths that reach it to
+run_in_threadpool). All of them run the task inline when the pool isn't
+running (scripts, COMPUTE_WORKERS=0).
+
+- Large read-only inputs (distance matrices) are published once with
+  compute.share() into shared memory; tasks receive a small SharedArray handle
+  and read the matrix without it being pickled per call. A block is unlinked
+  when its key is shared again or the COMPUTE_SHARED_MB budget evicts it, but
+  never while a submitted task still refers to it.
+- Every call has a timeout (the task's, or COMPUTE_TIMEOUT). On timeout, or
+  when the awaiting request is cancelled, the caller gets control back at
+  once and the task's flag is raised on a shared cancel board; long loops call
+  checkpoint(), which raises TaskCancelled, so the worker is freed promptly.
+- stats() reports calls, failures, timeouts and queue/run latency per task.
+
+Workers are spawned, so they re-import the main module: scripts that run the
+app's lifespan in-process (e.g. TestClient) need an `if __name__ == "__main__"`
+guard, or COMPUTE_WORKERS=0.
+"""
+import asyncio
+import importlib
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Deque, Dict, Optional, Tuple
+import numpy as np
+from fastapi import HTTPException
+from app.services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+COMPUTE_TIMEOUT = float(os.getenv("COMPUTE_TIMEOUT", "10"))  # seconds
+COMPUTE_SHARED_MB = float(os.getenv("COMPUTE_SHARED_MB", "256"))
+# "spawn" keeps workers free of the parent's threads, sockets and connection pools
+COMPUTE_START_METHOD = os.getenv("COMPUTE_START_METHOD", "spawn")
+# Concurrent calls that can be cancelled through the board; calls beyond it still time out
+COMPUTE_CANCEL_SLOTS = 1024
+# Shared blocks a worker keeps attached
+WORKER_ATTACHMENTS = 64
+LATENCY_WINDOW = 1000
+
+
+class TaskCancelled(Exception):
+    """Raised by checkpoint() in a task that timed out or whose caller went away"""
+
+
+class SharedArray:
+    """Picklable handle to a read-only array published with ComputePool.share()"""
+
+    __slots__ = ("name", "shape", "dtype")
+
+    def __init__(self, name: str, shape: Tuple[int, ...], dtype: str):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def __getstate__(self):
+        return self.name, self.shape, self.dtype
+
+    def __setstate__(self, state):
+        self.name, self.shape, self.dtype = state
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+    @property
+    def array(self) -> np.ndarray:
+        """The array: the published original in the parent, a shared-memory view in a worker"""
+        local = compute.local_array(self.name)
+        if local is not None:
+            return local
+        return _attach(self)
+
+
+class TaskSpec:
+    __slots__ = ("name", "func", "module", "qualname", "timeout")
+
+    def __init__(self, name: str, func: Callable, timeout: Optional[float]):
+        self.name = name
+        self.func = func
+        self.module = func.__module__
+        self.qualname = func.__qualname__
+        self.timeout = timeout
+
+
+class TaskStats:
+    def __init__(self):
+        self.calls = 0
+        self.inline = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.wait_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.run_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def payload(self) -> dict:
+        return {
+            "calls": self.calls,
+            "inline": self.inline,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "queue_wait_ms": _percentiles(self.wait_ms),
+            "run_ms": _percentiles(self.run_ms),
+        }
+
+
+class _Call:
+    __slots__ = ("spec", "executor", "future", "slot", "handles", "submitted")
+
+    def __init__(
+        self, spec: TaskSpec, executor: ProcessPoolExecutor, future: Future, slot: Optional[int], handles: list,
+        submitted: float
+    ):
+        self.spec = spec
+        self.executor = executor
+        self.future = future
+        self.slot = slot
+        self.handles = handles
+        self.submitted = submitted
+
+
+class _Block:
+    __slots__ = ("memory", "source", "handle")
+
+    def __init__(self, memory: SharedMemory, source: np.ndarray, handle: SharedArray):
+        self.memory = memory
+        self.source = source
+        self.handle = handle
+
+
+class ComputePool:
+    def __init__(self, workers: int = COMPUTE_WORKERS, shared_mb: float = COMPUTE_SHARED_MB):
+        self.workers = workers
+        self.shared_bytes_limit = int(shared_mb * 1024 * 1024)
+        self._tasks: Dict[str, TaskSpec] = {}
+        self._stats: Dict[str, TaskStats] = {}
+        self._warned: set = set()  # tasks call()ed on the event loop thread
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._board: Optional[SharedMemory] = None
+        self._free_slots: Deque[int] = deque()
+        self._lock = threading.Lock()
+        self._blocks: "OrderedDict[str, _Block]" = OrderedDict()  # key -> current block, least recently shared first
+        self._by_name: Dict[str, _Block] = {}  # block name -> block (current and retired)
+        self._retired: Dict[str, _Block] = {}  # replaced or evicted, unlinked once unpinned
+        self._pins: Dict[str, int] = {}
+        self._shared_bytes = 0
+        self._sequence = itertools.count()
+        self.running = 0
+        self.restarts = 0
+
+    # Registry
+
+    def task(self, name: str, timeout: Optional[float] = None):
+        """Register a module-level function as a compute task"""
+        def register(func: Callable) -> Callable:
+            self._tasks[name] = TaskSpec(name, func, timeout)
+            self._stats.setdefault(name, TaskStats())
+            return func
+        return register
+
+    # Lifecycle
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    def start(self):
+        """Start the worker processes (no-op with COMPUTE_WORKERS=0)"""
+        if self.started or self.workers <= 0:
+            return
+        self._board = SharedMemory(create=True, size=COMPUTE_CANCEL_SLOTS)
+        self._board.buf[:] = bytes(COMPUTE_CANCEL_SLOTS)
+        self._free_slots = deque(range(COMPUTE_CANCEL_SLOTS))
+        self._executor = self._new_executor()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        modules = sorted({spec.module for spec in self._tasks.values()})
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(COMPUTE_START_METHOD),
+            initializer=_init_worker,
+            initargs=(self._board.name, modules),
+        )
+        # Spawn and import now rather than on the first request
+        for _ in range(self.workers):
+            executor.submit(_ping)
+        return executor
+
+    async def stop(self):
+        """Cancel running tasks, stop the workers and release shared memory"""
+        if not self.started:
+            return
+        executor, self._executor = self._executor, None
+        self._board.buf[:] = b"\x01" * COMPUTE_CANCEL_SLOTS
+        await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+        with self._lock:
+            for block in [*self._blocks.values(), *self._retired.values()]:
+                _release_block(block)
+            self._blocks.clear()
+            self._retired.clear()
+            self._by_name.clear()
+            self._pins.clear()
+            self._shared_bytes = 0
+        _release_memory(self._board)
+        self._board = None
+
+    # Shared inputs
+
+    def share(self, key: str, array: np.ndarray) -> SharedArray:
+        """
+        Publish a read-only array under key (e.g. one terminal's distance
+        matrix) and return its handle; sharing the same array again is free,
+        a different one replaces the previous block for that key
+        """
+        with self._lock:
+            current = self._blocks.get(key)
+            if current is not None and current.source is array and (current.memory is not None or not self.started):
+                self._blocks.move_to_end(key)
+                return current.handle
+            if not self.started:
+                # Nothing to share with: handles resolve to the array itself
+                handle = SharedArray(f"local-{next(self._sequence)}", array.shape, array.dtype.str)
+                block = _Block(None, array, handle)
+            else:
+                source = np.ascontiguousarray(array)
+                memory = SharedMemory(create=True, size=max(source.nbytes, 1))
+                np.ndarray(source.shape, source.dtype, buffer=memory.buf)[...] = source
+                handle = SharedArray(memory.name, source.shape, source.dtype.str)
+                block = _Block(memory, array, handle)
+            if current is not None:
+                self._retire(key)
+            self._blocks[key] = block
+            self._by_name[handle.name] = block
+            self._shared_bytes += handle.nbytes
+            while self._shared_bytes > self.shared_bytes_limit and len(self._blocks) > 1:
+                self._retire(next(iter(self._blocks)))
+            return handle
+
+    def local_array(self, name: str) -> Optional[np.ndarray]:
+        block = self._by_name.get(name)
+        return block.source if block is not None else None
+
+    def _retire(self, key: str):
+        """Drop a key's block; unlinked now, or when the last task using it finishes (lock held)"""
+        block = self._blocks.pop(key)
+        self._shared_bytes -= block.handle.nbytes
+        if self._pins.get(block.handle.name):
+            self._retired[block.handle.name] = block
+        else:
+            self._by_name.pop(block.handle.name, None)
+            _release_block(block)
+
+    # Calls
+
+    async def run(self, name: str, *args, timeout: Optional[float] = None, **kwargs):
+        """Run a task in the pool and await its result; 503 if it times out"""
+        spec = self._spec(name)
+        timeout = timeout or spec.timeout or COMPUTE_TIMEOUT
+        with tracer.span(f"compute {name}", "client", {"compute.inline": not self.started}):
+            if not self.started:
+                return self._inline(spec, args, kwargs, timeout)
+            call = self._submit(spec, args, kwargs, timeout)
+            try:
+                _, _, result = await asyncio.wait_for(asyncio.wrap_future(call.future), timeout)
+                return result
+            except asyncio.TimeoutError:
+                self._cancel(call)
+                raise self._timed_out(spec, timeout)
+            except asyncio.CancelledError:
+                self._cancel(call)
+                raise
+            except BrokenProcessPool:
+                raise self._broken(call)
+
+    def submit(self, name: str, *args, timeout: Optional[float] = None, **kwargs) -> "asyncio.Task":
+        """Start run() now and return the awaitable, for callers that fan out (event loop only)"""
+        return asyncio.ensure_future(self.run(name, *args, timeout=timeout, **kwargs))
+
+    def call(self, name: str, *args, timeout: Optional[float] = None, **kwargs):
+        """
+        Blocking run() for worker threads (e.g. the dispatch round). On the
+        event loop thread it runs inline, since waiting would stall the loop
+        just the same, and warns once per task: that caller belongs in
+        run_in_threadpool, or should await run()/submit().
+        """
+        spec = self._spec(name)
+        timeout = timeout or spec.timeout or COMPUTE_TIMEOUT
+        on_loop = _on_event_loop()
+        if on_loop and name not in self._warned:
+            self._warned.add(name)
+            logger.warning("compute.call(%r) on the event loop blocks it; await compute.run() or use a worker thread", name)
+        inline = not self.started or on_loop
+        with tracer.span(f"compute {name}", "client", {"compute.inline": inline}):
+            if inline:
+                return self._inline(spec, args, kwargs, timeout)
+            call = self._submit(spec, args, kwargs, timeout)
+            try:
+                _, _, result = call.future.result(timeout)
+                return result
+            except FutureTimeout:
+                self._cancel(call)
+                raise self._timed_out(spec, timeout)
+            except BrokenProcessPool:
+                raise self._broken(call)
+
+    def _spec(self, name: str) -> TaskSpec:
+        spec = self._tasks.get(name)
+        if spec is None:
+            raise KeyError(f"Unknown compute task {name!r}")
+        return spec
+
+    def _inline(self, spec: TaskSpec, args: tuple, kwargs: dict, timeout: float):
+        stats = self._stats[spec.name]
+        started = time.monotonic()
+        with self._lock:
+            stats.calls += 1
+            stats.inline += 1
+        previous = getattr(_current, "deadline", None)
+        _current.slot, _current.deadline = None, time.time() + timeout
+        try:
+            result = spec.func(*args, **kwargs)
+        except TaskCancelled:
+            with self._lock:
+                stats.timeouts += 1
+            raise self._timed_out(spec, timeout)
+        except Exception:
+            with self._lock:
+                stats.failed += 1
+            raise
+        finally:
+            _current.deadline = previous
+        with self._lock:
+            stats.completed += 1
+            stats.run_ms.append((time.monotonic() - started) * 1000)
+        return result
+
+    def _submit(self, spec: TaskSpec, args: tuple, kwargs: dict, timeout: float) -> _Call:
+        handles = [value for value in (*args, *kwargs.values()) if isinstance(value, SharedArray)]
+        with self._lock:
+            slot = self._free_slots.popleft() if self._free_slots else None
+            if slot is not None:
+                self._board.buf[slot] = 0
+            for handle in handles:
+                self._pins[handle.name] = self._pins.get(handle.name, 0) + 1
+            self._stats[spec.name].calls += 1
+            self.running += 1
+        submitted = time.time()
+        executor = self._executor
+        try:
+            future = executor.submit(_invoke, spec.module, spec.qualname, slot, submitted + timeout, args, kwargs)
+        except BrokenProcessPool:
+            self._restart(executor)
+            executor = self._executor
+            future = executor.submit(_invoke, spec.module, spec.qualname, slot, submitted + timeout, args, kwargs)
+        call = _Call(spec, executor, future, slot, handles, submitted)
+        future.add_done_callback(lambda done: self._finished(call))
+        return call
+
+    def _cancel(self, call: _Call):
+        """Stop waiting for a call: drop it if still queued, otherwise flag it for checkpoint()"""
+        if not call.future.cancel() and call.slot is not None and self._board is not None:
+            self._board.buf[call.slot] = 1
+
+    def _finished(self, call: _Call):
+        """Done callback (pool thread): release the slot and pins, record the outcome"""
+        stats = self._stats[call.spec.name]
+        with self._lock:
+            self.running -= 1
+            if call.slot is not None:
+                self._free_slots.append(call.slot)
+            for handle in call.handles:
+                self._pins[handle.name] -= 1
+                if not self._pins[handle.name]:
+                    del self._pins[handle.name]
+                    retired = self._retired.pop(handle.name, None)
+                    if retired is not None:
+                        self._by_name.pop(handle.name, None)
+                        _release_block(retired)
+            if call.future.cancelled():
+                stats.cancelled += 1
+                return
+            error = call.future.exception()
+            if isinstance(error, TaskCancelled):
+                stats.cancelled += 1
+            elif error is not None:
+                stats.failed += 1
+            else:
+                stats.completed += 1
+                started, finished, _ = call.future.result()
+                stats.wait_ms.append(max(0.0, started - call.submitted) * 1000)
+                stats.run_ms.append((finished - started) * 1000)
+        if call.future.exception() is not None and not isinstance(call.future.exception(), TaskCancelled):
+            logger.warning("Compute task %s failed", call.spec.name, exc_info=call.future.exception())
+
+    def _timed_out(self, spec: TaskSpec, timeout: float) -> HTTPException:
+        with self._lock:
+            self._stats[spec.name].timeouts += 1
+        return HTTPException(status_code=503, detail=f"{spec.name} did not finish within {timeout:g}s")
+
+    def _broken(self, call: _Call) -> HTTPException:
+        self._restart(call.executor)
+        return HTTPException(status_code=503, detail=f"{call.spec.name} failed: compute worker died")
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        """Replace a pool whose worker died (its other workers go with it), once"""
+        with self._lock:
+            if self._executor is not broken:
+                return  # stopped, or already replaced by another caller
+            self._executor = self._new_executor()
+            self.restarts += 1
+        logger.error("Compute worker died; pool restarted")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "started": self.started,
+                "workers": self.workers if self.started else 0,
+                "start_method": COMPUTE_START_METHOD,
+                "running": self.running,
+                "restarts": self.restarts,
+                "shared_arrays": len(self._blocks),
+                "shared_bytes": self._shared_bytes,
+                "retired_arrays": len(self._retired),
+                "tasks": {name: stats.payload() for name, stats in sorted(self._stats.items())},
+            }
+
+
+def _percentiles(samples) -> Optional[dict]:
+    if not samples:
+        return None
+    p50, p95, p100 = np.percentile(np.fromiter(samples, float), [50, 95, 100])
+    return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "max": round(float(p100), 2)}
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def _release_memory(memory: Optional[SharedMemory]):
+    if memory is None:
+        return
+    memory.close()
+    try:
+        memory.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _release_block(block: _Block):
+    _release_memory(block.memory)
+
+
+compute = ComputePool()
+
+
+# Task side (worker processes, or the caller's thread when run inline)
+
+_current = threading.local()  # slot and deadline of the task running on this thread
+_board: Optional[SharedMemory] = None
+_attachments: "OrderedDict[str, Tuple[SharedMemory, np.ndarray]]" = OrderedDict()
+
+
+def checkpoint():
+    """Call between steps of a long task: raises TaskCancelled once it timed out or was cancelled"""
+    deadline = getattr(_current, "deadline", None)
+    if deadline is not None and time.time() > deadline:
+        raise TaskCancelled()
+    slot = getattr(_current, "slot", None)
+    if slot is not None and _board is not None and _board.buf[slot]:
+        raise TaskCancelled()
+
+
+def _init_worker(board_name: str, modules):
+    global _board
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl-C and stops the pool
+    _board = SharedMemory(name=board_name)
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _ping():
+    return os.getpid()
+
+
+def _invoke(module: str, qualname: str, slot: Optional[int], deadline: float, args: tuple, kwargs: dict):
+    started = time.time()
+    _current.slot, _current.deadline = slot, deadline
+    checkpoint()  # cancelled or timed out while queued
+    func = importlib.import_module(module)
+    for part in qualname.split("."):
+        func = getattr(func, part)
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        _current.slot = _current.deadline = None
+    return started, time.time(), result
+
+
+def _attach(handle: SharedArray) -> np.ndarray:
+    cached = _attachments.get(handle.name)
+    if cached is None:
+        memory = SharedMemory(name=handle.name)
+        view = np.ndarray(handle.shape, np.dtype(handle.dtype), buffer=memory.buf)
+        view.flags.writeable = False
+        cached = _attachments[handle.name] = (memory, view)
+        while len(_attachments) > WORKER_ATTACHMENTS:
+            _, (old_memory, old_view) = _attachments.popitem(last=False)
+            del old_view
+            try:
+                old_memory.close()
+            except BufferError:
+                pass  # a task still holds a view; the mapping goes when it does
+    else:
+        _attachments.move_to_end(handle.name)
+    return cached[1]
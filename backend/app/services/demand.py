@@ -0,0 +1,494 @@
+"""
+Order demand forecasting and agent staging.
+
+Every order counts towards its restaurant and its boarding gate in fixed time
+buckets of DEMAND_BUCKET_MINUTES. Each worker keeps these counts in memory
+per database shard, as a ring of the last DEMAND_HISTORY_DAYS of buckets per
+restaurant and per gate. A commit that creates orders adds them to the
+current bucket, and the rings are re-read from the database every
+DEMAND_REBUILD seconds, which also picks up other workers' orders. Rings can
+be restored from a warm-start snapshot (see snapshots.py) and caught up with
+catch_up(), which reads only the orders created since.
+
+The forecast for the coming buckets blends the recent level (an
+exponentially weighted mean over the last day, half-life
+DEMAND_LEVEL_HALFLIFE_MINUTES) with the same time of day on previous days.
+It is computed for every restaurant and gate of an airport at once as array
+operations. staging_plan() turns an airport's forecast into where idle agents
+should wait: agents are shared between terminals in proportion to their
+expected pickups, then placed greedily at the gates that minimize the
+demand-weighted walk to the terminal's restaurants. The placement runs in the
+compute pool, reading walks from the terminal's shared distance matrix.
+"""
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.database import DEFAULT_SHARD, on_commit, shard_of
+from app.models.airport import Terminal
+from app.models.delivery_agent import DeliveryAgent, AgentStatus
+from app.models.order import Order
+from app.models.restaurant import Restaurant
+from app.services.compute import SharedArray, compute
+from app.services.dispatch import as_utc, on_shift
+from app.services.distance import MINUTES_PER_UNIT
+from app.services.routing import gate_node, restaurant_node
+from app.services.tracing import traced
+from app.services.transit import prepare_airport_transit
+from app.services.trips import gate_terminals
+
+DEMAND_BUCKET_MINUTES = int(os.getenv("DEMAND_BUCKET_MINUTES", "15"))
+DEMAND_HISTORY_DAYS = int(os.getenv("DEMAND_HISTORY_DAYS", "7"))
+DEMAND_REBUILD = float(os.getenv("DEMAND_REBUILD", "300"))
+DEMAND_LEVEL_HALFLIFE_MINUTES = float(os.getenv("DEMAND_LEVEL_HALFLIFE_MINUTES", "60"))
+# Share of the forecast taken from the same time on previous days (once there are any)
+DEMAND_SEASONAL_WEIGHT = float(os.getenv("DEMAND_SEASONAL_WEIGHT", "0.6"))
+
+BUCKET_SECONDS = DEMAND_BUCKET_MINUTES * 60
+BUCKETS_PER_DAY = 24 * 60 // DEMAND_BUCKET_MINUTES
+# One extra day so the oldest day compared never shares a slot with the buckets being forecast
+RING_SLOTS = (DEMAND_HISTORY_DAYS + 1) * BUCKETS_PER_DAY
+
+# Session.info key for (restaurant id, gate) of orders created in the current transaction
+_PENDING_KEY = "demand_pending"
+
+
+def bucket_of(timestamp: float) -> int:
+    return int(timestamp // BUCKET_SECONDS)
+
+
+class DemandSeries:
+    """Order counts per key (restaurant ID or (airport ID, gate)) in a ring of time buckets"""
+
+    def __init__(self):
+        self.index: Dict[Hashable, int] = {}
+        self.counts = np.zeros((0, RING_SLOTS), dtype=np.int32)
+
+    def row(self, key: Hashable) -> int:
+        i = self.index.get(key)
+        if i is None:
+            i = self.index[key] = len(self.index)
+            if i == len(self.counts):
+                grown = np.zeros((max(16, 2 * len(self.counts)), RING_SLOTS), dtype=np.int32)
+                grown[:i] = self.counts
+                self.counts = grown
+        return i
+
+    def add(self, keys: List[Hashable], buckets: np.ndarray):
+        rows = np.fromiter((self.row(key) for key in keys), dtype=np.int64, count=len(keys))
+        np.add.at(self.counts, (rows, buckets % RING_SLOTS), 1)
+
+    def clear(self, buckets: np.ndarray):
+        self.counts[:, buckets % RING_SLOTS] = 0
+
+    def take(self, keys: List[Hashable], buckets: np.ndarray) -> np.ndarray:
+        """counts[key, bucket] for keys x buckets (any shape); zero for keys never seen"""
+        rows = np.array([self.index.get(key, -1) for key in keys], dtype=np.int64)
+        known = rows >= 0
+        values = np.zeros((len(rows), *buckets.shape), dtype=np.int32)
+        values[known] = self.counts[rows[known]][:, buckets % RING_SLOTS]
+        return values
+
+
+class ShardDemand:
+    """Restaurant and gate demand rings for one shard"""
+
+    def __init__(self, places: Dict[int, Tuple[int, int]], now_bucket: int):
+        self.places = places  # restaurant id -> (terminal id, airport id)
+        self.restaurants = DemandSeries()
+        self.gates = DemandSeries()
+        self.latest = now_bucket
+        self.first = now_bucket  # oldest bucket with data, for how many past days exist
+        self.loaded_at = time.monotonic()
+        self.stale = False
+        self.read_through = 0  # highest order id read from the database
+        self.recorded_ids: Set[int] = set()  # orders above it counted by record()
+
+    def advance(self, bucket: int):
+        """Move the ring forward to bucket, emptying the slots it reuses"""
+        if bucket <= self.latest:
+            return
+        reused = np.arange(max(self.latest + 1, bucket - RING_SLOTS + 1), bucket + 1)
+        self.restaurants.clear(reused)
+        self.gates.clear(reused)
+        self.latest = bucket
+
+    def add(self, orders: List[Tuple[int, str]], buckets: np.ndarray) -> bool:
+        """Count orders (restaurant id, gate) in their buckets; False if a restaurant is unknown"""
+        keep = buckets > self.latest - DEMAND_HISTORY_DAYS * BUCKETS_PER_DAY
+        if not keep.all():
+            orders = [o for o, k in zip(orders, keep) if k]
+            buckets = buckets[keep]
+        if not orders:
+            return True
+        if any(restaurant_id not in self.places for restaurant_id, _ in orders):
+            return False
+        self.advance(int(buckets.max()))
+        self.first = min(self.first, int(buckets.min()))
+        self.restaurants.add([restaurant_id for restaurant_id, _ in orders], buckets)
+        self.gates.add([(self.places[restaurant_id][1], (gate or "").upper()) for restaurant_id, gate in orders], buckets)
+        return True
+
+
+class AirportForecast:
+    """Expected orders per bucket for an airport's restaurants and gates"""
+
+    def __init__(self, starts: List[datetime], restaurant_ids: List[int], terminal_ids: List[int],
+                 restaurants: np.ndarray, gates: List[str], gate_counts: np.ndarray, days: int):
+        self.starts = starts
+        self.restaurant_ids = restaurant_ids
+        self.terminal_ids = terminal_ids  # each restaurant's terminal
+        self.restaurants = restaurants  # len(restaurant_ids) x horizon
+        self.gates = gates
+        self.gate_counts = gate_counts  # len(gates) x horizon
+        self.days = days  # previous days the seasonal part was taken from
+
+    def payload(self) -> dict:
+        def rows(keys, values, name):
+            totals = values.sum(axis=1)
+            return [
+                {name: key, "expected_orders": round(float(total), 2), "per_bucket": np.round(row, 2).tolist()}
+                for key, row, total in sorted(zip(keys, values, totals), key=lambda r: -r[2])
+                if total > 0
+            ]
+
+        return {
+            "bucket_minutes": DEMAND_BUCKET_MINUTES,
+            "buckets": self.starts,
+            "history_days": self.days,
+            "expected_orders": round(float(self.restaurants.sum()), 2),
+            "restaurants": rows(self.restaurant_ids, self.restaurants, "restaurant_id"),
+            "gates": rows(self.gates, self.gate_counts, "gate"),
+        }
+
+
+def project(past: np.ndarray, recent: np.ndarray, days: int) -> np.ndarray:
+    """
+    Forecast from counts of the same buckets on previous days (keys x horizon x days)
+    and of the recent buckets, newest first (keys x recent)
+    """
+    ages = np.arange(recent.shape[1]) * DEMAND_BUCKET_MINUTES
+    weights = 0.5 ** (ages / DEMAND_LEVEL_HALFLIFE_MINUTES)
+    level = recent @ (weights / weights.sum())
+    horizon = past.shape[1]
+    if not days:
+        return np.repeat(level[:, None], horizon, axis=1)
+    seasonal = past.mean(axis=2)
+    return DEMAND_SEASONAL_WEIGHT * seasonal + (1 - DEMAND_SEASONAL_WEIGHT) * level[:, None]
+
+
+class DemandForecaster:
+    def __init__(self, rebuild_interval: float = DEMAND_REBUILD):
+        self.rebuild_interval = rebuild_interval
+        self._shards: Dict[str, ShardDemand] = {}
+        self._restored: Dict[str, ShardDemand] = {}  # from a snapshot, waiting for catch_up()
+        self._lock = threading.Lock()
+        self.rebuilt = 0
+        self.caught_up = 0
+        self.recorded = 0
+
+    def _current(self, db: Session) -> ShardDemand:
+        shard = self._shards.get(shard_of(db).name)
+        if shard is None or shard.stale or time.monotonic() - shard.loaded_at >= self.rebuild_interval:
+            shard = self.rebuild(db)
+        return shard
+
+    def rebuild(self, db: Session) -> ShardDemand:
+        """Re-read the shard's order history from the database"""
+        now_bucket = bucket_of(time.time())
+        fresh = ShardDemand(_places(db), now_bucket)
+        _count_orders(fresh, db, now_bucket)
+        with self._lock:
+            self._shards[shard_of(db).name] = fresh
+            self.rebuilt += 1
+        return fresh
+
+    def catch_up(self, db: Session) -> ShardDemand:
+        """
+        Bring the shard's rings restored from a snapshot up to date with the
+        orders created since; a full rebuild if there are none, or they don't
+        match this database
+        """
+        shard = self._restored.pop(shard_of(db).name, None)
+        if (
+            shard is None or _places(db) != shard.places
+            # Read further than this database goes: it was re-created since
+            or (db.query(func.max(Order.id)).scalar() or 0) < shard.read_through
+        ):
+            return self.rebuild(db)
+        now_bucket = bucket_of(time.time())
+        _count_orders(shard, db, now_bucket, after_id=shard.read_through, skip=shard.recorded_ids)
+        shard.loaded_at = time.monotonic()
+        with self._lock:
+            self._shards[shard_of(db).name] = shard
+            self.caught_up += 1
+        return shard
+
+    def record(self, shard_name: str, orders: List[Tuple[int, str]], at: float, order_ids: Iterable[int] = ()):
+        """Count newly committed orders (restaurant id, gate)"""
+        with self._lock:
+            shard = self._shards.get(shard_name)
+            if shard is None:
+                return  # not loaded yet; the first rebuild counts these
+            if shard.add(orders, np.full(len(orders), bucket_of(at), dtype=np.int64)):
+                self.recorded += len(orders)
+                shard.recorded_ids.update(i for i in order_ids if i > shard.read_through)
+            else:
+                shard.stale = True  # a restaurant added since the last rebuild
+
+    def dump(self) -> Tuple[dict, Dict[str, np.ndarray]]:
+        """Every shard's rings and how far they were read, for a warm-start snapshot"""
+        meta = {"bucket_seconds": BUCKET_SECONDS, "ring_slots": RING_SLOTS, "shards": {}}
+        arrays: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for name, shard in self._shards.items():
+                if shard.stale:
+                    continue
+                meta["shards"][name] = {
+                    "places": [[r, t, a] for r, (t, a) in shard.places.items()],
+                    "restaurants": list(shard.restaurants.index),
+                    "gates": [list(key) for key in shard.gates.index],
+                    "latest": shard.latest,
+                    "first": shard.first,
+                    "read_through": shard.read_through,
+                }
+                arrays[f"{name}/restaurants"] = shard.restaurants.counts[:len(shard.restaurants.index)].copy()
+                arrays[f"{name}/gates"] = shard.gates.counts[:len(shard.gates.index)].copy()
+                arrays[f"{name}/recorded"] = np.fromiter(shard.recorded_ids, dtype=np.int64)
+        return meta, arrays
+
+    def restore(self, meta: dict, arrays: Dict[str, np.ndarray]) -> int:
+        """Take rings from a snapshot (counts used in place, copied on write) until catch_up(); shards restored"""
+        if meta.get("bucket_seconds") != BUCKET_SECONDS or meta.get("ring_slots") != RING_SLOTS:
+            return 0  # bucketing changed since
+        restored = {}
+        for name, saved in meta["shards"].items():
+            shard = ShardDemand({r: (t, a) for r, t, a in saved["places"]}, saved["latest"])
+            shard.first = saved["first"]
+            shard.read_through = saved["read_through"]
+            shard.recorded_ids = set(arrays[f"{name}/recorded"].tolist())
+            shard.restaurants.index = {key: i for i, key in enumerate(saved["restaurants"])}
+            shard.restaurants.counts = arrays[f"{name}/restaurants"]
+            shard.gates.index = {tuple(key): i for i, key in enumerate(saved["gates"])}
+            shard.gates.counts = arrays[f"{name}/gates"]
+            restored[name] = shard
+        with self._lock:
+            self._restored = restored
+        return len(restored)
+
+    @traced()
+    def forecast(self, db: Session, airport_id: int, horizon_minutes: int, now: Optional[datetime] = None) -> AirportForecast:
+        """Expected orders per bucket from now for the airport's restaurants and gates"""
+        now = now or datetime.now(timezone.utc)
+        shard = self._current(db)
+        horizon = max(1, math.ceil(horizon_minutes / DEMAND_BUCKET_MINUTES))
+        now_bucket = bucket_of(now.timestamp())
+        restaurant_ids = sorted(r for r, (_, airport) in shard.places.items() if airport == airport_id)
+
+        with self._lock:
+            shard.advance(now_bucket)
+            gates = sorted(gate for airport, gate in shard.gates.index if airport == airport_id)
+            days = min(DEMAND_HISTORY_DAYS, (now_bucket - shard.first) // BUCKETS_PER_DAY)
+            # Same time on each previous day (horizon x days) and the last day, newest completed bucket first
+            targets = now_bucket + np.arange(horizon)
+            past = targets[:, None] - BUCKETS_PER_DAY * np.arange(1, days + 1)[None, :]
+            recent = now_bucket - 1 - np.arange(max(1, min(BUCKETS_PER_DAY, now_bucket - shard.first)))
+            series = [
+                (shard.restaurants, restaurant_ids),
+                (shard.gates, [(airport_id, gate) for gate in gates]),
+            ]
+            taken = [(s.take(keys, past), s.take(keys, recent)) for s, keys in series]
+
+        (r_past, r_recent), (g_past, g_recent) = taken
+        return AirportForecast(
+            [datetime.fromtimestamp(int(b) * BUCKET_SECONDS, timezone.utc) for b in targets],
+            restaurant_ids, [shard.places[r][0] for r in restaurant_ids], project(r_past, r_recent, days),
+            gates, project(g_past, g_recent, days),
+            days,
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "shards": {
+                    name: {
+                        "restaurants": len(shard.restaurants.index),
+                        "gates": len(shard.gates.index),
+                        "orders_in_window": int(shard.restaurants.counts.sum()),
+                        "age_seconds": round(time.monotonic() - shard.loaded_at, 1),
+                    }
+                    for name, shard in self._shards.items()
+                },
+                "bucket_minutes": DEMAND_BUCKET_MINUTES,
+                "history_days": DEMAND_HISTORY_DAYS,
+                "rebuilt": self.rebuilt,
+                "caught_up": self.caught_up,
+                "recorded": self.recorded,
+            }
+
+
+demand = DemandForecaster()
+
+
+def _places(db: Session) -> Dict[int, Tuple[int, int]]:
+    return {
+        restaurant_id: (terminal_id, airport_id)
+        for restaurant_id, terminal_id, airport_id in db.query(
+            Restaurant.id, Restaurant.terminal_id, Terminal.airport_id
+        ).join(Terminal)
+    }
+
+
+def _count_orders(shard: ShardDemand, db: Session, now_bucket: int, after_id: int = 0, skip: Set[int] = frozenset()):
+    """Add the window's orders with ids above after_id (except skip) and move read_through past them"""
+    cutoff = datetime.fromtimestamp((now_bucket - DEMAND_HISTORY_DAYS * BUCKETS_PER_DAY) * BUCKET_SECONDS, timezone.utc)
+    rows = db.query(Order.id, Order.restaurant_id, Order.boarding_gate, Order.created_at).filter(
+        Order.id > after_id, Order.created_at >= cutoff
+    ).all()
+    counted = [row for row in rows if row.id not in skip and row.restaurant_id in shard.places]
+    if counted:
+        buckets = np.array([bucket_of(as_utc(row.created_at).timestamp()) for row in counted], dtype=np.int64)
+        shard.add([(row.restaurant_id, row.boarding_gate) for row in counted], buckets)
+    shard.advance(now_bucket)
+    shard.read_through = max([after_id, *(row.id for row in rows)])
+    shard.recorded_ids = {i for i in shard.recorded_ids if i > shard.read_through}
+
+
+def _allocate(agents: int, weights: np.ndarray) -> np.ndarray:
+    """Split agents in proportion to weights (largest remainder)"""
+    if agents <= 0 or not len(weights):
+        return np.zeros(len(weights), dtype=int)
+    if weights.sum() <= 0:
+        weights = np.ones(len(weights))
+    shares = agents * weights / weights.sum()
+    counts = np.floor(shares).astype(int)
+    counts[np.argsort(counts - shares)[:agents - counts.sum()]] += 1
+    return counts
+
+
+def _stage(distances: np.ndarray, demand_weights: np.ndarray, agents: int) -> List[int]:
+    """
+    Greedy k-median: gate indexes (repeats allowed) for agents so that the
+    demand-weighted walk from the nearest staged agent to each restaurant is smallest
+    """
+    finite = np.isfinite(distances)
+    distances = np.where(finite, distances, distances[finite].max() * 10 if finite.any() else 1.0)
+    nearest = np.full(distances.shape[1], np.inf)
+    chosen = []
+    for _ in range(agents):
+        cost = (np.minimum(distances, nearest[None, :]) * demand_weights[None, :]).sum(axis=1)
+        best = int(np.argmin(cost))
+        chosen.append(best)
+        nearest = np.minimum(nearest, distances[best])
+    return chosen
+
+
+def _stage_terminal(distances: np.ndarray, weights: np.ndarray, agents: int) -> Tuple[List[int], Optional[float]]:
+    """Staged gate indexes and the resulting demand-weighted walk"""
+    chosen = _stage(distances, weights, agents)
+    nearest = distances[chosen].min(axis=0)
+    reachable = np.isfinite(nearest)
+    if not reachable.any():
+        return chosen, None
+    return chosen, float((nearest[reachable] * weights[reachable]).sum() / weights[reachable].sum())
+
+
+@compute.task("stage")
+def stage_terminal(
+    matrix: SharedArray, gate_indexes: np.ndarray, restaurant_indexes: np.ndarray, weights: np.ndarray, agents: int
+) -> Tuple[List[int], Optional[float]]:
+    """_stage_terminal() on rows/columns of a terminal's all-pairs matrix (-1: node not on the walkway)"""
+    distances = np.full((len(gate_indexes), len(restaurant_indexes)), np.inf)
+    rows, columns = gate_indexes >= 0, restaurant_indexes >= 0
+    distances[np.ix_(rows, columns)] = matrix.array[np.ix_(gate_indexes[rows], restaurant_indexes[columns])]
+    return _stage_terminal(distances, weights, agents)
+
+
+@traced()
+async def staging_plan(db: Session, airport_id: int, horizon_minutes: int, agents: Optional[int] = None,
+                       now: Optional[datetime] = None) -> dict:
+    """
+    Where idle agents should wait for the expected orders: how many per
+    terminal and at which gates. agents defaults to the airport's agents on
+    shift at its gates.
+    """
+    now = now or datetime.now(timezone.utc)
+    forecast = demand.forecast(db, airport_id, horizon_minutes, now)
+    gates = gate_terminals(db, airport_id)
+    if agents is None:
+        agents = sum(
+            on_shift(agent, now) for agent in db.query(DeliveryAgent).filter(
+                DeliveryAgent.status != AgentStatus.OFFLINE,
+                DeliveryAgent.airport_id == airport_id,
+                func.upper(DeliveryAgent.current_location).in_(list(gates))
+            )
+        )
+
+    transit = await prepare_airport_transit(db, airport_id)
+    expected = forecast.restaurants.sum(axis=1)
+    restaurant_terminals = np.array(forecast.terminal_ids, dtype=np.int64)
+    terminal_ids = sorted(set(restaurant_terminals.tolist()))
+    terminal_expected = np.array([expected[restaurant_terminals == t].sum() for t in terminal_ids])
+    allocation = _allocate(agents, terminal_expected)
+    names = dict(db.query(Terminal.id, Terminal.name).filter(Terminal.airport_id == airport_id))
+
+    terminals = []
+    for terminal_id, terminal_agents, terminal_orders in zip(terminal_ids, allocation, terminal_expected):
+        in_terminal = restaurant_terminals == terminal_id
+        restaurant_ids = [r for r, inside in zip(forecast.restaurant_ids, in_terminal) if inside]
+        terminal_gates = sorted(g for g, t in gates.items() if t == terminal_id)
+        graph = transit.graphs.get(terminal_id)
+        staged: Dict[str, int] = {}
+        walk = None
+        if terminal_agents and terminal_gates and graph is not None:
+            gate_keys = [gate_node(g) for g in terminal_gates]
+            restaurant_keys = [restaurant_node(r) for r in restaurant_ids]
+            # Every restaurant counts a little, so positions stay sensible with no history
+            weights = expected[in_terminal] + 1e-3
+            matrix = graph.shared_matrix()
+            if matrix is not None:
+                chosen, walk = await compute.run(
+                    "stage", matrix,
+                    np.array([graph.index.get(k, -1) for k in gate_keys], dtype=np.int64),
+                    np.array([graph.index.get(k, -1) for k in restaurant_keys], dtype=np.int64),
+                    weights, int(terminal_agents),
+                )
+            else:
+                chosen, walk = _stage_terminal(graph.distance_matrix(gate_keys, restaurant_keys), weights, int(terminal_agents))
+            for i in chosen:
+                staged[terminal_gates[i]] = staged.get(terminal_gates[i], 0) + 1
+        terminals.append({
+            "terminal_id": terminal_id,
+            "terminal_name": names.get(terminal_id),
+            "expected_orders": round(float(terminal_orders), 2),
+            "agents": int(terminal_agents),
+            "staging": [{"gate": gate, "agents": count} for gate, count in staged.items()],
+            "average_walk_minutes": round(walk * MINUTES_PER_UNIT, 1) if walk is not None else None,
+        })
+
+    return {
+        "horizon_minutes": horizon_minutes,
+        "from": forecast.starts[0],
+        "expected_orders": round(float(expected.sum()), 2),
+        "agents": agents,
+        "terminals": terminals,
+    }
+
+
+def _collect_new_orders(session: Session) -> List[Tuple[int, int, str]]:
+    return [(obj.id, obj.restaurant_id, obj.boarding_gate) for obj in session.new if isinstance(obj, Order)]
+
+
+def _record_new_orders(session: Session, orders: List[Tuple[int, int, str]]):
+    demand.record(
+        session.info.get("shard", DEFAULT_SHARD), [(r, gate) for _, r, gate in orders], time.time(),
+        [order_id for order_id, _, _ in orders]
+    )
+
+
+on_commit(_PENDING_KEY, _record_new_orders, collect=_collect_new_orders)
@@ -0,0 +1,157 @@
+"""
+Choosing which delivery agent picks up an order.
+
+Agents work in one airport (airport_id) and report their position as a gate
+number there (current_location); gate numbers repeat across airports, so the
+airport is always matched too. Only agents on shift, not offline and below
+their capacity can be given an order; their load comes from the in-memory
+counters in app.services.agent_load, and the order service re-checks it under
+a row lock. Idle agents in the order's airport are ranked by walkway distance
+to the restaurant, across terminals via the airport's transit model. When
+none is idle, the order can join a busy agent's trip that hasn't left yet, the
+least-loaded agents being preferred; failing that, an idle agent not placed
+in any airport yet takes it. Otherwise nobody is chosen and the order waits
+in the dispatch queue.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import numpy as np
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from app.models.airport import Terminal
+from app.models.delivery_agent import DeliveryAgent, AgentStatus
+from app.models.order import Order, OrderStatus
+from app.models.restaurant import Restaurant
+from app.services.agent_load import agent_load
+from app.services.routing import gate_node, restaurant_node
+from app.services.tracing import traced
+from app.services.transit import load_airport_transit
+from app.services.trips import ONBOARD_STATUSES, TRIP_BATCH_RADIUS, TRIP_MAX_ORDERS, gate_terminals
+
+
+def as_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    if moment is not None and moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)  # SQLite drops the zone
+    return moment
+
+
+def on_shift(agent: DeliveryAgent, now: datetime) -> bool:
+    start, end = as_utc(agent.shift_start), as_utc(agent.shift_end)
+    return agent.status != AgentStatus.OFFLINE and (start is None or start <= now) and (end is None or now < end)
+
+
+def idle_agents(db: Session, agents: List[DeliveryAgent], now: datetime) -> List[DeliveryAgent]:
+    """Agents on shift with no active orders"""
+    loads = agent_load.loads(db, [a.id for a in agents])
+    return [a for a in agents if on_shift(a, now) and a.capacity > 0 and loads[a.id] == 0]
+
+
+@traced()
+def choose_agent(db: Session, order: Order, allow_batching: bool, now: datetime) -> Optional[DeliveryAgent]:
+    """Who should take the order, or None if it has to wait"""
+    return (
+        nearest_available_agent(db, order, now)
+        or (allow_batching and batchable_agent(db, order, now))
+        or any_idle_agent(db, order_airport_id(db, order), now)
+    )
+
+
+def order_airport_id(db: Session, order: Order) -> Optional[int]:
+    return db.query(Terminal.airport_id).join(Restaurant).filter(Restaurant.id == order.restaurant_id).scalar()
+
+
+def nearest_available_agent(db: Session, order: Order, now: datetime) -> Optional[DeliveryAgent]:
+    """Closest idle agent standing at a gate in the order's airport, if any"""
+    restaurant = db.query(Restaurant.id, Restaurant.terminal_id, Terminal.airport_id).join(Terminal).filter(
+        Restaurant.id == order.restaurant_id
+    ).first()
+    if not restaurant:
+        return None
+
+    gates = gate_terminals(db, restaurant.airport_id)
+    agents = idle_agents(db, db.query(DeliveryAgent).filter(
+        DeliveryAgent.status != AgentStatus.OFFLINE,
+        DeliveryAgent.airport_id == restaurant.airport_id,
+        func.upper(DeliveryAgent.current_location).in_(list(gates))
+    ).all(), now)
+    if not agents:
+        return None
+
+    transit = load_airport_transit(db, restaurant.airport_id)
+    distances = transit.distances_to(
+        (restaurant.terminal_id, restaurant_node(restaurant.id)),
+        [(gates[a.current_location.upper()], gate_node(a.current_location)) for a in agents]
+    )
+    return agents[int(np.argmin(distances))]
+
+
+def any_idle_agent(db: Session, airport_id: Optional[int], now: datetime) -> Optional[DeliveryAgent]:
+    """
+    An idle agent in the airport at no known gate (those at a gate are ranked
+    by nearest_available_agent), else one not placed in any airport yet
+    """
+    agents = idle_agents(db, db.query(DeliveryAgent).filter(
+        DeliveryAgent.status != AgentStatus.OFFLINE,
+        or_(DeliveryAgent.airport_id == airport_id, DeliveryAgent.airport_id.is_(None))
+    ).order_by(DeliveryAgent.airport_id.is_(None), DeliveryAgent.id).all(), now)
+    return agents[0] if agents else None
+
+
+def batchable_agent(db: Session, order: Order, now: datetime) -> Optional[DeliveryAgent]:
+    """
+    A busy agent whose trip hasn't left yet and can take this order too: same
+    airport, on shift, below capacity, restaurant and gate near the trip's
+    stops. Detours are weighed by how loaded each agent already is.
+    """
+    restaurant = db.query(Restaurant.id, Restaurant.terminal_id, Terminal.airport_id).join(Terminal).filter(
+        Restaurant.id == order.restaurant_id
+    ).first()
+    gate = (order.boarding_gate or "").upper()
+    if not restaurant:
+        return None
+    gates = gate_terminals(db, restaurant.airport_id)
+    if gate not in gates:
+        return None
+
+    pending = db.query(Order.delivery_agent_id, Order.restaurant_id, Restaurant.terminal_id, Order.boarding_gate).join(
+        Restaurant
+    ).join(Terminal).filter(
+        Terminal.airport_id == restaurant.airport_id,
+        Order.status == OrderStatus.AGENT_ASSIGNED,
+        Order.delivery_agent_id.isnot(None),
+        Order.id != order.id
+    ).all()
+    if not pending:
+        return None
+    agent_ids = {row.delivery_agent_id for row in pending}
+    # Agents already carrying food have left; the rest must be on shift and have room
+    agents = {
+        agent.id: agent for agent in db.query(DeliveryAgent).filter(DeliveryAgent.id.in_(agent_ids))
+        if on_shift(agent, now)
+    }
+    load = agent_load.loads(db, agents)
+    onboard = {agent_id for (agent_id,) in db.query(Order.delivery_agent_id).filter(
+        Order.delivery_agent_id.in_(agent_ids), Order.status.in_(ONBOARD_STATUSES)
+    )}
+
+    transit = load_airport_transit(db, restaurant.airport_id)
+    pickups = transit.distances_from(
+        (restaurant.terminal_id, restaurant_node(restaurant.id)),
+        [(row.terminal_id, restaurant_node(row.restaurant_id)) for row in pending]
+    )
+    dropoffs = transit.distances_from(
+        (gates[gate], gate_node(gate)),
+        [(gates.get((row.boarding_gate or "").upper()), gate_node(row.boarding_gate or "")) for row in pending]
+    )
+    best: Dict[int, float] = {}
+    for row, pickup, dropoff in zip(pending, pickups, dropoffs):
+        agent_id = row.delivery_agent_id
+        agent = agents.get(agent_id)
+        if agent is None or agent_id in onboard or load[agent_id] >= min(agent.capacity, TRIP_MAX_ORDERS):
+            continue
+        if pickup <= TRIP_BATCH_RADIUS and dropoff <= TRIP_BATCH_RADIUS:
+            score = (pickup + dropoff) * (1 + load[agent_id] / agent.capacity)
+            best[agent_id] = min(best.get(agent_id, np.inf), score)
+    if not best:
+        return None
+    return agents[min(best, key=best.get)]
@@ -1,6 +1,10 @@
 import math
 from typing import Dict, Any
 
+# Rough estimate: 1 unit = 15 meters, walking speed = 5 km/h = 83 m/min
+# So 1 unit takes about 0.18 minutes
+MINUTES_PER_UNIT = 0.18
+
 
 def calculate_distance(point1: Dict[str, Any], point2: Dict[str, Any]) -> float:
     """
@@ -29,10 +33,10 @@ def calculate_walking_time(distance: float, walking_speed: float = 1.0) -> int:
     if distance == float('inf'):
         return 0
     
-    # Rough estimate: 1 unit = 15 meters, walking speed = 5 km/h = 83 m/min
-    # So 1 unit takes about 0.18 minutes
-    time_minutes = (distance * 0.18)
+    time_minutes = (distance * MINUTES_PER_UNIT)
     return max(1, int(time_minutes))  # At least 1 minute
 
 
-
+def minutes_to_distance(minutes: float) -> float:
+    """Inverse of calculate_walking_time: express a travel time in map units"""
+    return minutes / MINUTES_PER_UNIT
@@ -0,0 +1,108 @@
+"""
+Flight schedule feed.
+
+Loaded from a local JSON file (FLIGHT_SCHEDULE_PATH, default
+app/fixtures/flights.json):
+
+    {"flights": [
+        {"flight_number": "AA100", "airport": "JFK", "gate": "A10", "departure": "08:15"},
+        {"flight_number": "UA7", "airport": "SFO", "gate": "B2", "departure": "2026-10-19T21:05:00-07:00"}
+    ]}
+
+"departure" is either a daily local time at the airport or an absolute ISO
+timestamp. The file is re-read when its modification time changes, so an
+updated feed can be dropped in place without a restart.
+"""
+import os
+import orjson
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo
+
+FLIGHT_SCHEDULE_PATH = os.getenv(
+    "FLIGHT_SCHEDULE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "fixtures", "flights.json")
+)
+# Food should reach the gate this long before departure (boarding starts)
+DELIVERY_LEAD_MINUTES = float(os.getenv("FLIGHT_DELIVERY_LEAD_MINUTES", "30"))
+
+
+def normalize_flight_number(flight_number: Optional[str]) -> str:
+    return "".join((flight_number or "").split()).upper()
+
+
+class Flight:
+    __slots__ = ("flight_number", "airport", "gate", "departure")
+
+    def __init__(self, flight_number: str, airport: str, gate: Optional[str], departure: str):
+        self.flight_number = flight_number
+        self.airport = airport
+        self.gate = gate
+        self.departure = departure
+
+    def departs_at(self, tz_name: Optional[str], now: datetime) -> datetime:
+        """Departure as an aware datetime; daily times resolve to the next occurrence (an hour's grace for delays)"""
+        if "T" in self.departure:
+            departure = datetime.fromisoformat(self.departure)
+            return departure if departure.tzinfo else departure.replace(tzinfo=timezone.utc)
+        tz = ZoneInfo(tz_name) if tz_name else timezone.utc
+        hour, minute = (int(part) for part in self.departure.split(":")[:2])
+        local_now = now.astimezone(tz)
+        today = local_now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return next(
+            departure for departure in (today + timedelta(days=days) for days in (-1, 0, 1))
+            if departure >= local_now - timedelta(hours=1)
+        )
+
+
+class FlightSchedule:
+    def __init__(self, path: str):
+        self.path = path
+        self.version = 0
+        self._mtime: Optional[float] = None
+        # flight number -> airport code -> flight
+        self.flights: Dict[str, Dict[str, Flight]] = {}
+
+    def refresh(self) -> bool:
+        """Reload if the feed changed on disk; True when it did"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        flights: Dict[str, Dict[str, Flight]] = {}
+        if mtime is not None:
+            with open(self.path, "rb") as f:
+                for row in orjson.loads(f.read()).get("flights", []):
+                    number = normalize_flight_number(row.get("flight_number"))
+                    if number and row.get("departure"):
+                        flights.setdefault(number, {})[(row.get("airport") or "").upper()] = Flight(
+                            number, (row.get("airport") or "").upper(), row.get("gate"), row["departure"]
+                        )
+        self.flights = flights
+        self.version += 1
+        return True
+
+    def lookup(self, flight_number: Optional[str], airport_code: Optional[str] = None) -> Optional[Flight]:
+        if self.version == 0:
+            self.refresh()
+        by_airport = self.flights.get(normalize_flight_number(flight_number))
+        if not by_airport:
+            return None
+        if airport_code:
+            return by_airport.get(airport_code.upper())
+        return next(iter(by_airport.values()))
+
+    def delivery_deadline(
+        self, flight_number: Optional[str], airport_code: str, tz_name: Optional[str], now: datetime
+    ) -> Optional[datetime]:
+        """When food for this flight must be at the gate, or None if the flight isn't in the feed"""
+        flight = self.lookup(flight_number, airport_code)
+        if flight is None:
+            return None
+        return flight.departs_at(tz_name, now) - timedelta(minutes=DELIVERY_LEAD_MINUTES)
+
+
+schedule = FlightSchedule(FLIGHT_SCHEDULE_PATH)
@@ -0,0 +1,170 @@
+"""
+Gate-change ingest.
+
+A batch of (flight_number, new_gate[, airport]) updates is applied in one
+pass: a single query on ix_orders_flight_number finds every active order on
+the affected flights, one executemany UPDATE moves them, and the walking
+distance and ETA to the new gate are recomputed per airport in bulk.
+Broadcasting the results is left to the caller (the router), which owns the
+sockets. With several database shards the caller splits the batch with
+split_by_shard() and applies each part on its shard.
+"""
+import csv
+import itertools
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import orjson
+from sqlalchemy import bindparam, not_, update
+from sqlalchemy.orm import Session
+from app.database import Shard, all_shards, shard_for_airport
+from app.models.airport import Airport, Terminal
+from app.models.delivery_agent import DeliveryAgent
+from app.models.order import Order, OrderStatus
+from app.models.restaurant import Restaurant
+from app.schemas.flight import GateChange
+from app.services.flights import normalize_flight_number
+from app.services.order_cache import mark_changed
+from app.services.routing import gate_node, restaurant_node
+from app.services.scheduler import scheduler
+from app.services.tracing import traced
+from app.services.transit import load_airport_transit
+from app.services.trips import CLOSED_STATUSES, gate_terminals, plan_trip
+
+
+def parse_lines(lines: Iterable[str]) -> Iterator[dict]:
+    """
+    Rows from a CSV (header: flight_number,new_gate[,airport]) or NDJSON feed;
+    the format is detected from the first non-blank line
+    """
+    lines = (line.strip() for line in lines)
+    lines = (line for line in lines if line)
+    first = next(lines, None)
+    if first is None:
+        return
+    if first.startswith("{"):
+        yield orjson.loads(first)
+        for line in lines:
+            yield orjson.loads(line)
+    else:
+        yield from csv.DictReader(itertools.chain([first], lines))
+
+
+def split_by_shard(changes: Iterable[GateChange]) -> Dict[Shard, List[GateChange]]:
+    """Changes for one airport go to its shard; changes without an airport go to every shard"""
+    targets = all_shards()
+    by_shard: Dict[Shard, List[GateChange]] = {shard: [] for shard in targets}
+    for change in changes:
+        for shard in [shard_for_airport(change.airport)] if change.airport else targets:
+            by_shard[shard].append(change)
+    return {shard: shard_changes for shard, shard_changes in by_shard.items() if shard_changes}
+
+
+@traced()
+def apply_gate_changes(db: Session, changes: Iterable[GateChange], now: Optional[datetime] = None) -> dict:
+    """Move every active order on the changed flights to its new gate; returns what changed"""
+    now = now or datetime.now(timezone.utc)
+    # Last update wins per (flight, airport); airport None means "any airport"
+    latest: Dict[Tuple[str, Optional[str]], str] = {}
+    received = 0
+    for change in changes:
+        received += 1
+        flight = normalize_flight_number(change.flight_number)
+        if flight:
+            latest[(flight, change.airport.upper() if change.airport else None)] = change.new_gate.strip().upper()
+    result = {
+        "received": received,
+        "flights": len({flight for flight, _ in latest}),
+        "updates": [],
+        "unknown_gates": [],
+        "trips": {},  # agent id -> re-planned trip, for pushing to agent sockets
+    }
+    if not latest:
+        return result
+
+    # One indexed query for all affected orders
+    rows = db.query(
+        Order.id, Order.flight_number, Order.boarding_gate, Order.delivery_agent_id, Order.status,
+        Order.restaurant_id, Restaurant.terminal_id, Airport.id.label("airport_id"), Airport.code
+    ).join(Restaurant, Order.restaurant_id == Restaurant.id).join(Terminal).join(Airport).filter(
+        Order.flight_number.in_({flight for flight, _ in latest}),
+        not_(Order.status.in_(CLOSED_STATUSES))
+    ).all()
+
+    moved = []
+    for row in rows:
+        new_gate = latest.get((row.flight_number, row.code)) or latest.get((row.flight_number, None))
+        if new_gate and new_gate != (row.boarding_gate or "").upper():
+            moved.append((row, new_gate))
+    if not moved:
+        return result
+
+    # One executemany; each row's version is bumped so concurrent writers see the change.
+    # An order delivered or cancelled since the query above is left alone.
+    orders = Order.__table__
+    db.execute(
+        update(orders).where(
+            orders.c.id == bindparam("order_id"), orders.c.status.notin_(CLOSED_STATUSES)
+        ).values(boarding_gate=bindparam("new_gate"), updated_at=now, version=orders.c.version + 1),
+        [{"order_id": row.id, "new_gate": new_gate} for row, new_gate in moved]
+    )
+    # Rows the UPDATE skipped are closed; those it moved stay locked until the commit
+    still_open = {order_id for (order_id,) in db.query(Order.id).filter(
+        Order.id.in_([row.id for row, _ in moved]), not_(Order.status.in_(CLOSED_STATUSES))
+    )}
+    moved = [(row, new_gate) for row, new_gate in moved if row.id in still_open]
+    # The bulk UPDATE bypasses the unit of work, so name the orders for the cache
+    mark_changed(db, [row.id for row, _ in moved])
+    db.commit()
+
+    # Walking distance from each restaurant to its orders' new gate, one bulk lookup per restaurant
+    by_airport: Dict[int, List[Tuple[object, str]]] = {}
+    for row, new_gate in moved:
+        by_airport.setdefault(row.airport_id, []).append((row, new_gate))
+    distances: Dict[int, Optional[float]] = {}
+    unknown = set()
+    for airport_id, airport_moves in by_airport.items():
+        transit = load_airport_transit(db, airport_id)
+        gates = gate_terminals(db, airport_id)
+        by_restaurant: Dict[Tuple[int, int], List[Tuple[object, str]]] = {}
+        for row, new_gate in airport_moves:
+            if new_gate not in gates:
+                unknown.add((row.code, new_gate))
+            by_restaurant.setdefault((row.terminal_id, row.restaurant_id), []).append((row, new_gate))
+        for (terminal_id, restaurant_id), restaurant_moves in by_restaurant.items():
+            found = transit.distances_from(
+                (terminal_id, restaurant_node(restaurant_id)),
+                [(gates.get(new_gate), gate_node(new_gate)) for _, new_gate in restaurant_moves]
+            )
+            for (row, _), distance in zip(restaurant_moves, found.tolist()):
+                distances[row.id] = round(distance, 2) if distance != float("inf") else None
+
+    # ETAs: re-plan each affected agent's trip once; waiting orders get new deadlines
+    etas: Dict[int, datetime] = {}
+    trips: Dict[int, dict] = {}
+    agent_ids = {row.delivery_agent_id for row, _ in moved if row.delivery_agent_id}
+    for agent in db.query(DeliveryAgent).filter(DeliveryAgent.id.in_(agent_ids)):
+        trips[agent.id] = plan_trip(db, agent, now)
+        for stop in trips[agent.id]["stops"]:
+            if stop["action"] == "dropoff":
+                etas[stop["order_id"]] = stop["eta"]
+    waiting = [row.id for row, _ in moved if row.status == OrderStatus.ORDER_PLACED and not row.delivery_agent_id]
+    if waiting:
+        scheduler.reprioritize(db, waiting, now)
+
+    result["updates"] = [
+        {
+            "order_id": row.id,
+            "flight_number": row.flight_number,
+            "airport": row.code,
+            "previous_gate": row.boarding_gate,
+            "new_gate": new_gate,
+            "delivery_agent_id": row.delivery_agent_id,
+            "distance_to_gate": distances.get(row.id),
+            "eta": etas.get(row.id),
+        }
+        for row, new_gate in moved
+    ]
+    result["unknown_gates"] = [{"airport": code, "gate": gate} for code, gate in sorted(unknown)]
+    result["trips"] = trips
+    return result
+
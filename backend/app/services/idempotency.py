@@ -0,0 +1,290 @@
+"""
+Idempotency-Key support for retried writes.
+
+A POST/PUT/PATCH/DELETE sent with an Idempotency-Key header runs once; its
+response (status, headers, body) is stored for IDEMPOTENCY_TTL seconds and
+replayed, with an Idempotent-Replayed header, for every retry with the same
+key. Keys are scoped only to the method and path: requests carry no caller
+identity, so clients must make keys globally unique (a random UUID per
+logical request, reused by its retries). A retry must send the same query
+string and body, otherwise it is rejected with 422.
+
+Completed responses are kept in a bounded in-memory LRU, so a retry storm on
+one worker is answered without any database I/O; the idempotency_keys table
+(in the default database shard) is the fallback shared by all workers. The
+first request reserves its key with an INSERT, so a concurrent duplicate on
+any worker gets 409 instead of running twice. A reservation whose request crashed is taken over after
+IDEMPOTENCY_LOCK_TIMEOUT seconds. 5xx responses and exceptions release the
+key so the client can retry for real.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from app.database import SessionLocal
+from app.models.idempotency import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "60"))
+# Larger responses are sent but not stored (the key is released)
+IDEMPOTENCY_MAX_BODY = int(os.getenv("IDEMPOTENCY_MAX_BODY", str(256 * 1024)))
+PURGE_INTERVAL = 300.0
+MAX_KEY_LENGTH = 255
+
+METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+class StoredResponse:
+    __slots__ = ("fingerprint", "status_code", "headers", "body", "expires_at")
+
+    def __init__(
+        self, fingerprint: str, status_code: Optional[int], headers: List[List[str]],
+        body: bytes, expires_at: float
+    ):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_row(cls, row: IdempotencyKey) -> "StoredResponse":
+        return cls(row.fingerprint, row.status_code, row.headers or [], row.body or b"", row.expires_at)
+
+
+class IdempotencyStore:
+    def __init__(self, maxsize: int = IDEMPOTENCY_CACHE_SIZE, ttl: float = IDEMPOTENCY_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self.replays = 0
+        self.stored = 0
+        self.conflicts = 0
+
+    def cached(self, key: str) -> Optional[StoredResponse]:
+        """Completed response from memory (no I/O)"""
+        with self._lock:
+            stored = self._entries.get(key)
+            if stored is None:
+                return None
+            if stored.expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return stored
+
+    def _remember(self, key: str, stored: StoredResponse):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = stored
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def reserve(self, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """
+        Claim key for a first run (returns None), or return what is stored
+        under it: a completed response, or one with status_code None while the
+        first request is still running
+        """
+        now = time.time()
+        db = SessionLocal()
+        try:
+            row = db.get(IdempotencyKey, key)
+            if row is not None and row.expires_at > now and (
+                row.status_code is not None or row.created_at > now - IDEMPOTENCY_LOCK_TIMEOUT
+            ):
+                return self._existing(key, row)
+            if row is not None:
+                # Expired, or its request never finished: start over
+                db.delete(row)
+                db.flush()
+            db.add(IdempotencyKey(key=key, fingerprint=fingerprint, created_at=now, expires_at=now + self.ttl))
+            db.commit()
+            return None
+        except IntegrityError:
+            # Another worker reserved it between our read and insert
+            db.rollback()
+            row = db.get(IdempotencyKey, key)
+            if row is None:
+                return StoredResponse(fingerprint, None, [], b"", now + IDEMPOTENCY_LOCK_TIMEOUT)
+            return self._existing(key, row)
+        finally:
+            db.close()
+
+    def _existing(self, key: str, row: IdempotencyKey) -> StoredResponse:
+        stored = StoredResponse.from_row(row)
+        if stored.status_code is not None:
+            self._remember(key, stored)
+        return stored
+
+    def complete(self, key: str, fingerprint: str, status_code: int, headers: List[List[str]], body: bytes):
+        now = time.time()
+        stored = StoredResponse(fingerprint, status_code, headers, body, now + self.ttl)
+        db = SessionLocal()
+        try:
+            db.merge(IdempotencyKey(
+                key=key, fingerprint=fingerprint, status_code=status_code, headers=headers, body=body,
+                created_at=now, expires_at=stored.expires_at
+            ))
+            db.commit()
+            if now - self._last_purge >= PURGE_INTERVAL:
+                self._last_purge = now
+                db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= now))
+                db.commit()
+        finally:
+            db.close()
+        self._remember(key, stored)
+        self.stored += 1
+
+    def release(self, key: str):
+        db = SessionLocal()
+        try:
+            db.execute(delete(IdempotencyKey).where(
+                IdempotencyKey.key == key, IdempotencyKey.status_code.is_(None)
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "cached": size,
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "stored": self.stored,
+            "replays": self.replays,
+            "conflicts": self.conflicts,
+        }
+
+
+store = IdempotencyStore()
+
+
+def _digest(*parts: bytes) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(len(part).to_bytes(8, "big"))
+        h.update(part)
+    return h.hexdigest()
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware; requests without the header pass straight through"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in METHODS:
+            await self.app(scope, receive, send)
+            return
+        request_headers = dict(scope["headers"])
+        client_key = request_headers.get(b"idempotency-key")
+        if client_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not client_key or len(client_key) > MAX_KEY_LENGTH:
+            await ORJSONResponse(
+                status_code=400, content={"detail": f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters"}
+            )(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        key = _digest(scope["method"].encode(), scope["path"].encode(), client_key)
+        fingerprint = _digest(scope.get("query_string", b""), body)
+
+        stored = store.cached(key)
+        if stored is None:
+            stored = await run_in_threadpool(store.reserve, key, fingerprint)
+        if stored is not None:
+            await self._answer_retry(stored, fingerprint, scope, receive, send)
+            return
+
+        start: dict = {}
+        chunks: List[bytes] = []
+        size = 0
+
+        async def capture(message):
+            nonlocal size
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body" and size <= IDEMPOTENCY_MAX_BODY:
+                chunks.append(message.get("body", b""))
+                size += len(chunks[-1])
+            await send(message)
+
+        try:
+            await self.app(scope, _replay(body, receive), capture)
+        except BaseException:
+            await run_in_threadpool(store.release, key)
+            raise
+        status_code = start.get("status", 500)
+        if status_code >= 500 or size > IDEMPOTENCY_MAX_BODY:
+            await run_in_threadpool(store.release, key)
+            return
+        headers = [[name.decode("latin-1"), value.decode("latin-1")] for name, value in start.get("headers", [])]
+        await run_in_threadpool(store.complete, key, fingerprint, status_code, headers, b"".join(chunks))
+
+    async def _answer_retry(self, stored: StoredResponse, fingerprint: str, scope, receive, send):
+        if stored.fingerprint != fingerprint:
+            store.conflicts += 1
+            await ORJSONResponse(
+                status_code=422,
+                content={"detail": f"{IDEMPOTENCY_HEADER} was already used for a different request"}
+            )(scope, receive, send)
+            return
+        if stored.status_code is None:
+            store.conflicts += 1
+            await ORJSONResponse(
+                status_code=409,
+                content={"detail": f"A request with this {IDEMPOTENCY_HEADER} is still in progress"},
+                headers={"Retry-After": "1"},
+            )(scope, receive, send)
+            return
+        store.replays += 1
+        headers: List[Tuple[bytes, bytes]] = [
+            (name.encode("latin-1"), value.encode("latin-1")) for name, value in stored.headers
+        ]
+        headers.append((REPLAYED_HEADER.lower().encode(), b"true"))
+        await send({"type": "http.response.start", "status": stored.status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": stored.body})
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+def _replay(body: bytes, receive):
+    """receive() that hands the buffered body to the app, then defers to the client"""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+    return replay
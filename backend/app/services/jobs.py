@@ -0,0 +1,250 @@
+"""
+In-process background jobs for post-commit side effects.
+
+Handlers commit, enqueue() what should happen afterwards (broadcasts,
+notifications, recomputation) and return. Jobs go through an asyncio queue
+to JOB_WORKERS worker tasks; coroutine functions run on the event loop and
+plain functions (blocking DB work) in a bounded thread pool.
+
+- Jobs sharing a key run one at a time in enqueue order (e.g. the updates
+  for one order reach its tracking page in sequence).
+- A failing job is retried with exponential backoff up to its retry limit,
+  then logged and dropped.
+- When the queue is full enqueue() refuses the job (returns False) rather
+  than letting memory grow.
+- stop() stops taking jobs and drains what is queued, waiting and retrying
+  for up to JOB_DRAIN_TIMEOUT seconds.
+
+Jobs are not persisted: anything still queued when a worker is killed is lost,
+so only idempotent or best-effort work belongs here.
+
+A job runs as a child span of whatever span enqueued it (see
+app.services.tracing), so background work shows up in the request's trace.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Hashable, Optional, Set
+import numpy as np
+from app.services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_THREADS = int(os.getenv("JOB_THREADS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "10000"))
+JOB_RETRIES = int(os.getenv("JOB_RETRIES", "3"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "0.5"))  # seconds, doubled per attempt
+JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "10"))
+# Recent jobs kept for the latency percentiles
+LATENCY_WINDOW = 1000
+
+
+class Job:
+    __slots__ = ("name", "func", "args", "kwargs", "key", "retries", "attempts", "enqueued_at", "trace")
+
+    def __init__(self, func: Callable, args: tuple, kwargs: dict, name: str, key: Optional[Hashable], retries: int):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.name = name
+        self.key = key
+        self.retries = retries
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+        self.trace = tracer.current()
+
+
+class JobRunner:
+    def __init__(
+        self, workers: int = JOB_WORKERS, threads: int = JOB_THREADS, max_queued: int = JOB_QUEUE_SIZE
+    ):
+        self.workers = workers
+        self.threads = threads
+        self.max_queued = max_queued
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._waiting: Dict[Hashable, Deque[Job]] = {}  # key -> jobs behind the one queued/running
+        self._busy_keys: Set[Hashable] = set()
+        self._pending = 0  # queued + waiting on a key + running + awaiting retry
+        self._idle: Optional[asyncio.Event] = None
+        self._accepting = False
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected = 0
+        self._wait_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._run_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    @property
+    def started(self) -> bool:
+        return self._loop is not None
+
+    def start(self):
+        """Start the workers on the running event loop"""
+        if self.started:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="job")
+        self._tasks = [self._loop.create_task(self._work()) for _ in range(self.workers)]
+        self._accepting = True
+
+    async def stop(self, timeout: float = JOB_DRAIN_TIMEOUT):
+        """Refuse new jobs, finish the pending ones (up to timeout), then stop the workers"""
+        if not self.started:
+            return
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Job runner stopped with %d jobs unfinished", self._pending)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._tasks = []
+        self._loop = self._queue = self._idle = self._executor = None
+        self._waiting.clear()
+        self._busy_keys.clear()
+        self._pending = 0
+
+    def enqueue(
+        self, func: Callable, *args, key: Optional[Hashable] = None, retries: int = JOB_RETRIES,
+        name: Optional[str] = None, **kwargs
+    ) -> bool:
+        """
+        Run func(*args, **kwargs) in the background; False if the job was
+        refused (queue full or shutting down). Safe to call from any thread.
+        Before start() (scripts, tests without the app lifespan) the job runs
+        right away instead.
+        """
+        job = Job(func, args, kwargs, name or getattr(func, "__qualname__", repr(func)), key, retries)
+        if not self.started:
+            return self._run_now(job)
+        if not self._accepting or self._pending >= self.max_queued:
+            self.rejected += 1
+            logger.warning("Job %s refused: %s", job.name, "queue full" if self._accepting else "shutting down")
+            return False
+        if _on_loop(self._loop):
+            self._submit(job)
+        else:
+            self._loop.call_soon_threadsafe(self._submit, job)
+        return True
+
+    def _run_now(self, job: Job) -> bool:
+        try:
+            result = job.func(*job.args, **job.kwargs)
+            if inspect.isawaitable(result):
+                try:
+                    asyncio.get_running_loop().create_task(result)
+                except RuntimeError:
+                    asyncio.run(result)
+            return True
+        except Exception:
+            logger.exception("Job %s failed", job.name)
+            return False
+
+    def _submit(self, job: Job):
+        self._pending += 1
+        self._idle.clear()
+        if job.key is not None:
+            if job.key in self._busy_keys:
+                self._waiting.setdefault(job.key, deque()).append(job)
+                return
+            self._busy_keys.add(job.key)
+        self._queue.put_nowait(job)
+
+    def _finish(self, job: Job):
+        """A job is done for good: release its key to the next job waiting on it"""
+        if job.key is not None:
+            waiting = self._waiting.get(job.key)
+            if waiting:
+                self._queue.put_nowait(waiting.popleft())
+                if not waiting:
+                    del self._waiting[job.key]
+            else:
+                self._busy_keys.discard(job.key)
+        self._pending -= 1
+        if self._pending == 0:
+            self._idle.set()
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            if job.attempts == 0:
+                self._wait_ms.append((time.monotonic() - job.enqueued_at) * 1000)
+            job.attempts += 1
+            self.running += 1
+            started = time.monotonic()
+            try:
+                with tracer.span(f"job {job.name}", "consumer", {
+                    "job.attempt": job.attempts, "job.queue_wait_ms": round((started - job.enqueued_at) * 1000, 2),
+                }, parent=job.trace):
+                    if inspect.iscoroutinefunction(job.func):
+                        await job.func(*job.args, **job.kwargs)
+                    else:
+                        # The executor doesn't carry context variables (the job's span) over by itself
+                        await self._loop.run_in_executor(self._executor, functools.partial(
+                            contextvars.copy_context().run, job.func, *job.args, **job.kwargs
+                        ))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if job.attempts <= job.retries:
+                    delay = JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+                    logger.warning("Job %s failed (attempt %d), retrying in %.1fs", job.name, job.attempts, delay, exc_info=True)
+                    self.retried += 1
+                    # Keeps its key (and its place in the pending count) while it waits
+                    self._loop.call_later(delay, self._queue.put_nowait, job)
+                else:
+                    logger.exception("Job %s failed after %d attempts", job.name, job.attempts)
+                    self.failed += 1
+                    self._finish(job)
+            else:
+                self.completed += 1
+                self._finish(job)
+            finally:
+                self.running -= 1
+                self._run_ms.append((time.monotonic() - started) * 1000)
+
+    def stats(self) -> dict:
+        def percentiles(samples):
+            if not samples:
+                return None
+            p50, p95, p100 = np.percentile(np.fromiter(samples, float), [50, 95, 100])
+            return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "max": round(float(p100), 2)}
+        return {
+            "started": self.started,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "waiting_on_key": sum(len(jobs) for jobs in self._waiting.values()),
+            "pending": self._pending,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rejected": self.rejected,
+            "queue_wait_ms": percentiles(self._wait_ms),
+            "run_ms": percentiles(self._run_ms),
+        }
+
+
+def _on_loop(loop: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+jobs = JobRunner()
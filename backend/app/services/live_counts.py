@@ -0,0 +1,295 @@
+"""
+Live table counters for dashboards and the seed checks.
+
+Rather than COUNT(*) over whole tables on every refresh, each worker keeps
+per shard: the airports, restaurants and agents that exist, agents per
+status, and orders per airport and status. A transaction that writes them
+updates the counters when it commits: ORM flushes are seen directly, and
+status changes made with a bulk UPDATE (compare_and_set) report through
+note_order_status(). Reads only sum counters.
+
+Every change is recorded as the new state of one row (order 7 is now
+DELIVERED) rather than as a delta, so applying it twice is harmless. That
+lets reconcile() re-read everything from the database and then replay the
+changes committed while it was reading. A background task reconciles every
+LIVE_COUNTS_RECONCILE seconds, which also picks up other workers' writes.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, inspect, not_
+from sqlalchemy.orm import Session
+from app.database import DEFAULT_SHARD, Shard, all_shards, on_commit, scatter, shard_of, stash
+from app.models.airport import Airport, Terminal
+from app.models.delivery_agent import DeliveryAgent, AgentStatus
+from app.models.order import Order, OrderStatus
+from app.models.restaurant import Restaurant
+from app.services.trips import CLOSED_STATUSES
+
+logger = logging.getLogger(__name__)
+
+LIVE_COUNTS_RECONCILE = float(os.getenv("LIVE_COUNTS_RECONCILE", "60"))
+
+# Session.info key for (kind, row id, new state...) written in the current transaction
+_PENDING_KEY = "live_counts_pending"
+
+Change = Tuple
+
+
+def _bump(counts: dict, key, delta: int):
+    counts[key] = counts.get(key, 0) + delta
+    if not counts[key]:
+        del counts[key]
+
+
+class ShardCounts:
+    """Counters for one shard, and the rows needed to apply changes idempotently"""
+
+    def __init__(self):
+        self.airports: Dict[int, str] = {}  # airport id -> code
+        self.terminals: Dict[int, int] = {}  # terminal id -> airport id
+        self.restaurants: Dict[int, Optional[int]] = {}  # restaurant id -> airport id
+        self.agents: Dict[int, AgentStatus] = {}
+        self.agent_counts: Dict[AgentStatus, int] = {}
+        self.orders: Dict[int, Tuple[Optional[int], OrderStatus]] = {}  # active order id -> (airport id, status)
+        self.order_counts: Dict[Tuple[Optional[int], OrderStatus], int] = {}
+        self.unattributed = 0  # closed orders this worker never saw open
+        self.reconciled_at = time.time()
+
+    def apply(self, change: Change):
+        kind, row_id = change[0], change[1]
+        if kind == "airport":
+            if change[2] is None:
+                self.airports.pop(row_id, None)
+            else:
+                self.airports[row_id] = change[2]
+        elif kind == "terminal":
+            if change[2] is None:
+                self.terminals.pop(row_id, None)
+            else:
+                self.terminals[row_id] = change[2]
+        elif kind == "restaurant":
+            if change[2] is None:
+                self.restaurants.pop(row_id, None)
+            else:
+                self.restaurants[row_id] = self.terminals.get(change[2])
+        elif kind == "agent":
+            old = self.agents.pop(row_id, None)
+            if old is not None:
+                _bump(self.agent_counts, old, -1)
+            if change[2] is not None:
+                self.agents[row_id] = change[2]
+                _bump(self.agent_counts, change[2], 1)
+        elif kind == "order":
+            self._set_order(row_id, change[2], change[3])
+
+    def _set_order(self, order_id: int, status: Optional[OrderStatus], restaurant_id: Optional[int]):
+        current = self.orders.pop(order_id, None)
+        if current is not None:
+            airport_id = current[0]
+            _bump(self.order_counts, current, -1)
+        elif restaurant_id is not None:
+            airport_id = self.restaurants.get(restaurant_id)
+        elif status in CLOSED_STATUSES:
+            # Already closed when last read, or opened by another worker since
+            self.unattributed += 1
+            return
+        else:
+            return
+        if status is None:
+            return  # deleted
+        _bump(self.order_counts, (airport_id, status), 1)
+        if status not in CLOSED_STATUSES:
+            self.orders[order_id] = (airport_id, status)
+
+
+def read_shard_counts(db: Session) -> ShardCounts:
+    """Everything counted, from the database"""
+    counts = ShardCounts()
+    counts.airports = dict(db.query(Airport.id, Airport.code))
+    counts.terminals = dict(db.query(Terminal.id, Terminal.airport_id))
+    counts.restaurants = {
+        restaurant_id: counts.terminals.get(terminal_id)
+        for restaurant_id, terminal_id in db.query(Restaurant.id, Restaurant.terminal_id)
+    }
+    for agent_id, status in db.query(DeliveryAgent.id, DeliveryAgent.status):
+        counts.apply(("agent", agent_id, status))
+    for order_id, restaurant_id, status in db.query(Order.id, Order.restaurant_id, Order.status).filter(
+        not_(Order.status.in_(CLOSED_STATUSES))
+    ):
+        counts.apply(("order", order_id, status, restaurant_id))
+    # Closed orders only need their totals
+    for airport_id, status, count in db.query(Terminal.airport_id, Order.status, func.count(Order.id)).select_from(
+        Order
+    ).join(Restaurant).join(Terminal).filter(Order.status.in_(CLOSED_STATUSES)).group_by(
+        Terminal.airport_id, Order.status
+    ):
+        counts.order_counts[(airport_id, status)] = count
+    return counts
+
+
+def _totals(loaded: List[ShardCounts]) -> dict:
+    return {
+        "airports": sum(len(s.airports) for s in loaded),
+        "restaurants": sum(len(s.restaurants) for s in loaded),
+        "agents": sum(len(s.agents) for s in loaded),
+    }
+
+
+class LiveCounts:
+    def __init__(self, reconcile_interval: float = LIVE_COUNTS_RECONCILE):
+        self.reconcile_interval = reconcile_interval
+        self._shards: Dict[str, ShardCounts] = {}
+        # shard name -> changes committed while it is being re-read
+        self._replay: Dict[str, List[Change]] = {}
+        self._reconciling: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.reconciled = 0
+        self.applied = 0
+
+    def reconcile(self, db: Session):
+        """Re-read db's shard, keeping changes committed meanwhile"""
+        name = shard_of(db).name
+        with self._lock:
+            reconciling = self._reconciling.setdefault(name, threading.Lock())
+        with reconciling:  # one re-read per shard at a time (background task vs. first request)
+            with self._lock:
+                self._replay[name] = []
+            try:
+                fresh = read_shard_counts(db)
+            except Exception:
+                with self._lock:
+                    del self._replay[name]
+                raise
+            with self._lock:
+                for change in self._replay.pop(name):
+                    fresh.apply(change)
+                self._shards[name] = fresh
+                self.reconciled += 1
+
+    def reconcile_all(self, targets: Optional[List[Shard]] = None):
+        scatter(self.reconcile, targets)
+
+    def apply(self, shard_name: str, changes: List[Change]):
+        with self._lock:
+            replay = self._replay.get(shard_name)
+            if replay is not None:
+                replay.extend(changes)
+            shard = self._shards.get(shard_name)
+            if shard is None:
+                return  # not read yet; the first reconcile counts these
+            for change in changes:
+                shard.apply(change)
+            self.applied += len(changes)
+
+    def _loaded(self) -> List[ShardCounts]:
+        missing = [shard for shard in all_shards() if shard.name not in self._shards]
+        if missing:
+            self.reconcile_all(missing)  # first read on this worker
+        return [self._shards[shard.name] for shard in all_shards()]
+
+    def totals(self) -> dict:
+        """Airport, restaurant and agent counts summed across every shard"""
+        loaded = self._loaded()
+        with self._lock:
+            return _totals(loaded)
+
+    def snapshot(self) -> dict:
+        """Totals, agents per status and orders per airport and status"""
+        loaded = self._loaded()
+        with self._lock:
+            agents: Dict[str, int] = {}
+            airports: Dict[str, Dict[str, int]] = {}
+            active = 0
+            for shard in loaded:
+                for status, count in shard.agent_counts.items():
+                    agents[status.value] = agents.get(status.value, 0) + count
+                for (airport_id, status), count in shard.order_counts.items():
+                    by_status = airports.setdefault(shard.airports.get(airport_id, "unknown"), {})
+                    by_status[status.value] = by_status.get(status.value, 0) + count
+                active += len(shard.orders)
+            return {
+                **_totals(loaded),
+                "active_orders": active,
+                "agents_by_status": agents,
+                "orders_by_airport": airports,
+                "oldest_reconcile_seconds": round(time.time() - min(s.reconciled_at for s in loaded), 1),
+                "unattributed_orders": sum(s.unattributed for s in loaded),
+                "reconciled": self.reconciled,
+                "applied": self.applied,
+            }
+
+    def start(self, interval: Optional[float] = None):
+        """Reconcile every shard periodically in the background"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(interval or self.reconcile_interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self, interval: float):
+        while True:
+            try:
+                await asyncio.to_thread(self.reconcile_all)
+            except Exception:
+                logger.exception("Live count reconciliation failed")
+            await asyncio.sleep(interval)
+
+
+live_counts = LiveCounts()
+
+
+def note_order_status(db: Session, order_id: int, status: OrderStatus):
+    """Count the order under its new status when db commits (for bulk UPDATEs the session doesn't track)"""
+    stash(db, _PENDING_KEY, [("order", order_id, status, None)])
+
+
+# Parents first, so a restaurant added with its terminal finds the terminal's airport
+_KIND_ORDER = {"airport": 0, "terminal": 1, "restaurant": 2, "agent": 3, "order": 4}
+
+
+def _row_changes(obj, new: bool, deleted: bool) -> List[Change]:
+    if isinstance(obj, Order):
+        if deleted:
+            return [("order", obj.id, None, None)]
+        if new or inspect(obj).attrs.status.history.has_changes():
+            return [("order", obj.id, obj.status, obj.restaurant_id)]
+    elif isinstance(obj, DeliveryAgent):
+        if deleted or new or inspect(obj).attrs.status.history.has_changes():
+            return [("agent", obj.id, None if deleted else obj.status)]
+    elif isinstance(obj, Restaurant):
+        return [("restaurant", obj.id, None if deleted else obj.terminal_id)]
+    elif isinstance(obj, Terminal):
+        return [("terminal", obj.id, None if deleted else obj.airport_id)]
+    elif isinstance(obj, Airport):
+        return [("airport", obj.id, None if deleted else obj.code)]
+    return []
+
+
+def _collect_count_changes(session: Session) -> List[Change]:
+    changes = []
+    for obj in session.new:
+        changes.extend(_row_changes(obj, new=True, deleted=False))
+    for obj in session.dirty:
+        changes.extend(_row_changes(obj, new=False, deleted=False))
+    for obj in session.deleted:
+        changes.extend(_row_changes(obj, new=False, deleted=True))
+    changes.sort(key=lambda change: _KIND_ORDER[change[0]])
+    return changes
+
+
+on_commit(
+    _PENDING_KEY,
+    lambda session, changes: live_counts.apply(session.info.get("shard", DEFAULT_SHARD), changes),
+    collect=_collect_count_changes,
+)
@@ -0,0 +1,306 @@
+"""
+Customer notifications.
+
+Order updates (status changes, the delivery OTP at pickup, gate changes) are
+sent to Order.user_contact: email when it contains "@", SMS otherwise. Each
+channel is served by a provider chosen with NOTIFY_EMAIL_PROVIDER /
+NOTIFY_SMS_PROVIDER:
+
+    log      JSON lines to NOTIFY_LOG_PATH, or stdout when unset (default)
+    webhook  POST {"to", "channel", "subject", "text"} to NOTIFY_<CHANNEL>_WEBHOOK_URL
+
+More can be added with register_provider().
+
+notify_order() only records the update, so it never blocks a request. Every
+NOTIFY_BATCH_WINDOW seconds the updates are grouped per recipient and
+coalesced (an order's latest status replaces earlier ones that were not sent
+yet; an unsent OTP is carried forward unless the order is already delivered or
+cancelled). Each recipient's batch then becomes one
+message, queued as a background job keyed by recipient so their messages stay
+in order and failed sends are retried. Providers send concurrently up to
+NOTIFY_CONCURRENCY, within a token-bucket rate limit of NOTIFY_<CHANNEL>_RATE
+messages per second.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple, Type
+import httpx
+import orjson
+from app.services.jobs import jobs
+from app.services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_BATCH_WINDOW = float(os.getenv("NOTIFY_BATCH_WINDOW", "2"))
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "10"))
+NOTIFY_LOG_PATH = os.getenv("NOTIFY_LOG_PATH")
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", "5"))
+
+EMAIL = "email"
+SMS = "sms"
+
+MESSAGES = {
+    "agent_assigned": "A delivery agent has been assigned to your order {confirmation}.",
+    "restaurant_preparing": "The restaurant is preparing your order {confirmation}.",
+    "picked_up": "Your order {confirmation} has been picked up.",
+    "in_transit": "Your order {confirmation} is on its way to gate {gate}.",
+    "delivered": "Your order {confirmation} has been delivered. Enjoy!",
+    "cancelled": "Your order {confirmation} has been cancelled.",
+    "gate_changed": "Your order {confirmation} will now be delivered to gate {gate}.",
+}
+
+# Once an order reaches these, a pending OTP is no longer worth sending
+FINAL_EVENTS = {"delivered", "cancelled"}
+
+
+def channel_for(contact: str) -> str:
+    return EMAIL if "@" in contact else SMS
+
+
+class TokenBucket:
+    """Allows rate sends per second on average, bursts of up to burst"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class NotificationProvider:
+    """Delivers rendered messages for one channel; subclasses implement deliver()"""
+    name = "base"
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.rate = float(os.getenv(f"NOTIFY_{channel.upper()}_RATE", "20"))
+        self.sent = 0
+        self._bucket: Optional[TokenBucket] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def send(self, recipient: str, subject: str, text: str):
+        # Created on first use so they bind to the running loop
+        if self._semaphore is None:
+            self._bucket = TokenBucket(self.rate)
+            self._semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+        await self._bucket.acquire()
+        async with self._semaphore:
+            with tracer.span(f"notify {self.channel}", "client", {"notify.provider": self.name}, new_trace=False):
+                await self.deliver(recipient, subject, text)
+        self.sent += 1
+
+    async def deliver(self, recipient: str, subject: str, text: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class LogProvider(NotificationProvider):
+    """Writes each message as a JSON line to a file or stdout, for development and testing"""
+    name = "log"
+
+    def __init__(self, channel: str):
+        super().__init__(channel)
+        self.path = NOTIFY_LOG_PATH
+
+    async def deliver(self, recipient: str, subject: str, text: str):
+        line = orjson.dumps({
+            "at": datetime.now(timezone.utc), "channel": self.channel, "to": recipient,
+            "subject": subject, "text": text,
+        }) + b"\n"
+        if self.path:
+            await asyncio.to_thread(self._append, line)
+        else:
+            sys.stdout.write(line.decode())
+            sys.stdout.flush()
+
+    def _append(self, line: bytes):
+        with open(self.path, "ab") as f:
+            f.write(line)
+
+
+class WebhookProvider(NotificationProvider):
+    """Posts each message to an HTTP endpoint (an email or SMS gateway)"""
+    name = "webhook"
+
+    def __init__(self, channel: str):
+        super().__init__(channel)
+        self.url = os.getenv(f"NOTIFY_{channel.upper()}_WEBHOOK_URL")
+        if not self.url:
+            raise ValueError(f"NOTIFY_{channel.upper()}_WEBHOOK_URL is required for the webhook provider")
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def deliver(self, recipient: str, subject: str, text: str):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=NOTIFY_TIMEOUT)
+        response = await self._client.post(self.url, json={
+            "to": recipient, "channel": self.channel, "subject": subject, "text": text,
+        })
+        response.raise_for_status()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+PROVIDERS: Dict[str, Type[NotificationProvider]] = {
+    LogProvider.name: LogProvider,
+    WebhookProvider.name: WebhookProvider,
+}
+
+
+def register_provider(cls: Type[NotificationProvider]):
+    PROVIDERS[cls.name] = cls
+
+
+class Update:
+    """Latest unsent state of one order for one recipient"""
+    __slots__ = ("order_id", "confirmation", "event", "gate", "otp", "trace")
+
+    def __init__(self, order_id: int, confirmation: str, event: str, gate: Optional[str], otp: Optional[str]):
+        self.order_id = order_id
+        self.confirmation = confirmation
+        self.event = event
+        self.gate = gate
+        self.otp = otp
+        self.trace = tracer.current()  # the request that caused it
+
+    def render(self) -> str:
+        text = MESSAGES.get(self.event, "Your order {confirmation} was updated.").format(
+            confirmation=self.confirmation, gate=self.gate
+        )
+        if self.otp:
+            text += f" Your delivery code is {self.otp}; share it with the agent at the gate."
+        return text
+
+
+class Notifier:
+    def __init__(self):
+        self._pending: Dict[str, Dict[int, Update]] = {}  # recipient -> order id -> update
+        self._lock = threading.Lock()
+        self._providers: Dict[str, NotificationProvider] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.coalesced = 0
+        self.batches = 0
+
+    def provider(self, channel: str) -> NotificationProvider:
+        if channel not in self._providers:
+            name = os.getenv(f"NOTIFY_{channel.upper()}_PROVIDER", LogProvider.name)
+            self._providers[channel] = PROVIDERS[name](channel)
+        return self._providers[channel]
+
+    def notify(
+        self, contact: str, order_id: int, confirmation: str, event: str,
+        gate: Optional[str] = None, otp: Optional[str] = None
+    ):
+        """Record an update for the next batch; safe from any thread, never blocks on I/O"""
+        contact = (contact or "").strip()
+        if not contact:
+            return
+        with self._lock:
+            self.received += 1
+            updates = self._pending.setdefault(contact, {})
+            previous = updates.get(order_id)
+            if previous is not None:
+                self.coalesced += 1
+                if event not in FINAL_EVENTS:
+                    otp = otp or previous.otp
+            updates[order_id] = Update(order_id, confirmation, event, gate, otp)
+        if self._task is None:
+            # No flush loop (scripts, tests without the app lifespan): send now
+            self.flush()
+
+    def flush(self):
+        """Queue one message per recipient with everything recorded so far"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for recipient, updates in pending.items():
+            self.batches += 1
+            channel = channel_for(recipient)
+            # The batch's message joins the trace of its latest update
+            with tracer.use(list(updates.values())[-1].trace):
+                jobs.enqueue(self._send, channel, recipient, list(updates.values()), key=("notify", recipient))
+
+    async def _send(self, channel: str, recipient: str, updates: List[Update]):
+        subject, text = render(updates)
+        await self.provider(channel).send(recipient, subject, text)
+
+    def start(self, window: float = NOTIFY_BATCH_WINDOW):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(window))
+
+    async def stop(self):
+        """Stop batching and queue what is left (sent when the job runner drains)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush()
+
+    async def close(self):
+        for provider in self._providers.values():
+            await provider.close()
+
+    async def _loop(self, window: float):
+        while True:
+            await asyncio.sleep(window)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Notification flush failed")
+
+    def stats(self) -> dict:
+        with self._lock:
+            waiting = sum(len(updates) for updates in self._pending.values())
+        return {
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "waiting": waiting,
+            "providers": {
+                channel: {"provider": provider.name, "sent": provider.sent, "rate_per_second": provider.rate}
+                for channel, provider in self._providers.items()
+            },
+        }
+
+
+def render(updates: List[Update]) -> Tuple[str, str]:
+    if len(updates) == 1:
+        return f"Order {updates[0].confirmation}", updates[0].render()
+    return f"Updates on {len(updates)} orders", "\n".join(update.render() for update in updates)
+
+
+notifier = Notifier()
+
+
+def notify_order(payload: dict, event: str, otp: Optional[str] = None):
+    """Notify the customer about an order update, from the response payload already built"""
+    notifier.notify(
+        payload["user_contact"], payload["id"], payload["order_confirmation"], event,
+        gate=payload.get("boarding_gate"), otp=otp
+    )
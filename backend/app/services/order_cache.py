@@ -0,0 +1,272 @@
+"""
+Read-through cache of encoded order responses.
+
+Tracking pages poll GET /api/orders/{id} and /api/orders/confirmation/{code};
+both are served from a bounded LRU of the encoded JSON body, keyed by order id
+with the confirmation code as an alias. Entries expire after ORDER_CACHE_TTL
+seconds regardless.
+
+Invalidation is driven by the session: any flushed change to an Order (or IDs
+passed to mark_changed() for bulk UPDATEs that bypass the unit of work) is
+dropped from this worker's cache when the transaction commits. On PostgreSQL
+the same IDs are published with NOTIFY inside that transaction, and every
+worker's listener threads (one per database shard) drop them too, so a write on one worker is not
+served stale by another. Other backends only invalidate in-process; the TTL
+bounds staleness between workers there.
+
+A reader takes token() before loading from the database and passes it to
+put(); an entry invalidated in the meantime is not re-cached from the older
+read. Readers on a replica pass how far behind it may be, and an order
+invalidated within that window isn't cached from it either.
+"""
+import logging
+import os
+import select
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from app.database import Shard, all_shards, on_commit, stash
+from app.models.order import Order
+from app.services.serialization import encode
+
+logger = logging.getLogger(__name__)
+
+ORDER_CACHE_SIZE = int(os.getenv("ORDER_CACHE_SIZE", "10000"))
+ORDER_CACHE_TTL = float(os.getenv("ORDER_CACHE_TTL", "30"))
+NOTIFY_CHANNEL = "order_cache"
+NOTIFY_BATCH = 500  # order IDs per NOTIFY payload
+
+# Session.info key for order IDs written in the current transaction
+_CHANGED_KEY = "order_cache_changed"
+# Tags our own NOTIFYs so the listener can skip them
+WORKER_ID = uuid.uuid4().hex[:12]
+
+
+class OrderCache:
+    """Bounded LRU/TTL map of order id -> encoded response body"""
+
+    def __init__(self, maxsize: int = ORDER_CACHE_SIZE, ttl: float = ORDER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[bytes, str, float]]" = OrderedDict()  # body, confirmation, expiry
+        self._confirmations: Dict[str, int] = {}
+        # order id -> (epoch, time) of its last invalidation, kept for one TTL
+        self._invalidated: "OrderedDict[int, Tuple[int, float]]" = OrderedDict()
+        self._epoch = 0
+        self._floor = 0  # tokens from before the last clear() are refused
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def token(self, behind: float = 0.0) -> Tuple[int, float, float]:
+        """Taken before a read; behind is how stale (seconds) the data read may be"""
+        with self._lock:
+            return self._epoch, time.monotonic(), behind
+
+    def get(self, order_id: int) -> Optional[bytes]:
+        with self._lock:
+            return self._get(order_id)
+
+    def get_by_confirmation(self, confirmation: str) -> Optional[bytes]:
+        with self._lock:
+            order_id = self._confirmations.get(confirmation)
+            if order_id is None:
+                self.misses += 1
+                return None
+            return self._get(order_id)
+
+    def _get(self, order_id: int) -> Optional[bytes]:
+        entry = self._entries.get(order_id)
+        if entry is None or entry[2] <= time.monotonic():
+            if entry is not None:
+                self._drop(order_id)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(order_id)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, order_id: int, confirmation: str, body: bytes, token: Tuple[int, float, float]):
+        """Cache a body read at token(); ignored if the order was invalidated since"""
+        epoch, started, behind = token
+        now = time.monotonic()
+        if self.maxsize <= 0 or now - started >= self.ttl:
+            return
+        with self._lock:
+            if epoch < self._floor:
+                return
+            invalidated = self._invalidated.get(order_id)
+            if invalidated is not None and (invalidated[0] > epoch or invalidated[1] >= started - behind):
+                return
+            self._drop(order_id)
+            self._entries[order_id] = (body, confirmation, now + self.ttl)
+            self._confirmations[confirmation] = order_id
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, order_ids: Iterable[int]):
+        now = time.monotonic()
+        with self._lock:
+            self._epoch += 1
+            for order_id in order_ids:
+                self._invalidated.pop(order_id, None)
+                self._invalidated[order_id] = (self._epoch, now)
+                if self._drop(order_id):
+                    self.invalidations += 1
+            # Tokens older than the TTL are refused by put(), so older marks can go
+            while self._invalidated and next(iter(self._invalidated.values()))[1] <= now - self.ttl:
+                self._invalidated.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._confirmations.clear()
+            self._invalidated.clear()
+            self._floor = self._epoch
+
+    def _drop(self, order_id: int) -> bool:
+        entry = self._entries.pop(order_id, None)
+        if entry is None:
+            return False
+        if self._confirmations.get(entry[1]) == order_id:
+            del self._confirmations[entry[1]]
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "cross_worker": listener.running,
+            }
+
+
+order_cache = OrderCache()
+
+
+def refresh_order(order: Order, payload: dict):
+    """Re-cache an order right after writing it, from the payload already built for the response"""
+    order_cache.put(order.id, order.order_confirmation, encode(payload), order_cache.token())
+
+
+def mark_changed(db: Session, order_ids: Iterable[int]):
+    """Invalidate these orders when db commits (for bulk UPDATEs the session doesn't track)"""
+    stash(db, _CHANGED_KEY, order_ids)
+
+
+def _collect_changed_orders(session: Session) -> List[int]:
+    return [obj.id for obj in (*session.new, *session.dirty, *session.deleted) if isinstance(obj, Order)]
+
+
+@event.listens_for(Session, "before_commit")
+def _publish_changed_orders(session: Session):
+    # Flush now so changes flushed by commit itself are collected before publishing
+    session.flush()
+    changed = session.info.get(_CHANGED_KEY)
+    if changed and session.get_bind().dialect.name == "postgresql":
+        # Delivered to listeners only if, and when, the transaction commits;
+        # chunked to stay under the 8000-byte payload limit
+        ids = sorted(set(changed))
+        session.connection().execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            [
+                {"channel": NOTIFY_CHANNEL, "payload": f"{WORKER_ID}:{','.join(map(str, ids[i:i + NOTIFY_BATCH]))}"}
+                for i in range(0, len(ids), NOTIFY_BATCH)
+            ],
+        )
+
+
+on_commit(
+    _CHANGED_KEY, lambda session, changed: order_cache.invalidate(set(changed)), collect=_collect_changed_orders
+)
+
+
+class InvalidationListener:
+    """LISTENs for other workers' order writes on each PostgreSQL shard and drops them from the local cache"""
+
+    def __init__(self, cache: OrderCache):
+        self.cache = cache
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._connected: Dict[str, bool] = {}  # shard name -> LISTEN connection up
+
+    @property
+    def running(self) -> bool:
+        return bool(self._connected) and all(self._connected.values())
+
+    def start(self):
+        if any(thread.is_alive() for thread in self._threads):
+            return
+        self._stop.clear()
+        self._threads = []
+        for shard in all_shards():
+            if shard.engine.dialect.name != "postgresql":
+                continue
+            self._connected[shard.name] = False
+            thread = threading.Thread(
+                target=self._run, args=(shard,), name=f"order-cache-listener-{shard.name}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        self._connected.clear()
+
+    def _run(self, shard: Shard):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                self._listen(shard)
+                backoff = 1.0
+            except Exception:
+                logger.exception("Order cache listener for %s lost its connection; retrying in %.0fs", shard, backoff)
+            self._connected[shard.name] = False
+            # Notifications may have been missed while disconnected
+            self.cache.clear()
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def _listen(self, shard: Shard):
+        raw = shard.engine.raw_connection()
+        raw.detach()  # a long-lived LISTEN connection never goes back to the pool
+        conn = raw.driver_connection
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            self._connected[shard.name] = True
+            while not self._stop.is_set():
+                if select.select([conn], [], [], 1.0)[0]:
+                    conn.poll()
+                    changed = set()
+                    while conn.notifies:
+                        worker, _, ids = conn.notifies.pop(0).payload.partition(":")
+                        if worker != WORKER_ID:
+                            changed.update(int(i) for i in ids.split(",") if i)
+                    if changed:
+                        self.cache.invalidate(changed)
+        finally:
+            conn.close()
+
+
+listener = InvalidationListener(order_cache)
@@ -1,52 +1,79 @@
-from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy.orm import Session, joinedload
 from app.models.order import Order, OrderStatus
-from app.models.delivery_agent import DeliveryAgent, AgentStatus
+from app.models.delivery_agent import AgentStatus, DeliveryAgent
+from app.services.agent_load import active_orders, agent_load
+from app.services.dispatch import choose_agent, on_shift, order_airport_id
+from app.services.order_state import compare_and_set
+from app.services.tracing import traced
 
 
-def assign_delivery_agent(order_id: int, db: Session):
+def load_order(db: Session, *criteria):
+    """Load an order together with the restaurant and agent shown in responses"""
+    return db.query(Order).options(
+        joinedload(Order.restaurant),
+        joinedload(Order.delivery_agent)
+    ).filter(*criteria).first()
+
+
+def load_orders(db: Session, *criteria):
+    """Bulk form of load_order, in ID order"""
+    return db.query(Order).options(
+        joinedload(Order.restaurant),
+        joinedload(Order.delivery_agent)
+    ).filter(*criteria).order_by(Order.id).all()
+
+
+def claim_agent(db: Session, agent: DeliveryAgent, now: datetime) -> Optional[DeliveryAgent]:
     """
-    Assign an available delivery agent to an order.
-    For MVP, this is simulated - we'll use existing agents or reuse them.
+    Lock the agent's row (SELECT ... FOR UPDATE) and re-check it in the
+    database: still on shift and below capacity. Concurrent assignments to the
+    same agent wait on the lock until the first commits, so they count its
+    order. Returns the locked agent, or None with the lock released.
+    """
+    locked = db.query(DeliveryAgent).filter(DeliveryAgent.id == agent.id).with_for_update().populate_existing().one()
+    if on_shift(locked, now) and active_orders(db, locked.id) < locked.capacity:
+        return locked
+    db.rollback()
+    return None
+
+
+@traced()
+def assign_delivery_agent(
+    order_id: int, db: Session, allow_batching: bool = True, now: Optional[datetime] = None
+):
+    """
+    Assign a delivery agent with spare capacity to an order and return it, or
+    None when nobody can take it yet (the order stays queued for dispatch).
+    Urgent orders (allow_batching=False) never join another order's trip.
     """
     order = db.query(Order).filter(Order.id == order_id).first()
     if not order:
-        return
-    
-    # Find an available agent first
-    agent = db.query(DeliveryAgent).filter(
-        DeliveryAgent.status == AgentStatus.AVAILABLE
-    ).first()
-    
-    # If no available agent, find any agent (even if assigned) and reuse it
-    if not agent:
-        agent = db.query(DeliveryAgent).first()
-    
-    # If still no agent exists, create one with a unique code
+        return None
+
+    now = now or datetime.now(timezone.utc)
+    agent = choose_agent(db, order, allow_batching, now)
+    if agent:
+        agent = claim_agent(db, agent, now)
+        if not agent:
+            # The in-memory load was behind (another worker assigned meanwhile); re-read it and choose again
+            agent_load.reconcile(db)
+            agent = choose_agent(db, order, allow_batching, now)
+            agent = agent and claim_agent(db, agent, now)
     if not agent:
-        # Generate unique agent code
-        import random
-        agent_code = f"AGENT{random.randint(100, 999)}"
-        # Make sure it's unique
-        while db.query(DeliveryAgent).filter(DeliveryAgent.agent_code == agent_code).first():
-            agent_code = f"AGENT{random.randint(100, 999)}"
-        
-        agent = DeliveryAgent(
-            name="Delivery Agent",
-            agent_code=agent_code,
-            status=AgentStatus.ASSIGNED,
-            current_location=order.boarding_gate
-        )
-        db.add(agent)
-        db.commit()
-        db.refresh(agent)
-    else:
-        # Update existing agent
-        agent.status = AgentStatus.ASSIGNED
-        agent.current_location = order.boarding_gate
-        db.commit()
-    
-    # Assign agent to order
-    order.delivery_agent_id = agent.id
-    order.status = OrderStatus.AGENT_ASSIGNED
-    db.commit()
+        return None
+
+    agent.status = AgentStatus.ASSIGNED
+    agent.airport_id = order_airport_id(db, order)
+    agent.current_location = order.boarding_gate
 
+    # Assign agent to order, unless it changed since it was read (taken or cancelled meanwhile)
+    if not compare_and_set(
+        db, order_id, OrderStatus.AGENT_ASSIGNED, Order.delivery_agent_id.is_(None),
+        expected_version=order.version, delivery_agent_id=agent.id
+    ):
+        db.rollback()
+        return None
+    db.commit()
+    return agent
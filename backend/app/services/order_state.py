@@ -0,0 +1,149 @@
+"""
+Order status state machine and compare-and-swap writes.
+
+TRANSITIONS lists the statuses each status may move to. transition() applies
+a move as a single UPDATE ... WHERE id = ? AND status IN (legal sources)
+[AND version = ?] that also bumps the version, without reading the order
+first; only when no row matches is the order read, to say why (404, 403,
+400 or 409).
+
+Writes that go through an ORM flush are compare-and-swap as well: version is
+the mapper's version_id_col, so flushing an order that changed since it was
+loaded raises StaleDataError, which the app answers with 409.
+"""
+from typing import Dict, FrozenSet, List, Optional
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from app.models.order import Order, OrderStatus
+from app.services.agent_load import note_assigned, note_closed
+from app.services.live_counts import note_order_status
+from app.services.order_cache import mark_changed
+from app.services.otp_service import verify_otp
+from app.services.tracing import traced
+
+TRANSITIONS: Dict[OrderStatus, FrozenSet[OrderStatus]] = {
+    OrderStatus.ORDER_PLACED: frozenset({
+        OrderStatus.RESTAURANT_PREPARING, OrderStatus.AGENT_ASSIGNED, OrderStatus.CANCELLED,
+    }),
+    OrderStatus.RESTAURANT_PREPARING: frozenset({
+        OrderStatus.AGENT_ASSIGNED, OrderStatus.PICKED_UP, OrderStatus.CANCELLED,
+    }),
+    OrderStatus.AGENT_ASSIGNED: frozenset({
+        OrderStatus.RESTAURANT_PREPARING, OrderStatus.PICKED_UP, OrderStatus.CANCELLED,
+    }),
+    OrderStatus.PICKED_UP: frozenset({OrderStatus.IN_TRANSIT, OrderStatus.DELIVERED}),
+    OrderStatus.IN_TRANSIT: frozenset({OrderStatus.DELIVERED}),
+    OrderStatus.DELIVERED: frozenset(),
+    OrderStatus.CANCELLED: frozenset(),
+}
+
+# Targets PUT /orders/{id}/status may set. Assignment belongs to dispatch, and
+# pickup and delivery to the agent endpoints (which issue and check the OTP).
+STATUS_ENDPOINT_TARGETS: FrozenSet[OrderStatus] = frozenset({
+    OrderStatus.RESTAURANT_PREPARING, OrderStatus.CANCELLED,
+})
+
+# target -> statuses it may be reached from
+SOURCES: Dict[OrderStatus, List[OrderStatus]] = {
+    target: [source for source, targets in TRANSITIONS.items() if target in targets]
+    for target in OrderStatus
+}
+
+
+def can_transition(current: OrderStatus, target: OrderStatus) -> bool:
+    return target in TRANSITIONS[current]
+
+
+def transition_error(current: OrderStatus, target: OrderStatus) -> str:
+    return f"Cannot change status from {current.value} to {target.value}"
+
+
+def check_transition(order: Order, target: OrderStatus):
+    """409 unless the order may move to target (for writes that go through the ORM)"""
+    if not can_transition(order.status, target):
+        raise HTTPException(status_code=409, detail=transition_error(order.status, target))
+
+
+@traced()
+def compare_and_set(
+    db: Session, order_id: int, target: OrderStatus, *criteria, expected_version: Optional[int] = None, **values
+) -> bool:
+    """
+    Move an order to target in one UPDATE if it is in a legal source status
+    and matches criteria (and expected_version, when given). True if it did;
+    the caller commits.
+    """
+    statement = update(Order).where(Order.id == order_id, Order.status.in_(SOURCES[target]), *criteria)
+    if expected_version is not None:
+        statement = statement.where(Order.version == expected_version)
+    result = db.execute(
+        statement.values(status=target, version=Order.version + 1, **values),
+        execution_options={"synchronize_session": False},
+    )
+    if result.rowcount != 1:
+        return False
+    mark_changed(db, [order_id])
+    note_order_status(db, order_id, target)
+    if values.get("delivery_agent_id") is not None:
+        note_assigned(db, order_id, values["delivery_agent_id"])
+    if not TRANSITIONS[target]:  # delivered or cancelled
+        note_closed(db, order_id)
+    return True
+
+
+def transition(
+    db: Session,
+    order_id: int,
+    target: OrderStatus,
+    agent_id: Optional[int] = None,
+    otp: Optional[str] = None,
+    expected_version: Optional[int] = None,
+    **values
+):
+    """
+    compare_and_set() and commit, optionally only for the assigned agent and
+    with the delivery OTP; raises the HTTP error explaining a miss
+    """
+    criteria = []
+    if agent_id is not None:
+        criteria.append(Order.delivery_agent_id == agent_id)
+    if otp is not None:
+        criteria.append(Order.delivery_otp == otp)
+    if compare_and_set(db, order_id, target, *criteria, expected_version=expected_version, **values):
+        db.commit()
+        return
+    db.rollback()
+    raise explain_miss(db, order_id, target, agent_id, otp, expected_version)
+
+
+def explain_miss(
+    db: Session,
+    order_id: int,
+    target: OrderStatus,
+    agent_id: Optional[int] = None,
+    otp: Optional[str] = None,
+    expected_version: Optional[int] = None,
+) -> HTTPException:
+    """Why a compare-and-set matched no row, read back from the order's current state"""
+    order = db.query(Order.status, Order.version, Order.delivery_agent_id, Order.delivery_otp).filter(
+        Order.id == order_id
+    ).first()
+    if order is None:
+        return HTTPException(status_code=404, detail="Order not found")
+    if agent_id is not None and order.delivery_agent_id != agent_id:
+        return HTTPException(status_code=403, detail="Order not assigned to this agent")
+    if otp is not None:
+        if not order.delivery_otp:
+            return HTTPException(status_code=400, detail="OTP not generated for this order")
+        if not verify_otp(otp, order.delivery_otp):
+            return HTTPException(status_code=400, detail="Invalid OTP")
+    if expected_version is not None and order.version != expected_version:
+        return HTTPException(
+            status_code=409,
+            detail=f"Order was modified concurrently (version {order.version}, expected {expected_version})"
+        )
+    if not can_transition(order.status, target):
+        return HTTPException(status_code=409, detail=transition_error(order.status, target))
+    # Matched on re-read: another write landed between the UPDATE and this read
+    return HTTPException(status_code=409, detail="Order was modified concurrently")
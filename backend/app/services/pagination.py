@@ -0,0 +1,64 @@
+"""
+Keyset (cursor) pagination helpers.
+
+A cursor is the sort key of the last row on the previous page, encoded as
+url-safe base64 JSON. The next page is "rows strictly after that key" in the
+endpoint's sort order, so every page is an index range scan no matter how deep
+the client has paged.
+"""
+import base64
+import orjson
+from fastapi import HTTPException, Query
+from sqlalchemy import tuple_
+from typing import Any, List, Optional, Sequence, Tuple
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def limit_param(default: Optional[int] = DEFAULT_PAGE_SIZE):
+    """Page size query parameter; a default of None leaves the endpoint unpaged unless asked"""
+    return Query(default, ge=1, le=MAX_PAGE_SIZE, description="Page size")
+
+
+def cursor_param():
+    return Query(None, description="Opaque cursor from the previous page's next_cursor")
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = orjson.dumps(list(values))
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Decode a cursor into its sort-key values, or raise 400"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = orjson.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError
+        return values
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_cursor(columns: Sequence, values: Sequence, descending: bool = False):
+    """Row-value predicate selecting rows strictly after the cursor key"""
+    if len(columns) == 1:
+        return columns[0] < values[0] if descending else columns[0] > values[0]
+    left = tuple_(*columns)
+    right = tuple_(*values)
+    return left < right if descending else left > right
+
+
+def split_page(rows: list, limit: int, key) -> Tuple[list, Optional[str]]:
+    """
+    Given up to limit + 1 rows, return the page and the cursor for the next one.
+    `key` maps the last row of the page to its sort-key tuple.
+    """
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor(*key(page[-1]))
@@ -0,0 +1,62 @@
+"""
+Sparse fieldsets (?fields=) and nesting depth (?depth=) for read endpoints.
+
+`fields` is a comma-separated list of column names. Nested levels are
+addressed with a prefix, e.g. "code,name,terminals.name,gates.gate_number".
+Levels that are not mentioned keep all of their columns. Only the selected
+columns are loaded from the database (load_only), and relationships below the
+requested depth are never loaded.
+"""
+from fastapi import HTTPException, Query
+from typing import Dict, List, Optional, Sequence
+
+AIRPORT_COLUMNS = ["id", "code", "name", "city", "state", "timezone", "latitude", "longitude"]
+TERMINAL_COLUMNS = ["id", "name", "layout_data"]
+GATE_COLUMNS = ["id", "gate_number", "coordinates"]
+RESTAURANT_COLUMNS = [
+    "id", "name", "cuisine_type", "location", "nearby_gates",
+    "estimated_prep_time", "mock_ordering_slug", "description",
+]
+RESTAURANT_TERMINAL_COLUMNS = ["id", "name"]
+
+
+def fields_param():
+    return Query(None, description="Comma-separated fields to return, e.g. code,name,terminals.name")
+
+
+def depth_param(default: int, maximum: int):
+    return Query(default, ge=0, le=maximum, description="How many levels of nested objects to include")
+
+
+def parse_fields(fields: Optional[str], levels: Dict[str, Sequence[str]]) -> Dict[str, List[str]]:
+    """
+    Split a fields string into {level: [columns]}. The root level is "".
+    The primary key "id" is always included. Unknown fields raise 400.
+    """
+    selection: Dict[str, List[str]] = {}
+    for raw in (fields or "").split(","):
+        name = raw.strip()
+        if not name:
+            continue
+        level, _, column = name.rpartition(".")
+        if level not in levels or column not in levels[level]:
+            raise HTTPException(status_code=400, detail=f"Unknown field: {name}")
+        selection.setdefault(level, [])
+        if column not in selection[level]:
+            selection[level].append(column)
+
+    for level, columns in levels.items():
+        if level not in selection:
+            selection[level] = list(columns)
+        elif "id" in columns and "id" not in selection[level]:
+            selection[level].insert(0, "id")
+    return selection
+
+
+def columns(model, names: Sequence[str]) -> list:
+    """Mapped attributes for load_only()"""
+    return [getattr(model, name) for name in names]
+
+
+def project(obj, names: Sequence[str]) -> dict:
+    return {name: getattr(obj, name, None) for name in names}
@@ -0,0 +1,109 @@
+"""
+Read-your-writes for replica reads.
+
+A response to a request that committed a write carries a read-after token,
+both as an X-Read-After header (for API clients, which send it back as a
+request header) and as a read_after cookie (for browsers on the same site).
+It records, per shard written, the primary's WAL position and the time of
+the write. While a later request carries it, get_routed_db() only reads from
+a replica that has replayed that position, falling back to the primary, so
+a client always sees its own writes. Tokens expire after
+DATABASE_REPLICA_MAX_LAG seconds, by which time every replica still in use
+has caught up.
+
+Token format: shard:position:timestamp entries joined by "|" (position is
+empty on backends without a WAL position).
+"""
+import math
+import time
+from typing import Dict, List
+from starlette.concurrency import run_in_threadpool
+from app.database import (
+    REPLICA_MAX_LAG, ReadAfter, WritePosition, has_replicas, request_read_after, shards
+)
+
+READ_AFTER_HEADER = "X-Read-After"
+READ_AFTER_COOKIE = "read_after"
+
+
+def parse_token(value: str) -> Dict[str, WritePosition]:
+    """Unexpired entries of a token; malformed entries and unknown shards are ignored"""
+    tokens: Dict[str, WritePosition] = {}
+    oldest = time.time() - REPLICA_MAX_LAG
+    for entry in value.split("|"):
+        try:
+            name, position, written_at = entry.split(":")
+            written = float(written_at)
+            if name in shards and written >= oldest:
+                tokens[name] = (int(position) if position else None, written)
+        except ValueError:
+            continue
+    return tokens
+
+
+def format_token(tokens: Dict[str, WritePosition]) -> str:
+    return "|".join(
+        f"{name}:{'' if position is None else position}:{written_at:.3f}"
+        for name, (position, written_at) in sorted(tokens.items())
+    )
+
+
+def issue_token(read_after: ReadAfter) -> str:
+    """The request's incoming token updated with the positions of what it wrote"""
+    tokens = dict(read_after.tokens)
+    now = time.time()
+    for name in read_after.written:
+        shard = shards[name]
+        if shard.replicas:
+            tokens[name] = (shard.write_position(), now)
+    return format_token(tokens)
+
+
+def _request_token(headers: List) -> str:
+    cookie_prefix = READ_AFTER_COOKIE.encode() + b"="
+    for name, value in headers:
+        if name == b"x-read-after":
+            return value.decode("latin-1")
+    for name, value in headers:
+        if name == b"cookie":
+            for part in value.split(b";"):
+                part = part.strip()
+                if part.startswith(cookie_prefix):
+                    return part[len(cookie_prefix):].decode("latin-1")
+    return ""
+
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware; a pass-through unless some shard has read replicas"""
+
+    def __init__(self, app):
+        self.app = app
+        self.enabled = has_replicas()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        read_after = ReadAfter(parse_token(_request_token(scope["headers"])))
+        context_token = request_read_after.set(read_after)
+
+        async def send_with_token(message):
+            if message["type"] == "http.response.start" and any(
+                shards[name].replicas for name in read_after.written
+            ):
+                token = (await run_in_threadpool(issue_token, read_after)).encode("latin-1")
+                cookie = (
+                    f"{READ_AFTER_COOKIE}={token.decode('latin-1')}; Max-Age={math.ceil(REPLICA_MAX_LAG)}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                ).encode("latin-1")
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), (b"x-read-after", token), (b"set-cookie", cookie)],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_token)
+        finally:
+            request_read_after.reset(context_token)
+
@@ -0,0 +1,426 @@
+"""
+Walkway routing inside a terminal.
+
+Each terminal has a walkway graph with nodes at gates, restaurants and
+corridor junctions and weighted edges between them. It is stored alongside
+the map in Terminal.layout_data["walkway"]:
+
+    {"nodes": [{"id": "j1", "x": 300, "y": 250}, ...],
+     "edges": [{"from": "gate:A1", "to": "j1"},
+               {"from": "j1", "to": "j2", "speed": 2.0},     # moving walkway
+               {"from": "j2", "to": "j3", "penalty": 40},    # security checkpoint
+               {"from": "j3", "to": "j4", "bidirectional": false}]}
+
+Gates ("gate:<number>") and restaurants ("restaurant:<id>") are implicit nodes
+at their stored coordinates; any that the walkway doesn't mention get a spur
+to the nearest junction. Edge weight is length / speed + penalty, in the same
+map units as calculate_distance, so calculate_walking_time still applies.
+Walls are simply the absence of an edge. Terminals without a walkway get a
+default one: a central corridor with a spur to every gate and restaurant.
+
+All-pairs distances are computed once per terminal layout with a vectorized
+Floyd-Warshall and cached; single paths use A*. For graphs of
+ROUTING_OFFLOAD_MIN_NODES or more the Floyd-Warshall runs in the compute pool:
+async callers await precompute_graphs() first, the dispatch thread waits on
+the pool directly. Computed matrices go into warm-start snapshots (see
+snapshots.py) and are reused after a restart while the layout is unchanged.
+"""
+import asyncio
+import hashlib
+import heapq
+import math
+import os
+import orjson
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+from app.models.airport import Terminal, Gate
+from app.models.restaurant import Restaurant
+from app.services.compute import SharedArray, checkpoint, compute
+
+GATE_PREFIX = "gate:"
+RESTAURANT_PREFIX = "restaurant:"
+CORRIDOR_PREFIX = "corridor:"
+
+# Above this size the O(n^3) all-pairs pass is skipped; rows are computed
+# on demand with Dijkstra instead
+ALL_PAIRS_MAX_NODES = int(os.getenv("ROUTING_ALL_PAIRS_MAX_NODES", "500"))
+GRAPH_CACHE_SIZE = int(os.getenv("ROUTING_GRAPH_CACHE_SIZE", "256"))
+# Smaller graphs are closed inline: a pool round trip would cost more
+OFFLOAD_MIN_NODES = int(os.getenv("ROUTING_OFFLOAD_MIN_NODES", "150"))
+
+Point = Tuple[float, float]
+
+
+def gate_node(gate_number: str) -> str:
+    return f"{GATE_PREFIX}{gate_number.upper()}"
+
+
+def restaurant_node(restaurant_id: int) -> str:
+    return f"{RESTAURANT_PREFIX}{restaurant_id}"
+
+
+@compute.task("all_pairs")
+def all_pairs_distances(n: int, sources: np.ndarray, targets: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """n x n shortest distances from weighted edges (vectorized Floyd-Warshall)"""
+    dist = np.full((n, n), np.inf)
+    np.fill_diagonal(dist, 0.0)
+    # Parallel edges keep the lightest
+    np.minimum.at(dist, (sources, targets), weights)
+    for k in range(n):
+        if k % 32 == 0:
+            checkpoint()
+        np.minimum(dist, dist[:, k:k + 1] + dist[k:k + 1, :], out=dist)
+    return dist
+
+
+def _point(coords) -> Optional[Point]:
+    if not coords or "x" not in coords or "y" not in coords:
+        return None
+    return float(coords["x"]), float(coords["y"])
+
+
+class TerminalGraph:
+    """Walkway graph for one terminal with cached shortest-path distances"""
+
+    def __init__(self, terminal_id: int, nodes: Dict[str, Point], edges: Iterable[Tuple[str, str, float]]):
+        self.terminal_id = terminal_id
+        self.keys: List[str] = list(nodes)
+        self.index: Dict[str, int] = {key: i for i, key in enumerate(self.keys)}
+        self.coords = np.array([nodes[key] for key in self.keys], dtype=float).reshape(-1, 2)
+        self.adjacency: List[List[Tuple[int, float]]] = [[] for _ in self.keys]
+        # Lower bound on cost per unit of straight-line distance, keeps A* admissible
+        self.min_cost_per_unit = 1.0
+        for a, b, weight in edges:
+            i, j = self.index[a], self.index[b]
+            self.adjacency[i].append((j, weight))
+            straight = float(np.hypot(*(self.coords[i] - self.coords[j])))
+            if straight > 0:
+                self.min_cost_per_unit = min(self.min_cost_per_unit, weight / straight)
+        self._matrix: Optional[np.ndarray] = None
+        self._rows: Dict[int, np.ndarray] = {}
+        self._columns: Dict[int, np.ndarray] = {}
+        self._reverse: Optional[List[List[Tuple[int, float]]]] = None
+
+    @classmethod
+    def from_layout(
+        cls,
+        terminal_id: int,
+        layout_data: Optional[dict],
+        gates: Sequence[Tuple[str, Optional[dict]]],
+        restaurants: Sequence[Tuple[int, Optional[dict]]],
+    ) -> "TerminalGraph":
+        endpoints: Dict[str, Point] = {}
+        for gate_number, coords in gates:
+            point = _point(coords)
+            if point:
+                endpoints[gate_node(gate_number)] = point
+        for restaurant_id, location in restaurants:
+            point = _point(location)
+            if point:
+                endpoints[restaurant_node(restaurant_id)] = point
+
+        walkway = (layout_data or {}).get("walkway")
+        if walkway and walkway.get("nodes"):
+            nodes, edges = _explicit_walkway(walkway, endpoints)
+        else:
+            nodes, edges = _default_walkway(endpoints)
+        return cls(terminal_id, nodes, edges)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def edge_arrays(self) -> Tuple[int, np.ndarray, np.ndarray, np.ndarray]:
+        """(node count, sources, targets, weights): the all_pairs task's input"""
+        edges = [(i, j, weight) for i, neighbours in enumerate(self.adjacency) for j, weight in neighbours]
+        sources, targets, weights = zip(*edges) if edges else ((), (), ())
+        return (
+            len(self.keys), np.array(sources, dtype=np.int64), np.array(targets, dtype=np.int64),
+            np.array(weights, dtype=float)
+        )
+
+    @property
+    def needs_matrix(self) -> bool:
+        """All-pairs distances are used but not computed yet"""
+        return self._matrix is None and len(self.keys) <= ALL_PAIRS_MAX_NODES
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """All-pairs shortest distances (vectorized Floyd-Warshall); blocks on the pool for large graphs"""
+        if self._matrix is None:
+            if len(self.keys) >= OFFLOAD_MIN_NODES:
+                self._matrix = compute.call("all_pairs", *self.edge_arrays())
+            else:
+                self._matrix = all_pairs_distances(*self.edge_arrays())
+        return self._matrix
+
+    def shared_matrix(self) -> Optional[SharedArray]:
+        """The all-pairs matrix published for compute tasks (None above ALL_PAIRS_MAX_NODES)"""
+        if len(self.keys) > ALL_PAIRS_MAX_NODES:
+            return None
+        return compute.share(f"walkway:{self.terminal_id}", self.matrix)
+
+    def _dijkstra(self, source: int, adjacency: Optional[List[List[Tuple[int, float]]]] = None) -> np.ndarray:
+        adjacency = adjacency or self.adjacency
+        dist = np.full(len(self.keys), np.inf)
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for v, weight in adjacency[u]:
+                nd = d + weight
+                if nd < dist[v]:
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return dist
+
+    def row(self, key: str) -> np.ndarray:
+        """Distances from one node to every node"""
+        i = self.index[key]
+        if len(self.keys) <= ALL_PAIRS_MAX_NODES:
+            return self.matrix[i]
+        if i not in self._rows:
+            self._rows[i] = self._dijkstra(i)
+        return self._rows[i]
+
+    def column(self, key: str) -> np.ndarray:
+        """Distances from every node to one node (differs from row() on one-way edges)"""
+        i = self.index[key]
+        if len(self.keys) <= ALL_PAIRS_MAX_NODES:
+            return self.matrix[:, i]
+        if i not in self._columns:
+            if self._reverse is None:
+                self._reverse = [[] for _ in self.keys]
+                for u, neighbours in enumerate(self.adjacency):
+                    for v, weight in neighbours:
+                        self._reverse[v].append((u, weight))
+            self._columns[i] = self._dijkstra(i, self._reverse)
+        return self._columns[i]
+
+    def distance(self, source: str, target: str) -> float:
+        if source not in self.index or target not in self.index:
+            return math.inf
+        return float(self.row(source)[self.index[target]])
+
+    def distances_from(self, source: str, targets: Sequence[str]) -> np.ndarray:
+        """Bulk lookup: one source, many targets (inf for unknown nodes)"""
+        result = np.full(len(targets), np.inf)
+        if source not in self.index:
+            return result
+        row = self.row(source)
+        known = [(n, self.index[t]) for n, t in enumerate(targets) if t in self.index]
+        if known:
+            positions, indexes = zip(*known)
+            result[list(positions)] = row[list(indexes)]
+        return result
+
+    def distance_matrix(self, sources: Sequence[str], targets: Sequence[str]) -> np.ndarray:
+        """Bulk lookup: |sources| x |targets| distances (inf for unknown nodes)"""
+        return np.vstack([self.distances_from(s, targets) for s in sources]) if sources else np.empty((0, len(targets)))
+
+    def shortest_path(self, source: str, target: str) -> Tuple[float, List[str]]:
+        """A* search returning (distance, node keys along the path)"""
+        if source not in self.index or target not in self.index:
+            return math.inf, []
+        start, goal = self.index[source], self.index[target]
+        goal_xy = self.coords[goal]
+
+        def heuristic(i: int) -> float:
+            return float(np.hypot(*(self.coords[i] - goal_xy))) * self.min_cost_per_unit
+
+        best = {start: 0.0}
+        previous: Dict[int, int] = {}
+        heap = [(heuristic(start), 0.0, start)]
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u == goal:
+                path = [u]
+                while path[-1] in previous:
+                    path.append(previous[path[-1]])
+                return d, [self.keys[i] for i in reversed(path)]
+            if d > best.get(u, math.inf):
+                continue
+            for v, weight in self.adjacency[u]:
+                nd = d + weight
+                if nd < best.get(v, math.inf):
+                    best[v] = nd
+                    previous[v] = u
+                    heapq.heappush(heap, (nd + heuristic(v), nd, v))
+        return math.inf, []
+
+    def point(self, key: str) -> Point:
+        x, y = self.coords[self.index[key]]
+        return float(x), float(y)
+
+
+def _length(a: Point, b: Point) -> float:
+    return math.hypot(b[0] - a[0], b[1] - a[1])
+
+
+def _explicit_walkway(walkway: dict, endpoints: Dict[str, Point]):
+    nodes: Dict[str, Point] = dict(endpoints)
+    junctions: Dict[str, Point] = {}
+    for node in walkway.get("nodes", []):
+        point = _point(node)
+        if point and node.get("id"):
+            junctions[node["id"]] = point
+    nodes.update(junctions)
+
+    edges: List[Tuple[str, str, float]] = []
+    connected = set()
+    for edge in walkway.get("edges", []):
+        a, b = edge.get("from"), edge.get("to")
+        if a not in nodes or b not in nodes:
+            continue
+        length = edge.get("length", _length(nodes[a], nodes[b]))
+        weight = length / max(float(edge.get("speed", 1.0)), 1e-6) + float(edge.get("penalty", 0.0))
+        edges.append((a, b, weight))
+        if edge.get("bidirectional", True):
+            edges.append((b, a, weight))
+        connected.update((a, b))
+
+    # Gates/restaurants the walkway doesn't mention: spur to the nearest junction
+    if junctions:
+        junction_keys = list(junctions)
+        junction_xy = np.array([junctions[k] for k in junction_keys])
+        for key, point in endpoints.items():
+            if key in connected:
+                continue
+            nearest = junction_keys[int(np.argmin(np.hypot(*(junction_xy - point).T)))]
+            weight = _length(point, junctions[nearest])
+            edges.append((key, nearest, weight))
+            edges.append((nearest, key, weight))
+    return nodes, edges
+
+
+def _default_walkway(endpoints: Dict[str, Point]):
+    """A single corridor between the gate row and the restaurant row"""
+    nodes: Dict[str, Point] = dict(endpoints)
+    edges: List[Tuple[str, str, float]] = []
+    if not endpoints:
+        return nodes, edges
+
+    gate_ys = [p[1] for k, p in endpoints.items() if k.startswith(GATE_PREFIX)]
+    restaurant_ys = [p[1] for k, p in endpoints.items() if k.startswith(RESTAURANT_PREFIX)]
+    if gate_ys and restaurant_ys:
+        corridor_y = (sum(gate_ys) / len(gate_ys) + sum(restaurant_ys) / len(restaurant_ys)) / 2
+    else:
+        ys = gate_ys or restaurant_ys
+        corridor_y = sum(ys) / len(ys)
+
+    junctions: Dict[float, str] = {}
+    for key, (x, y) in endpoints.items():
+        if x not in junctions:
+            junctions[x] = f"{CORRIDOR_PREFIX}{x:g}"
+            nodes[junctions[x]] = (x, corridor_y)
+        spur = abs(y - corridor_y)
+        edges.append((key, junctions[x], spur))
+        edges.append((junctions[x], key, spur))
+
+    xs = sorted(junctions)
+    for left, right in zip(xs, xs[1:]):
+        edges.append((junctions[left], junctions[right], right - left))
+        edges.append((junctions[right], junctions[left], right - left))
+    return nodes, edges
+
+
+_graph_cache: "OrderedDict[int, Tuple[bytes, TerminalGraph]]" = OrderedDict()
+# terminal id -> (layout digest, node keys, all-pairs matrix) from a snapshot, until the graph is built
+_restored_matrices: Dict[int, Tuple[str, List[str], np.ndarray]] = {}
+
+
+def get_terminal_graph(terminal_id: int, layout_data, gates, restaurants) -> TerminalGraph:
+    """Graph for a terminal, rebuilt only when its layout, gates or restaurants change"""
+    fingerprint = orjson.dumps(
+        [layout_data, sorted(gates, key=lambda g: g[0]), sorted(restaurants, key=lambda r: r[0])],
+        option=orjson.OPT_SORT_KEYS,
+    )
+    cached = _graph_cache.get(terminal_id)
+    if cached and cached[0] == fingerprint:
+        _graph_cache.move_to_end(terminal_id)
+        return cached[1]
+
+    graph = TerminalGraph.from_layout(terminal_id, layout_data, gates, restaurants)
+    restored = _restored_matrices.pop(terminal_id, None)
+    if restored is not None and restored[0] == hashlib.sha1(fingerprint).hexdigest():
+        _, keys, matrix = restored
+        if keys == graph.keys:
+            graph._matrix = matrix
+        elif sorted(keys) == sorted(graph.keys):
+            position = {key: i for i, key in enumerate(keys)}
+            order = [position[key] for key in graph.keys]
+            graph._matrix = matrix[np.ix_(order, order)]
+    _graph_cache[terminal_id] = (fingerprint, graph)
+    while len(_graph_cache) > GRAPH_CACHE_SIZE:
+        _graph_cache.popitem(last=False)
+    return graph
+
+
+async def precompute_graphs(graphs: Iterable[TerminalGraph]):
+    """Close the large graphs' all-pairs distances in the compute pool, concurrently"""
+    pending = [g for g in graphs if g.needs_matrix and len(g.keys) >= OFFLOAD_MIN_NODES]
+    if not pending:
+        return
+    matrices = await asyncio.gather(*(compute.submit("all_pairs", *g.edge_arrays()) for g in pending))
+    for graph, matrix in zip(pending, matrices):
+        if graph._matrix is None:
+            graph._matrix = matrix
+
+
+def dump_matrices() -> Tuple[dict, Dict[str, np.ndarray]]:
+    """Computed all-pairs matrices with their layout digests, for a warm-start snapshot"""
+    meta, arrays = {}, {}
+    for terminal_id, (fingerprint, graph) in list(_graph_cache.items()):
+        if graph._matrix is not None:
+            meta[str(terminal_id)] = {"digest": hashlib.sha1(fingerprint).hexdigest(), "keys": graph.keys}
+            arrays[str(terminal_id)] = graph._matrix
+    return meta, arrays
+
+
+def restore_matrices(meta: dict, arrays: Dict[str, np.ndarray]) -> int:
+    """Offer snapshot matrices to graphs built later, used if their layout digest matches"""
+    for terminal_id, saved in meta.items():
+        _restored_matrices[int(terminal_id)] = (saved["digest"], saved["keys"], arrays[terminal_id])
+    return len(meta)
+
+
+def drop_restored_matrices():
+    """Forget snapshot matrices no graph has claimed (terminals removed or not loaded)"""
+    _restored_matrices.clear()
+
+
+def load_terminal_graphs(
+    db: Session, terminal_ids: Iterable[int], layouts: Optional[Dict[int, Optional[dict]]] = None
+) -> Dict[int, TerminalGraph]:
+    """Walkway graphs for several terminals (three queries total, two if layouts are passed in)"""
+    terminal_ids = list(set(terminal_ids))
+    if not terminal_ids:
+        return {}
+    if layouts is None:
+        layouts = dict(db.query(Terminal.id, Terminal.layout_data).filter(Terminal.id.in_(terminal_ids)).all())
+    gates: Dict[int, list] = {tid: [] for tid in layouts}
+    restaurants: Dict[int, list] = {tid: [] for tid in layouts}
+    for terminal_id, gate_number, coords in db.query(
+        Gate.terminal_id, Gate.gate_number, Gate.coordinates
+    ).filter(Gate.terminal_id.in_(terminal_ids)):
+        gates[terminal_id].append((gate_number, coords))
+    for terminal_id, restaurant_id, location in db.query(
+        Restaurant.terminal_id, Restaurant.id, Restaurant.location
+    ).filter(Restaurant.terminal_id.in_(terminal_ids)):
+        restaurants[terminal_id].append((restaurant_id, location))
+
+    return {
+        terminal_id: get_terminal_graph(terminal_id, layouts[terminal_id], gates[terminal_id], restaurants[terminal_id])
+        for terminal_id in layouts
+    }
+
+
+def walking_distances(db: Session, terminal_id: int, source: str, targets: Sequence[str]) -> Dict[str, float]:
+    """Bulk API: walkway distance from one node to many within a terminal"""
+    graph = load_terminal_graphs(db, [terminal_id]).get(terminal_id)
+    if graph is None:
+        return {target: math.inf for target in targets}
+    return dict(zip(targets, graph.distances_from(source, targets).tolist()))
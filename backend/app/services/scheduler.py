@@ -0,0 +1,352 @@
+"""
+Deadline-aware dispatch.
+
+Orders waiting for an agent are queued by the latest time they can leave the
+restaurant and still reach the gate by their delivery deadline (flight
+boarding from the schedule feed, or the delivery SLA): earliest deadline
+first, with the restaurant-to-gate walk taken off as slack. dispatch_pending()
+hands the most urgent orders to agents first; orders with little slack are
+never batched into another agent's trip.
+
+The queue is rebuilt from the database (orders still ORDER_PLACED with no
+agent) on every dispatch, so it survives restarts and stays consistent
+across workers; it only decides the order in which pending work is served.
+Each database shard has its own queue (its agents only serve its airports).
+Within a shard airports don't wait on each other: when an airport's most
+urgent order can't be served, only that airport's other orders are held back.
+Orders no agent has capacity for wait in the queue; the background loop runs
+again as soon as a delivery or cancellation frees an agent. A new order is
+tried on its own with dispatch_order(), so placing one never runs a whole
+round in the request.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy.orm import Session, joinedload
+from app.database import all_shards, shard_for_id, shard_of
+from app.models.order import Order, OrderStatus
+from app.services.agent_load import agent_load
+from app.services.distance import MINUTES_PER_UNIT
+from app.services.flights import schedule
+from app.services.jobs import jobs
+from app.services.order_service import assign_delivery_agent
+from app.services.routing import gate_node, restaurant_node
+from app.services.tracing import traced, tracer
+from app.services.transit import load_airport_transit
+from app.services.trips import delivery_deadline, gate_terminals, order_airports
+
+logger = logging.getLogger(__name__)
+
+# Orders with less slack than this get a dedicated agent instead of joining a trip
+URGENT_SLACK_MINUTES = float(os.getenv("DISPATCH_URGENT_SLACK_MINUTES", "20"))
+DISPATCH_INTERVAL = float(os.getenv("DISPATCH_INTERVAL", "15"))
+
+
+class IndexedPriorityQueue:
+    """
+    Binary min-heap with a key -> position index, so a queued item's priority
+    can be changed or the item removed in O(log n). Equal priorities pop FIFO.
+    """
+
+    def __init__(self):
+        self._heap: List[list] = []  # [priority, sequence, key]
+        self._position: Dict[Hashable, int] = {}
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._position
+
+    def __iter__(self):
+        """Keys in priority order (does not modify the queue)"""
+        return iter(entry[2] for entry in sorted(self._heap))
+
+    def priority(self, key: Hashable) -> float:
+        return self._heap[self._position[key]][0]
+
+    def push(self, key: Hashable, priority: float):
+        """Add a key, or re-prioritize it if already queued"""
+        if key in self._position:
+            self.update(key, priority)
+            return
+        self._heap.append([priority, next(self._sequence), key])
+        self._position[key] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def update(self, key: Hashable, priority: float):
+        i = self._position[key]
+        old = self._heap[i][0]
+        self._heap[i][0] = priority
+        if priority < old:
+            self._sift_up(i)
+        elif priority > old:
+            self._sift_down(i)
+
+    def peek(self) -> Tuple[Hashable, float]:
+        priority, _, key = self._heap[0]
+        return key, priority
+
+    def pop(self) -> Tuple[Hashable, float]:
+        key, priority = self.peek()
+        self.remove(key)
+        return key, priority
+
+    def remove(self, key: Hashable):
+        i = self._position.pop(key)
+        last = self._heap.pop()
+        if i < len(self._heap):
+            self._heap[i] = last
+            self._position[last[2]] = i
+            self._sift_up(i)
+            self._sift_down(self._position[last[2]])
+
+    def _swap(self, i: int, j: int):
+        self._heap[i], self._heap[j] = self._heap[j], self._heap[i]
+        self._position[self._heap[i][2]] = i
+        self._position[self._heap[j][2]] = j
+
+    def _sift_up(self, i: int):
+        while i > 0:
+            parent = (i - 1) // 2
+            if self._heap[i] < self._heap[parent]:
+                self._swap(i, parent)
+                i = parent
+            else:
+                break
+
+    def _sift_down(self, i: int):
+        n = len(self._heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < n and self._heap[child] < self._heap[smallest]:
+                    smallest = child
+            if smallest == i:
+                break
+            self._swap(i, smallest)
+            i = smallest
+
+
+class DispatchScheduler:
+    """Pending orders keyed by latest departure from the restaurant (UTC timestamp)"""
+
+    def __init__(self):
+        self.queues: Dict[str, IndexedPriorityQueue] = {}  # shard name -> its pending orders
+        self.deadlines: Dict[int, float] = {}  # order id -> delivery deadline (UTC timestamp)
+        self.airports: Dict[int, Optional[int]] = {}  # order id -> its airport's id
+        self._schedule_versions: Dict[str, int] = {}  # shard name -> schedule version last applied
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._loop_ref: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def queue(self, db: Session) -> IndexedPriorityQueue:
+        return self.queues.setdefault(shard_of(db).name, IndexedPriorityQueue())
+
+    def priorities(
+        self, db: Session, orders: Sequence[Order], now: datetime
+    ) -> Dict[int, Tuple[float, float, Optional[int]]]:
+        """order id -> (latest start, deadline) as UTC timestamps, and its airport's id"""
+        airports = order_airports(db, orders)
+        walks: Dict[int, float] = {}
+        by_airport: Dict[int, List[Order]] = {}
+        for order in orders:
+            if airports[order.id] is not None:
+                by_airport.setdefault(airports[order.id].id, []).append(order)
+        for airport_id, airport_orders in by_airport.items():
+            transit = load_airport_transit(db, airport_id)
+            gates = gate_terminals(db, airport_id)
+            for order in airport_orders:
+                gate = (order.boarding_gate or "").upper()
+                distance = transit.distance(
+                    (order.restaurant.terminal_id, restaurant_node(order.restaurant_id)),
+                    (gates.get(gate), gate_node(gate))
+                )
+                walks[order.id] = distance * MINUTES_PER_UNIT if np.isfinite(distance) else 0.0
+
+        result = {}
+        for order in orders:
+            deadline = now + timedelta(minutes=delivery_deadline(order, airports[order.id], now))
+            latest_start = deadline - timedelta(minutes=walks.get(order.id, 0.0))
+            airport = airports[order.id]
+            result[order.id] = (latest_start.timestamp(), deadline.timestamp(), airport.id if airport else None)
+        return result
+
+    def _load_pending(self, db: Session, order_ids: Optional[Sequence[int]] = None) -> List[Order]:
+        query = db.query(Order).options(joinedload(Order.restaurant)).filter(
+            Order.status == OrderStatus.ORDER_PLACED,
+            Order.delivery_agent_id.is_(None)
+        )
+        if order_ids is not None:
+            query = query.filter(Order.id.in_(order_ids))
+        return query.all()
+
+    def _enqueue(self, db: Session, orders: Sequence[Order], now: datetime):
+        if not orders:
+            return
+        queue = self.queue(db)
+        for order_id, (latest_start, deadline, airport_id) in self.priorities(db, orders, now).items():
+            queue.push(order_id, latest_start)
+            self.deadlines[order_id] = deadline
+            self.airports[order_id] = airport_id
+
+    def _forget(self, order_id: int):
+        queue = self.queues.get(shard_for_id(order_id).name)
+        if queue is not None and order_id in queue:
+            queue.remove(order_id)
+        self.deadlines.pop(order_id, None)
+        self.airports.pop(order_id, None)
+
+    def sync(self, db: Session, now: datetime):
+        """Match the queue to the orders still waiting in the database"""
+        queue = self.queue(db)
+        shard = shard_of(db).name
+        pending = self._load_pending(db)
+        pending_ids = {order.id for order in pending}
+        for order_id in [key for key in queue if key not in pending_ids]:
+            self._forget(order_id)
+        # When the flight feed changed every deadline may have moved, otherwise only new orders need one
+        schedule_changed = schedule.refresh() or self._schedule_versions.get(shard) != schedule.version
+        self._schedule_versions[shard] = schedule.version
+        self._enqueue(db, pending if schedule_changed else [o for o in pending if o.id not in queue], now)
+
+    def reprioritize(self, db: Session, order_ids: Sequence[int], now: Optional[datetime] = None):
+        """Recompute deadlines for specific queued orders (e.g. after a gate or flight change)"""
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            queue = self.queue(db)
+            self._enqueue(db, self._load_pending(db, [i for i in order_ids if i in queue]), now)
+
+    @traced()
+    def dispatch_pending(self, db: Session, now: Optional[datetime] = None) -> List[int]:
+        """Assign waiting orders to agents, least slack first; returns the IDs assigned"""
+        now = now or datetime.now(timezone.utc)
+        assigned = []
+        with self._lock:
+            self.sync(db, now)
+            queue = self.queue(db)
+            blocked = set()  # airports whose most urgent waiting order nobody could take
+            for order_id in list(queue):
+                airport_id = self.airports.get(order_id)
+                if airport_id in blocked:
+                    continue
+                slack = (queue.priority(order_id) - now.timestamp()) / 60
+                agent = assign_delivery_agent(order_id, db, allow_batching=slack >= URGENT_SLACK_MINUTES, now=now)
+                if agent is None:
+                    blocked.add(airport_id)  # its less urgent orders wait too; other airports go on
+                    continue
+                self._forget(order_id)
+                assigned.append(order_id)
+        return assigned
+
+    @traced()
+    def dispatch_order(self, db: Session, order_id: int, now: Optional[datetime] = None) -> bool:
+        """
+        Assign one new order now if no queued order in its airport is at least
+        as urgent; otherwise it waits its turn and the background round is
+        woken. Only this order is loaded and queued: reconciling the queue
+        with the database is left to the background round. Returns whether
+        it was assigned.
+        """
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            queue = self.queue(db)
+            self._enqueue(db, self._load_pending(db, [order_id]), now)
+            if order_id not in queue:
+                return False  # taken or cancelled already
+            latest_start, airport_id = queue.priority(order_id), self.airports[order_id]
+            ahead = any(
+                other != order_id and other_airport == airport_id and other in queue
+                and queue.priority(other) <= latest_start
+                for other, other_airport in self.airports.items()
+            )
+            if not ahead:
+                slack = (latest_start - now.timestamp()) / 60
+                if assign_delivery_agent(order_id, db, allow_batching=slack >= URGENT_SLACK_MINUTES, now=now):
+                    self._forget(order_id)
+                    return True
+        self.wake()
+        return False
+
+    def snapshot(self, now: Optional[datetime] = None) -> List[dict]:
+        """Queued orders in dispatch order, for monitoring"""
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            queued = sorted(
+                (queue.priority(order_id), order_id)
+                for queue in self.queues.values() for order_id in queue
+            )
+            return [
+                {
+                    "order_id": order_id,
+                    "deadline": datetime.fromtimestamp(self.deadlines[order_id], timezone.utc),
+                    "slack_minutes": round((latest_start - now.timestamp()) / 60, 1),
+                }
+                for latest_start, order_id in queued
+            ]
+
+    def start(self, on_assigned: Callable[[List[int]], None], interval: float = DISPATCH_INTERVAL):
+        """
+        Periodically dispatch in the background (orders can wait when no agent
+        is free); on_assigned(order_ids) is queued as a job after each round
+        """
+        if self._task is None or self._task.done():
+            self._loop_ref = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            agent_load.on_release(self.wake)
+            self._task = asyncio.create_task(self._loop(on_assigned, interval))
+
+    def wake(self):
+        """Run the next background round now (thread-safe), e.g. when an agent has capacity again"""
+        if self._loop_ref is not None and self._wakeup is not None and not self._loop_ref.is_closed():
+            self._loop_ref.call_soon_threadsafe(self._wakeup.set)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self, on_assigned: Callable[[List[int]], None], interval: float):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                # A trace per round; the on_assigned job joins it
+                with tracer.span("dispatch round"):
+                    assigned = await asyncio.to_thread(self._dispatch_with_session)
+                    if assigned:
+                        jobs.enqueue(on_assigned, assigned)
+            except Exception:
+                logger.exception("Background dispatch failed")
+
+    def _dispatch_with_session(self) -> List[int]:
+        """One dispatch round on every shard"""
+        assigned = []
+        for shard in all_shards():
+            db = shard.SessionLocal()
+            try:
+                assigned.extend(self.dispatch_pending(db))
+            finally:
+                db.close()
+        return assigned
+
+
+scheduler = DispatchScheduler()
+
+
+def dispatch_pending(db: Session) -> List[int]:
+    return scheduler.dispatch_pending(db)
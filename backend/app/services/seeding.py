@@ -0,0 +1,338 @@
+"""
+Seed data loading.
+
+Seed data is declarative: a fixture is a dict of airports (with nested
+terminals, gates and restaurants) plus delivery agents, either read from
+app/fixtures/airports.json or produced by generate_fixture() for load tests.
+
+Fixtures are flattened into per-table rows with IDs assigned up front, then
+written with one bulk statement per table: COPY on PostgreSQL, executemany
+everywhere else. No per-object add/flush round trips.
+
+With several database shards, seed_shards() splits a fixture by airport and
+seeds every shard at once; an agent goes to the shard of its optional
+"airport" code.
+"""
+import csv
+import io
+import json
+import os
+import random
+import string
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+from app.database import Shard, scatter, shard_for_airport, shard_of
+from app.models.airport import Airport, Terminal, Gate
+from app.models.restaurant import Restaurant
+from app.models.delivery_agent import AGENT_DEFAULT_CAPACITY, DeliveryAgent, AgentStatus
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "fixtures", "airports.json")
+
+# Parent tables first so foreign keys resolve
+TABLES = [
+    ("airports", Airport.__table__),
+    ("terminals", Terminal.__table__),
+    ("gates", Gate.__table__),
+    ("restaurants", Restaurant.__table__),
+    ("agents", DeliveryAgent.__table__),
+]
+
+
+def load_fixture(path: str = DEFAULT_FIXTURE) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _next_id(db: Session, table) -> int:
+    """Next ID in the session's shard's range"""
+    return max(db.execute(func.max(table.c.id).select()).scalar() or 0, shard_of(db).id_base) + 1
+
+
+def flatten_fixture(db: Session, fixture: dict) -> Dict[str, List[dict]]:
+    """Turn a nested fixture into insert-ready rows with explicit primary keys"""
+    next_ids = {name: _next_id(db, table) for name, table in TABLES}
+    rows: Dict[str, List[dict]] = {name: [] for name, _ in TABLES}
+
+    def take_id(name: str) -> int:
+        value = next_ids[name]
+        next_ids[name] += 1
+        return value
+
+    # Agents name their airport by code; it may have been seeded earlier
+    airport_ids = dict(db.query(Airport.code, Airport.id))
+    for airport in fixture.get("airports", []):
+        airport_id = take_id("airports")
+        airport_ids[airport["code"]] = airport_id
+        rows["airports"].append({
+            "id": airport_id,
+            "code": airport["code"],
+            "name": airport["name"],
+            "city": airport["city"],
+            "state": airport["state"],
+            "timezone": airport["timezone"],
+            "latitude": airport.get("latitude"),
+            "longitude": airport.get("longitude"),
+        })
+        for terminal in airport.get("terminals", []):
+            terminal_id = take_id("terminals")
+            rows["terminals"].append({
+                "id": terminal_id,
+                "airport_id": airport_id,
+                "name": terminal["name"],
+                "layout_data": terminal.get("layout_data"),
+            })
+            for gate in terminal.get("gates", []):
+                rows["gates"].append({
+                    "id": take_id("gates"),
+                    "terminal_id": terminal_id,
+                    "gate_number": gate["gate_number"],
+                    "coordinates": gate.get("coordinates"),
+                })
+            for restaurant in terminal.get("restaurants", []):
+                rows["restaurants"].append({
+                    "id": take_id("restaurants"),
+                    "terminal_id": terminal_id,
+                    "name": restaurant["name"],
+                    "cuisine_type": restaurant.get("cuisine_type"),
+                    "location": restaurant.get("location"),
+                    "nearby_gates": restaurant.get("nearby_gates"),
+                    "estimated_prep_time": restaurant.get("estimated_prep_time", 15),
+                    "mock_ordering_slug": restaurant.get("mock_ordering_slug"),
+                    "description": restaurant.get("description"),
+                })
+
+    for agent in fixture.get("agents", []):
+        rows["agents"].append({
+            "id": take_id("agents"),
+            "name": agent["name"],
+            "agent_code": agent["agent_code"],
+            "password": agent.get("password"),
+            "status": AgentStatus(agent.get("status", AgentStatus.AVAILABLE)),
+            "airport_id": airport_ids.get(agent.get("airport")),
+            "current_location": agent.get("current_location"),
+            "contact": agent.get("contact"),
+            "capacity": agent.get("capacity", AGENT_DEFAULT_CAPACITY),
+            "shift_start": _timestamp(agent.get("shift_start")),
+            "shift_end": _timestamp(agent.get("shift_end")),
+        })
+    return rows
+
+
+def _timestamp(value: Optional[str]) -> Optional[datetime]:
+    """ISO 8601 fixture timestamp (e.g. an agent's shift start)"""
+    return datetime.fromisoformat(value) if value else None
+
+
+def _copy_rows(db: Session, table, rows: List[dict]):
+    """PostgreSQL COPY ... FROM STDIN (CSV) through the session's psycopg2 connection"""
+    columns = list(rows[0].keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        values = []
+        for column in columns:
+            value = row[column]
+            if value is None:
+                values.append("")  # CSV NULL
+            elif isinstance(value, AgentStatus):
+                values.append(value.name)  # Native enum stores member names
+            elif isinstance(value, (dict, list)):
+                values.append(json.dumps(value))
+            else:
+                values.append(value)
+        writer.writerow(values)
+    buffer.seek(0)
+
+    raw = db.connection().connection.driver_connection
+    with raw.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+        # Explicit IDs bypass the serial sequence; move it past what we inserted
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), (SELECT MAX(id) FROM {table.name}))"
+        )
+
+
+def bulk_insert(db: Session, rows: Dict[str, List[dict]]) -> Dict[str, int]:
+    """Write flattened rows table by table. Caller commits."""
+    use_copy = db.get_bind().dialect.name == "postgresql"
+    counts = {}
+    for name, table in TABLES:
+        table_rows = rows.get(name, [])
+        counts[name] = len(table_rows)
+        if not table_rows:
+            continue
+        if use_copy:
+            _copy_rows(db, table, table_rows)
+        else:
+            db.execute(insert(table), table_rows)
+    return counts
+
+
+def seed_from_fixture(db: Session, fixture: Optional[dict] = None) -> Dict[str, int]:
+    """Load a fixture (default: app/fixtures/airports.json) in bulk and commit"""
+    if fixture is None:
+        fixture = load_fixture()
+    counts = bulk_insert(db, flatten_fixture(db, fixture))
+    db.commit()
+    return counts
+
+
+def fixture_for_shard(fixture: dict, shard: Shard) -> dict:
+    """The airports (and agents) of a fixture that belong in shard"""
+    return {
+        "airports": [a for a in fixture.get("airports", []) if shard_for_airport(a["code"]) is shard],
+        "agents": [a for a in fixture.get("agents", []) if shard_for_airport(a.get("airport")) is shard],
+    }
+
+
+def seed_shards(fixture: Optional[dict] = None) -> Dict[str, int]:
+    """seed_from_fixture() on every shard with its part of the fixture; returns the total counts"""
+    if fixture is None:
+        fixture = load_fixture()
+    totals = {name: 0 for name, _ in TABLES}
+    for counts in scatter(lambda db: seed_from_fixture(db, fixture_for_shard(fixture, shard_of(db)))):
+        for name, count in counts.items():
+            totals[name] += count
+    return totals
+
+
+# --- Synthetic data for load testing ---
+
+CUISINES = [
+    ("Mexican", "Fresh Mexican food", 15),
+    ("Fast Food", "Classic fast food", 10),
+    ("Coffee", "Coffee and light snacks", 5),
+    ("Sandwiches", "Fresh sandwiches", 8),
+    ("Pizza", "Pizza by the slice", 12),
+    ("Asian", "Noodles and rice bowls", 14),
+    ("Bar & Grill", "Burgers and drinks", 20),
+    ("Healthy", "Salads and smoothies", 7),
+]
+BRANDS = {
+    "Mexican": ["Chipotle", "Qdoba", "Tortas Frontera"],
+    "Fast Food": ["McDonald's", "Burger King", "Shake Shack"],
+    "Coffee": ["Starbucks", "Peet's Coffee", "Dunkin'"],
+    "Sandwiches": ["Subway", "Potbelly", "Jersey Mike's"],
+    "Pizza": ["Sbarro", "California Pizza Kitchen", "Villa Italian"],
+    "Asian": ["Panda Express", "Wok & Roll", "Ramen Bar"],
+    "Bar & Grill": ["Chili's", "Bar Symon", "Smashburger"],
+    "Healthy": ["Jamba", "Farmer's Fridge", "Sweetgreen"],
+}
+TIMEZONES = [
+    ("NY", "America/New_York"), ("GA", "America/New_York"), ("FL", "America/New_York"),
+    ("IL", "America/Chicago"), ("TX", "America/Chicago"), ("CO", "America/Denver"),
+    ("AZ", "America/Phoenix"), ("CA", "America/Los_Angeles"), ("WA", "America/Los_Angeles"),
+]
+GATE_SPACING = 50
+PIER_Y = 200
+FOOD_COURT_Y = 300
+
+
+def _airport_codes(count: int, rng: random.Random) -> List[str]:
+    letters = string.ascii_uppercase
+    if count > len(letters) ** 3:
+        raise ValueError("At most 17576 three-letter airport codes are available")
+    codes = set()
+    while len(codes) < count:
+        codes.add("".join(rng.choice(letters) for _ in range(3)))
+    return sorted(codes)
+
+
+def _city_name(rng: random.Random) -> str:
+    syllables = ["ar", "bel", "cas", "dor", "el", "fen", "gran", "hol", "is", "jun", "kel", "lor",
+                 "mar", "nor", "or", "port", "quin", "ros", "san", "ter", "val", "wes"]
+    return "".join(rng.choice(syllables) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def _terminal(index: int, gates: int, restaurants: int, rng: random.Random) -> dict:
+    """
+    One pier-style concourse: gates in a row along the pier, restaurants
+    clustered into food courts across the walkway from them.
+    """
+    letter = string.ascii_uppercase[index % 26]
+    width = (gates + 2) * GATE_SPACING
+    gate_rows = [
+        {"gate_number": f"{letter}{n + 1}", "coordinates": {"x": (n + 1) * GATE_SPACING, "y": PIER_Y}}
+        for n in range(gates)
+    ]
+
+    food_courts = max(1, restaurants // 4)
+    restaurant_rows = []
+    for n in range(restaurants):
+        court_x = int(width * (n % food_courts + 1) / (food_courts + 1))
+        x = court_x + rng.randint(-40, 40)
+        cuisine, description, prep_time = rng.choice(CUISINES)
+        name = rng.choice(BRANDS[cuisine])
+        nearby = [g["gate_number"] for g in gate_rows if abs(g["coordinates"]["x"] - x) <= 2 * GATE_SPACING]
+        restaurant_rows.append({
+            "name": name,
+            "cuisine_type": cuisine,
+            "location": {"x": x, "y": FOOD_COURT_Y + rng.randint(-20, 20)},
+            "nearby_gates": nearby,
+            "estimated_prep_time": prep_time,
+            "mock_ordering_slug": name.lower().replace("'", "").replace("&", "and").replace(" ", "-"),
+            "description": description,
+        })
+
+    return {
+        "name": f"Terminal {letter}",
+        "layout_data": {"width": width, "height": 600},
+        "gates": gate_rows,
+        "restaurants": restaurant_rows,
+    }
+
+
+def generate_fixture(
+    airports: int = 100,
+    terminals_per_airport: int = 3,
+    gates_per_terminal: int = 20,
+    restaurants_per_terminal: int = 8,
+    agents: int = 500,
+    seed: int = 42,
+) -> dict:
+    """
+    Build a synthetic fixture in the same shape as app/fixtures/airports.json.
+    Terminal and gate counts vary around the given averages so layouts differ
+    between airports. Output is deterministic for a given seed.
+    """
+    rng = random.Random(seed)
+    fixture = {"airports": [], "agents": []}
+
+    codes = _airport_codes(airports, rng)
+    for code in codes:
+        state, timezone = rng.choice(TIMEZONES)
+        city = _city_name(rng)
+        terminal_count = max(1, terminals_per_airport + rng.randint(-1, 1))
+        fixture["airports"].append({
+            "code": code,
+            "name": f"{city} International Airport",
+            "city": city,
+            "state": state,
+            "timezone": timezone,
+            "latitude": f"{rng.uniform(25, 48):.4f}",
+            "longitude": f"{rng.uniform(-123, -70):.4f}",
+            "terminals": [
+                _terminal(
+                    index,
+                    max(2, gates_per_terminal + rng.randint(-gates_per_terminal // 4, gates_per_terminal // 4)),
+                    max(1, restaurants_per_terminal + rng.randint(-2, 2)),
+                    rng,
+                )
+                for index in range(terminal_count)
+            ],
+        })
+
+    for n in range(agents):
+        fixture["agents"].append({
+            "name": f"Delivery Agent {n + 1}",
+            "agent_code": f"AGENT{n + 1:05d}",
+            "status": AgentStatus.AVAILABLE.value,
+            "contact": f"agent{n + 1}@airportdelivery.com",
+            "airport": codes[n % len(codes)] if codes else None,
+        })
+    return fixture
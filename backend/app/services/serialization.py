@@ -0,0 +1,48 @@
+"""
+JSON fast path.
+
+ORM objects are validated once against the response schemas and dumped to
+plain Python data; orjson then encodes that directly. Endpoints return an
+ORJSONResponse so FastAPI does not validate the response model a second time.
+"""
+import orjson
+from fastapi.responses import ORJSONResponse, Response
+from typing import Any, Iterable, List
+from app.schemas.order import OrderResponse, OrderResponseList
+from app.schemas.restaurant import RestaurantResponseList
+
+
+def order_payload(order) -> dict:
+    """Serialize one ORM order (restaurant/agent names come from relationships)"""
+    return OrderResponse.model_validate(order).model_dump()
+
+
+def order_list_payload(orders: Iterable) -> List[dict]:
+    return OrderResponseList.dump_python(
+        OrderResponseList.validate_python(list(orders), from_attributes=True)
+    )
+
+
+def restaurant_list_payload(restaurants: Iterable) -> List[dict]:
+    return RestaurantResponseList.dump_python(
+        RestaurantResponseList.validate_python(list(restaurants), from_attributes=True)
+    )
+
+
+def json_response(content: Any, status_code: int = 200, headers: dict = None) -> ORJSONResponse:
+    return ORJSONResponse(content=content, status_code=status_code, headers=headers)
+
+
+def encode(content: Any) -> bytes:
+    """Same bytes ORJSONResponse would send"""
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def raw_json_response(body: bytes, status_code: int = 200, headers: dict = None) -> Response:
+    """Response for a body that is already encoded (e.g. from the order cache)"""
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+def dumps(content: Any) -> str:
+    """Encode once for WebSocket fan-out (send_text to every socket); same options as ORJSONResponse"""
+    return encode(content).decode()
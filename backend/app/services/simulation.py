@@ -0,0 +1,418 @@
+"""
+Discrete-event simulation of delivery operations, for capacity planning.
+
+A simulation runs the real code paths against its own database: orders are
+queued and handed out by DispatchScheduler / assign_delivery_agent(), agents
+walk the stops TripPlanner orders for them (walking times from the transit
+model and distance.MINUTES_PER_UNIT), and every pickup and delivery goes
+through the OrderStatus transitions in order_state. Only the clock is
+simulated: the next event (an order arriving, an agent reaching a stop, a
+shift starting, a dispatch retry) is taken from a heap, so hours of
+operations run in seconds.
+
+Demand is a list of order arrivals, either synthetic (Poisson arrivals per
+airport, see synthetic_demand()) or recorded (recorded_demand() exports past
+orders in the same format):
+
+    {"minute": 12.5, "airport": "JFK", "restaurant": "Chipotle", "gate": "A10",
+     "boarding_minutes": 55}
+
+minute is the time since the start of the simulation; boarding_minutes (when
+given) is how long after ordering the customer's flight boards, and becomes
+a flight in the feed so dispatch sees the deadline. Rosters list agents as
+{"airport": "JFK", "gate": "A1", "capacity": 3, "shift_start": 0, "shift_end": 480}
+with shift bounds in simulation minutes (missing: the whole run).
+
+Use simulate.py to run one; it points the app at a throwaway database and
+flight feed first.
+"""
+import heapq
+import itertools
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from app.models.airport import Airport, Terminal
+from app.models.delivery_agent import DeliveryAgent
+from app.models.order import Order, OrderStatus
+from app.models.restaurant import Restaurant
+from app.services.dispatch import as_utc
+from app.services.flights import DELIVERY_LEAD_MINUTES, schedule
+from app.services.order_state import transition
+from app.services.otp_service import generate_otp
+from app.services.routing import GATE_PREFIX, gate_node
+from app.services.scheduler import DispatchScheduler
+from app.services.seeding import seed_from_fixture
+from app.services.transit import Node, load_airport_transit
+from app.services.trips import (
+    PICKUP, TRIP_DELIVERY_SLA_MINUTES, TripPlanner, build_stops, current_trip, gate_terminals, order_airports
+)
+
+logger = logging.getLogger(__name__)
+
+# How often dispatch is retried while orders wait (the app's DISPATCH_INTERVAL is 15s)
+SIMULATION_DISPATCH_MINUTES = 0.25
+
+
+def synthetic_demand(
+    fixture: dict, orders_per_hour: float, hours: float, seed: int = 42,
+    boarding_minutes: Tuple[float, float] = (35, 120)
+) -> List[dict]:
+    """Poisson order arrivals at every airport of a fixture, uniform over its restaurants and gates"""
+    rng = np.random.default_rng(seed)
+    demand = []
+    for airport in fixture["airports"]:
+        restaurants = [r["name"] for t in airport.get("terminals", []) for r in t.get("restaurants", [])]
+        gates = [g["gate_number"] for t in airport.get("terminals", []) for g in t.get("gates", [])]
+        if not restaurants or not gates:
+            continue
+        count = rng.poisson(orders_per_hour * hours)
+        minutes = np.sort(rng.uniform(0, hours * 60, count))
+        picks = rng.integers(len(restaurants), size=count)
+        at_gates = rng.integers(len(gates), size=count)
+        boarding = rng.uniform(*boarding_minutes, size=count)
+        demand.extend(
+            {
+                "minute": round(float(m), 2), "airport": airport["code"], "restaurant": restaurants[r],
+                "gate": gates[g], "boarding_minutes": round(float(b), 1),
+            }
+            for m, r, g, b in zip(minutes, picks, at_gates, boarding)
+        )
+    return sorted(demand, key=lambda spec: spec["minute"])
+
+
+def synthetic_roster(
+    fixture: dict, agents_per_airport: int, capacity: int = 3, seed: int = 42,
+    shift_minutes: Optional[float] = None, hours: float = 0
+) -> List[dict]:
+    """
+    agents_per_airport agents at random gates of each airport; with shift_minutes,
+    their shifts start staggered across the run instead of covering all of it
+    """
+    rng = random.Random(seed)
+    roster = []
+    for airport in fixture["airports"]:
+        gates = [g["gate_number"] for t in airport.get("terminals", []) for g in t.get("gates", [])]
+        if not gates:
+            continue
+        for n in range(agents_per_airport):
+            agent = {"airport": airport["code"], "gate": rng.choice(gates), "capacity": capacity}
+            if shift_minutes:
+                start = max(0.0, hours * 60 - shift_minutes) * n / max(1, agents_per_airport - 1)
+                agent.update(shift_start=round(start, 1), shift_end=round(start + shift_minutes, 1))
+            roster.append(agent)
+    return roster
+
+
+def recorded_demand(db: Session, since: datetime, until: Optional[datetime] = None) -> List[dict]:
+    """Orders placed in [since, until) as simulation demand (minutes from since)"""
+    query = db.query(
+        Order.created_at, Order.boarding_gate, Order.flight_number, Restaurant.name, Airport.code, Airport.timezone
+    ).select_from(Order).join(Restaurant).join(Terminal).join(Airport).filter(
+        Order.created_at >= since
+    )
+    if until is not None:
+        query = query.filter(Order.created_at < until)
+    demand = []
+    for created_at, gate, flight_number, restaurant, code, tz_name in query.order_by(Order.created_at):
+        created_at = as_utc(created_at)
+        spec = {
+            "minute": round((created_at - since).total_seconds() / 60, 2),
+            "airport": code, "restaurant": restaurant, "gate": gate,
+        }
+        boarding = schedule.delivery_deadline(flight_number, code, tz_name, created_at)
+        if boarding is not None:
+            spec["boarding_minutes"] = round((boarding - created_at).total_seconds() / 60, 1)
+        demand.append(spec)
+    return demand
+
+
+def _summary(values: List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    data = np.asarray(values)
+    p50, p90, p95, p99 = np.percentile(data, [50, 90, 95, 99])
+    return {
+        "count": len(values), "mean": round(float(data.mean()), 1), "p50": round(float(p50), 1),
+        "p90": round(float(p90), 1), "p95": round(float(p95), 1), "p99": round(float(p99), 1),
+        "max": round(float(data.max()), 1),
+    }
+
+
+class SimulatedOrder:
+    __slots__ = ("id", "airport", "created", "boarding", "assigned", "delivered")
+
+    def __init__(self, order_id: int, airport: str, created: float, boarding: Optional[float]):
+        self.id = order_id
+        self.airport = airport
+        self.created = created
+        self.boarding = boarding  # minute the flight boards, if known
+        self.assigned: Optional[float] = None
+        self.delivered: Optional[float] = None
+
+
+class SimulatedAgent:
+    __slots__ = (
+        "id", "airport", "position", "shift_start", "shift_end", "moving", "busy_since", "busy", "overtime", "stops"
+    )
+
+    def __init__(self, agent_id: int, airport: str, position: Optional[Node], shift_start: float, shift_end: float):
+        self.id = agent_id
+        self.airport = airport
+        self.position = position
+        self.shift_start = shift_start
+        self.shift_end = shift_end
+        self.moving = False  # walking to a stop (a "stop" event is pending)
+        self.busy_since: Optional[float] = None  # minute it last went from no orders to some
+        self.busy = 0.0  # minutes with orders during the shift
+        self.overtime = 0.0  # ... and outside it (finishing a trip after the shift ends)
+        self.stops = 0
+
+    def idle_at(self, minute: float):
+        """Close the busy stretch that started at busy_since"""
+        if self.busy_since is None:
+            return
+        on_shift = max(0.0, min(minute, self.shift_end) - max(self.busy_since, self.shift_start))
+        self.busy += on_shift
+        self.overtime += minute - self.busy_since - on_shift
+        self.busy_since = None
+
+
+class Simulation:
+    """
+    One run: fixture (airports, terminals, gates, restaurants), roster and
+    demand, starting at start (UTC) and lasting until every order is closed
+    or drain_minutes after the last arrival
+    """
+
+    def __init__(
+        self, fixture: dict, roster: List[dict], demand: List[dict],
+        start: Optional[datetime] = None, drain_minutes: float = 240
+    ):
+        self.fixture = fixture
+        self.roster = roster
+        self.demand = sorted(demand, key=lambda spec: spec["minute"])
+        self.start = start or datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        self.end = (self.demand[-1]["minute"] if self.demand else 0.0) + drain_minutes
+        self.scheduler = DispatchScheduler()
+        self.orders: Dict[int, SimulatedOrder] = {}
+        self.agents: Dict[int, SimulatedAgent] = {}
+        self._events: List[tuple] = []
+        self._sequence = itertools.count()
+        self._dispatch_pending_at: Optional[float] = None
+        self.clock = 0.0
+
+    def at(self, minute: float) -> datetime:
+        return self.start + timedelta(minutes=minute)
+
+    def flight_feed(self) -> dict:
+        """Flights for orders with a boarding time (flight number SIM<n>, n = index in demand)"""
+        return {"flights": [
+            {
+                "flight_number": f"SIM{n}", "airport": spec["airport"], "gate": spec["gate"],
+                "departure": self.at(spec["minute"] + spec["boarding_minutes"] + DELIVERY_LEAD_MINUTES).isoformat(),
+            }
+            for n, spec in enumerate(self.demand) if spec.get("boarding_minutes") is not None
+        ]}
+
+    def seed(self, db: Session):
+        """Load the fixture's airports and the roster (as its agents) into db"""
+        agents = []
+        for n, agent in enumerate(self.roster, start=1):
+            agents.append({
+                "name": f"Simulated Agent {n}",
+                "agent_code": f"SIM{n:05d}",
+                "airport": agent["airport"],
+                "current_location": agent.get("gate"),
+                "capacity": agent.get("capacity", 3),
+                "shift_start": self.at(agent["shift_start"]).isoformat() if agent.get("shift_start") is not None else None,
+                "shift_end": self.at(agent["shift_end"]).isoformat() if agent.get("shift_end") is not None else None,
+            })
+        seed_from_fixture(db, {"airports": self.fixture["airports"], "agents": agents})
+
+    def _push(self, minute: float, kind: str, *data):
+        heapq.heappush(self._events, (float(minute), next(self._sequence), kind, data))
+
+    def run(self, db: Session, progress: Optional[Callable[[float], None]] = None) -> dict:
+        started = time.perf_counter()
+        airports = dict(db.query(Airport.code, Airport.id))
+        restaurants = {
+            (code, name): (restaurant_id, prep)
+            for restaurant_id, name, prep, code in db.query(
+                Restaurant.id, Restaurant.name, Restaurant.estimated_prep_time, Airport.code
+            ).select_from(Restaurant).join(Terminal).join(Airport)
+        }
+        gates = {code: gate_terminals(db, airport_id) for code, airport_id in airports.items()}
+
+        for agent, spec in zip(db.query(DeliveryAgent).order_by(DeliveryAgent.id), self.roster):
+            gate = (spec.get("gate") or "").upper()
+            terminal_id = gates.get(spec["airport"], {}).get(gate)
+            self.agents[agent.id] = SimulatedAgent(
+                agent.id, spec["airport"], (terminal_id, gate_node(gate)) if terminal_id else None,
+                spec.get("shift_start") or 0.0, spec.get("shift_end") if spec.get("shift_end") is not None else self.end,
+            )
+            if spec.get("shift_start"):
+                self._push(spec["shift_start"], "dispatch")
+        for n, spec in enumerate(self.demand):
+            self._push(spec["minute"], "arrive", n, spec)
+
+        skipped = 0
+        while self._events:
+            minute, _, kind, data = heapq.heappop(self._events)
+            if minute > self.end:
+                break
+            self.clock = minute
+            if kind == "arrive":
+                n, spec = data
+                found = restaurants.get((spec["airport"], spec["restaurant"]))
+                if found is None or (spec.get("gate") or "").upper() not in gates.get(spec["airport"], {}):
+                    skipped += 1
+                    continue
+                self._arrive(db, n, spec, *found)
+            elif kind == "stop":
+                self._reach_stop(db, *data)
+            elif kind == "dispatch":
+                if self._dispatch_pending_at == minute:
+                    self._dispatch_pending_at = None
+                self._dispatch(db)
+            if progress:
+                progress(minute)
+
+        return self.report(time.perf_counter() - started, skipped)
+
+    def _arrive(self, db: Session, n: int, spec: dict, restaurant_id: int, prep: Optional[int]):
+        created = self.at(self.clock)
+        order = Order(
+            order_confirmation=f"SIM{n:07d}",
+            restaurant_id=restaurant_id,
+            user_name="Simulated customer",
+            user_contact="simulated@example.com",
+            boarding_gate=spec["gate"],
+            flight_number=f"SIM{n}" if spec.get("boarding_minutes") is not None else None,
+            estimated_pickup_time=created + timedelta(minutes=spec.get("prep_minutes", prep or 0)),
+            status=OrderStatus.ORDER_PLACED,
+            created_at=created,
+        )
+        db.add(order)
+        db.commit()
+        boarding = self.clock + spec["boarding_minutes"] if spec.get("boarding_minutes") is not None else None
+        self.orders[order.id] = SimulatedOrder(order.id, spec["airport"], self.clock, boarding)
+        self._dispatch(db)
+
+    def _dispatch(self, db: Session):
+        """One dispatch round, as the app runs on new orders, freed agents and its timer"""
+        assigned = self.scheduler.dispatch_pending(db, self.at(self.clock))
+        if assigned:
+            for order_id, agent_id in db.query(Order.id, Order.delivery_agent_id).filter(Order.id.in_(assigned)):
+                self.orders[order_id].assigned = self.clock
+                agent = self.agents[agent_id]
+                if agent.busy_since is None:
+                    agent.busy_since = self.clock
+                self._next_stop(db, agent)
+        waiting = any(len(queue) for queue in self.scheduler.queues.values())
+        if waiting and self._dispatch_pending_at is None:
+            self._dispatch_pending_at = self.clock + SIMULATION_DISPATCH_MINUTES
+            self._push(self._dispatch_pending_at, "dispatch")
+
+    def _next_stop(self, db: Session, agent: SimulatedAgent):
+        """Send an idle agent to the first stop of its (re)planned trip"""
+        if agent.moving:
+            return  # replans on arrival
+        now = self.at(self.clock)
+        airport_id, orders, _ = current_trip(db, agent.id)
+        stops = []
+        if airport_id is not None:
+            airport = order_airports(db, orders[:1])[orders[0].id]
+            stops, _ = build_stops(orders, gate_terminals(db, airport_id), airport, now)
+        if not stops:
+            agent.idle_at(self.clock)
+            return
+        transit = load_airport_transit(db, airport_id)
+        start = agent.position
+        if start is not None and start[0] not in transit.graphs:
+            # Agents only report a gate name, which dispatch reads as that gate in the order's airport
+            terminal_id = gate_terminals(db, airport_id).get(start[1][len(GATE_PREFIX):])
+            start = (terminal_id, start[1]) if terminal_id is not None else None
+        planner = TripPlanner(stops, start, transit)
+        route = planner.plan()
+        _, timeline = planner.evaluate(route)
+        stop = planner.stops[route[0] - 1]
+        if not np.isfinite(timeline[0][0]):
+            logger.warning("Agent %s cannot reach order %s; leaving it idle", agent.id, stop.order.id)
+            agent.idle_at(self.clock)
+            return
+        agent.moving = True
+        self._push(self.clock + max(timeline[0][0], 1e-6), "stop", agent.id, stop.order.id, stop.action, stop.node)
+
+    def _reach_stop(self, db: Session, agent_id: int, order_id: int, action: str, node: Node):
+        agent = self.agents[agent_id]
+        agent.moving = False
+        agent.position = node
+        agent.stops += 1
+        try:
+            if action == PICKUP:
+                transition(db, order_id, OrderStatus.PICKED_UP, agent_id=agent_id, delivery_otp=generate_otp())
+                transition(db, order_id, OrderStatus.IN_TRANSIT, agent_id=agent_id)
+            else:
+                otp = db.query(Order.delivery_otp).filter(Order.id == order_id).scalar()
+                transition(db, order_id, OrderStatus.DELIVERED, agent_id=agent_id, otp=otp)
+                self.orders[order_id].delivered = self.clock
+                db.query(DeliveryAgent).filter(DeliveryAgent.id == agent_id).update(
+                    {DeliveryAgent.current_location: node[1][len(GATE_PREFIX):]}
+                )
+                db.commit()
+        except HTTPException:
+            db.rollback()  # the order changed under the plan; replan below
+        self._next_stop(db, agent)
+        if action != PICKUP:
+            self._dispatch(db)  # capacity freed
+
+    def report(self, wall_seconds: float, skipped: int = 0) -> dict:
+        for agent in self.agents.values():
+            agent.idle_at(self.clock)
+
+        def section(orders: List[SimulatedOrder], agents: List[SimulatedAgent]) -> dict:
+            delivered = [o for o in orders if o.delivered is not None]
+            with_flight = [o for o in orders if o.boarding is not None]
+            missed = [o for o in with_flight if o.delivered is None or o.delivered > o.boarding]
+            late = [o for o in delivered if o.delivered - o.created > TRIP_DELIVERY_SLA_MINUTES]
+            utilization = [
+                a.busy / on_shift for a in agents
+                if (on_shift := min(a.shift_end, self.clock) - min(a.shift_start, self.clock)) > 0
+            ]
+            return {
+                "orders": len(orders),
+                "delivered": len(delivered),
+                "undelivered": len(orders) - len(delivered),
+                "delivery_minutes": _summary([o.delivered - o.created for o in delivered]),
+                "assignment_wait_minutes": _summary([o.assigned - o.created for o in orders if o.assigned is not None]),
+                "missed_flight_rate": round(len(missed) / len(with_flight), 4) if with_flight else None,
+                "over_sla_rate": round(len(late) / len(delivered), 4) if delivered else None,
+                "agents": len(agents),
+                "utilization": {
+                    "mean": round(float(np.mean(utilization)), 3),
+                    "min": round(float(np.min(utilization)), 3),
+                    "max": round(float(np.max(utilization)), 3),
+                } if utilization else None,
+                "overtime_minutes": round(sum(a.overtime for a in agents), 1),
+            }
+
+        airports = sorted({o.airport for o in self.orders.values()} | {a.airport for a in self.agents.values()})
+        return {
+            **section(list(self.orders.values()), list(self.agents.values())),
+            "skipped_arrivals": skipped,
+            "simulated_minutes": round(self.clock, 1),
+            "wall_seconds": round(wall_seconds, 2),
+            "speedup": round(self.clock * 60 / wall_seconds) if wall_seconds > 0 else None,
+            "airports": {
+                code: section(
+                    [o for o in self.orders.values() if o.airport == code],
+                    [a for a in self.agents.values() if a.airport == code],
+                )
+                for code in airports
+            },
+        }
@@ -0,0 +1,227 @@
+"""
+Warm-start snapshots of in-memory state.
+
+After a deploy each worker would rebuild its distance tables (Floyd-Warshall
+per terminal) and demand rings (a week of orders per shard) from scratch.
+Instead, every SNAPSHOT_INTERVAL seconds and at shutdown they are written to
+SNAPSHOT_PATH, a local file laid out for memory mapping:
+
+    b"WARMSNAP" | header length (uint64 LE) | header JSON | arrays, 64-byte aligned
+
+The header lists each section's metadata and where its arrays lie. On start
+the file is mapped copy-on-write and arrays are used in place (zero-copy;
+pages are only copied if a ring is written to), then caught up from the
+database: demand rings read only the orders created since, and a distance
+table is only reused by a terminal whose layout hasn't changed. /ready
+answers 503 until that is done.
+
+Files are replaced atomically, so workers sharing a host may share the path.
+SNAPSHOT_PATH= (empty) turns snapshots off; warm-up then rebuilds from the
+database as before.
+"""
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Callable, Dict, Optional, Tuple
+import numpy as np
+import orjson
+from app.database import all_shards
+from app.models.airport import Airport
+from app.services import routing
+from app.services.demand import demand
+from app.services.transit import load_airport_transit
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "airport-delivery.snapshot"))
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "300"))  # seconds
+
+MAGIC = b"WARMSNAP"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+Section = Tuple[dict, Dict[str, np.ndarray]]  # metadata, named arrays
+
+# name -> (dump, restore); restore returns how many items it took
+SECTIONS: Dict[str, Tuple[Callable[[], Section], Callable[[dict, Dict[str, np.ndarray]], int]]] = {
+    "distance_tables": (routing.dump_matrices, routing.restore_matrices),
+    "demand": (demand.dump, demand.restore),
+}
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_snapshot(path: str, sections: Dict[str, Section]):
+    """Write sections to path atomically (a temporary file renamed over it)"""
+    header = {"version": FORMAT_VERSION, "created_at": time.time(), "sections": {}}
+    blobs = []
+    offset = 0
+    for name, (meta, arrays) in sections.items():
+        entries = {}
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            offset = _aligned(offset)
+            entries[key] = {"offset": offset, "shape": list(array.shape), "dtype": array.dtype.str}
+            if array.size:  # empty arrays are all header (memoryview can't cast them)
+                blobs.append((offset, array))
+            offset += array.nbytes
+        header["sections"][name] = {"meta": meta, "arrays": entries}
+
+    encoded = orjson.dumps(header)
+    data_start = _aligned(len(MAGIC) + 8 + len(encoded))
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+            for blob_offset, array in blobs:
+                f.seek(data_start + blob_offset)
+                f.write(memoryview(array).cast("B"))
+            f.truncate(data_start + offset)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def read_snapshot(path: str) -> Optional[Tuple[dict, Dict[str, Section]]]:
+    """Header and sections of a snapshot, arrays mapped copy-on-write; None if missing or unreadable"""
+    try:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    except (FileNotFoundError, ValueError):
+        return None  # none yet, or empty
+    if mapped[:len(MAGIC)] != MAGIC:
+        logger.warning("Ignoring %s: not a snapshot", path)
+        return None
+    (length,) = struct.unpack_from("<Q", mapped, len(MAGIC))
+    header = orjson.loads(mapped[len(MAGIC) + 8:len(MAGIC) + 8 + length])
+    if header.get("version") != FORMAT_VERSION:
+        logger.warning("Ignoring %s: snapshot format %s", path, header.get("version"))
+        return None
+    data_start = _aligned(len(MAGIC) + 8 + length)
+    sections = {}
+    for name, section in header["sections"].items():
+        arrays = {}
+        for key, entry in section["arrays"].items():
+            dtype = np.dtype(entry["dtype"])
+            count = int(np.prod(entry["shape"]))
+            if not count:
+                arrays[key] = np.empty(entry["shape"], dtype=dtype)
+                continue
+            arrays[key] = np.frombuffer(
+                mapped, dtype=dtype, count=count, offset=data_start + entry["offset"]
+            ).reshape(entry["shape"])
+        sections[name] = (section["meta"], arrays)
+    return header, sections
+
+
+class WarmStart:
+    def __init__(self, path: str = SNAPSHOT_PATH, interval: float = SNAPSHOT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.ready = False
+        self.phase = "starting"
+        self.error: Optional[str] = None
+        self.snapshot_age: Optional[float] = None  # seconds, when restored
+        self.restored: Dict[str, int] = {}
+        self.warmup_seconds: Optional[float] = None
+        self.saved = 0
+        self.saved_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def restore(self):
+        """Load the snapshot, if there is one, into the sections"""
+        loaded = read_snapshot(self.path) if self.path else None
+        if loaded is None:
+            return
+        header, sections = loaded
+        self.snapshot_age = round(time.time() - header["created_at"], 1)
+        for name, (_, restore) in SECTIONS.items():
+            if name in sections:
+                self.restored[name] = restore(*sections[name])
+
+    def catch_up(self):
+        """Bring restored state up to date (or build it) from every shard"""
+        for shard in all_shards():
+            db = shard.SessionLocal()
+            try:
+                demand.catch_up(db)
+                # Builds the airport's graphs, reusing snapshot matrices whose layout is unchanged
+                for (airport_id,) in db.query(Airport.id):
+                    load_airport_transit(db, airport_id)
+            finally:
+                db.close()
+        routing.drop_restored_matrices()
+
+    def save(self):
+        """Write a snapshot of the sections now"""
+        if not self.path:
+            return
+        write_snapshot(self.path, {name: dump() for name, (dump, _) in SECTIONS.items()})
+        self.saved += 1
+        self.saved_at = time.time()
+
+    def start(self, interval: Optional[float] = None):
+        """Warm up in the background, then snapshot periodically"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(interval or self.interval))
+
+    async def stop(self):
+        """Stop snapshotting and write a last snapshot for the next start"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.ready:
+            try:
+                await asyncio.to_thread(self.save)
+            except Exception:
+                logger.exception("Final snapshot failed")
+
+    async def _run(self, interval: float):
+        started = time.monotonic()
+        try:
+            self.phase = "restoring"
+            await asyncio.to_thread(self.restore)
+            self.phase = "catching up"
+            await asyncio.to_thread(self.catch_up)
+        except Exception as exc:
+            # Serve anyway: every structure still rebuilds itself from the database on first use
+            logger.exception("Warm-up failed")
+            self.error = repr(exc)
+        self.warmup_seconds = round(time.monotonic() - started, 3)
+        self.phase = "ready"
+        self.ready = True
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.save)
+            except Exception:
+                logger.exception("Snapshot failed")
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "phase": self.phase,
+            "error": self.error,
+            "warmup_seconds": self.warmup_seconds,
+            "snapshot_path": self.path or None,
+            "snapshot_age_seconds": self.snapshot_age,
+            "restored": self.restored,
+            "snapshots_written": self.saved,
+            "last_snapshot_at": self.saved_at,
+        }
+
+
+warm_start = WarmStart()
@@ -0,0 +1,524 @@
+"""
+Distributed tracing.
+
+Spans follow OpenTelemetry's model (trace and span IDs, parent, kind, start
+and end time, attributes, events, status) and are exported as OTLP/JSON, so
+any OTLP collector or trace viewer can read them:
+
+- HTTP (TracingMiddleware): a server span per request, named after the route
+  template. A W3C traceparent request header continues the caller's trace;
+  every response carries the request's traceparent.
+- Services: functions decorated with @traced, and blocks in tracer.span().
+- SQL: a client span per statement executed inside a sampled trace.
+- WebSocket: a span per broadcast and per socket send.
+- Background work: jobs.enqueue() captures the current trace, and the job
+  runs as a child of the span that queued it (broadcasts and notifications
+  join the request that caused them).
+
+Sampling bounds the overhead. Whether a trace is recorded is decided once,
+at its root: TRACE_SAMPLE_RATIO of traces, at most TRACE_MAX_PER_SECOND new
+ones, and a continued trace follows the caller's sampled flag. Every span in
+an unsampled trace is a no-op, and statements and socket sends never start a
+trace of their own. Finished spans are buffered (up to TRACE_QUEUE_SIZE, then
+dropped and counted) and exported in batches every TRACE_EXPORT_INTERVAL
+seconds, off the event loop:
+
+    TRACE_EXPORTER=file  one OTLP/JSON document per line, appended to TRACE_FILE_PATH
+    TRACE_EXPORTER=otlp  POSTed to an OTLP/HTTP collector at TRACE_OTLP_ENDPOINT
+    TRACE_EXPORTER=      tracing off (the default)
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, List, Optional
+import httpx
+import orjson
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "").strip().lower()
+TRACE_FILE_PATH = os.getenv("TRACE_FILE_PATH", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "0.1"))
+TRACE_MAX_PER_SECOND = float(os.getenv("TRACE_MAX_PER_SECOND", "20"))  # new sampled traces
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "20000"))  # finished spans awaiting export
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "5"))  # seconds
+TRACE_EXPORT_BATCH = int(os.getenv("TRACE_EXPORT_BATCH", "2000"))  # spans per document
+TRACE_STATEMENT_MAX = int(os.getenv("TRACE_STATEMENT_MAX", "1000"))  # characters of SQL kept
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "airport-delivery-api")
+
+# OTLP span kinds and status codes
+KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+TRACEPARENT_HEADER = "traceparent"
+
+
+class SpanContext:
+    """What identifies a span across threads, tasks and processes"""
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+class Span:
+    recording = True
+    __slots__ = ("name", "context", "parent_id", "kind", "start_ns", "end_ns", "attributes", "events", "status", "message")
+
+    def __init__(self, name: str, context: SpanContext, parent_id: Optional[str], kind: str, attributes: Optional[dict]):
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.kind = KINDS[kind]
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.events: List[tuple] = []
+        self.status = STATUS_UNSET
+        self.message = ""
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, attributes: Optional[dict] = None):
+        self.events.append((time.time_ns(), name, attributes or {}))
+
+    def set_error(self, message: str = ""):
+        self.status = STATUS_ERROR
+        self.message = message
+
+    def record_exception(self, exc: BaseException):
+        self.add_event("exception", {"exception.type": type(exc).__qualname__, "exception.message": str(exc)})
+        self.set_error(f"{type(exc).__qualname__}: {exc}")
+
+
+class NonRecordingSpan:
+    """A span of an unsampled trace: carries the context, records nothing"""
+    recording = False
+    __slots__ = ("context",)
+
+    def __init__(self, context: SpanContext):
+        self.context = context
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def add_event(self, name: str, attributes: Optional[dict] = None):
+        pass
+
+    def set_error(self, message: str = ""):
+        pass
+
+    def record_exception(self, exc: BaseException):
+        pass
+
+
+NOOP = NonRecordingSpan(SpanContext("0" * 32, "0" * 16, False))
+
+_current: contextvars.ContextVar = contextvars.ContextVar("trace_span", default=None)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """A W3C traceparent header (version-traceid-spanid-flags); None if absent or malformed"""
+    try:
+        version, trace_id, span_id, flags = value.strip().lower().split("-")[:4]
+        if (
+            len(version) != 2 or version == "ff" or len(trace_id) != 32 or len(span_id) != 16 or len(flags) != 2
+            or not int(trace_id, 16) or not int(span_id, 16)
+        ):
+            return None
+        return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> List[dict]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def _otlp_span(span: Span) -> dict:
+    encoded = {
+        "traceId": span.context.trace_id,
+        "spanId": span.context.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": _otlp_attributes(span.attributes),
+        "status": {"code": span.status, "message": span.message} if span.status else {},
+    }
+    if span.parent_id:
+        encoded["parentSpanId"] = span.parent_id
+    if span.events:
+        encoded["events"] = [
+            {"timeUnixNano": str(at), "name": name, "attributes": _otlp_attributes(attributes)}
+            for at, name, attributes in span.events
+        ]
+    return encoded
+
+
+def encode_spans(spans: List[Span]) -> bytes:
+    """An OTLP/JSON ExportTraceServiceRequest"""
+    return orjson.dumps({"resourceSpans": [{
+        "resource": {"attributes": _otlp_attributes({
+            "service.name": TRACE_SERVICE_NAME,
+            "service.instance.id": f"{socket.gethostname()}:{os.getpid()}",
+        })},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": [_otlp_span(span) for span in spans]}],
+    }]})
+
+
+class FileExporter:
+    """Appends one document per batch as a JSON line (the OTel collector file exporter's format)"""
+
+    def __init__(self, path: str = TRACE_FILE_PATH):
+        self.path = path
+
+    def export(self, document: bytes):
+        with open(self.path, "ab") as f:
+            f.write(document + b"\n")
+
+    def close(self):
+        pass
+
+
+class OtlpExporter:
+    """POSTs each batch to an OTLP/HTTP endpoint (a collector, or any stand-in accepting JSON)"""
+
+    def __init__(self, endpoint: str = TRACE_OTLP_ENDPOINT):
+        self.endpoint = endpoint
+        self._client = httpx.Client(timeout=10, headers={"Content-Type": "application/json"})
+
+    def export(self, document: bytes):
+        self._client.post(self.endpoint, content=document).raise_for_status()
+
+    def close(self):
+        self._client.close()
+
+
+EXPORTERS: Dict[str, Callable[[], object]] = {"file": FileExporter, "otlp": OtlpExporter}
+
+
+class Tracer:
+    def __init__(
+        self, exporter: str = TRACE_EXPORTER, ratio: float = TRACE_SAMPLE_RATIO,
+        max_per_second: float = TRACE_MAX_PER_SECOND, max_queued: int = TRACE_QUEUE_SIZE
+    ):
+        if exporter and exporter not in EXPORTERS:
+            raise ValueError(f"Unknown TRACE_EXPORTER {exporter!r} (expected one of {', '.join(EXPORTERS)})")
+        self.exporter_name = exporter
+        self.enabled = bool(exporter)
+        self.ratio = ratio
+        self.max_per_second = max_per_second
+        self.max_queued = max_queued
+        self._exporter = None
+        self._finished: Deque[Span] = deque()
+        self._lock = threading.Lock()
+        self._tokens = max_per_second
+        self._refilled = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self.traces_started = 0
+        self.traces_sampled = 0
+        self.traces_rate_limited = 0
+        self.spans_recorded = 0
+        self.spans_dropped = 0
+        self.spans_exported = 0
+        self.export_failures = 0
+
+    def _sample(self, trace_id: str) -> bool:
+        """Head sampling: the trace ID decides (stable across services), then the rate limit"""
+        self.traces_started += 1
+        if int(trace_id[16:], 16) >= self.ratio * 2 ** 64:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.max_per_second, self._tokens + (now - self._refilled) * self.max_per_second)
+            self._refilled = now
+            if self._tokens < 1:
+                self.traces_rate_limited += 1
+                return False
+            self._tokens -= 1
+        self.traces_sampled += 1
+        return True
+
+    def current(self) -> Optional[SpanContext]:
+        """The context of the active span, for handing to other threads or processes"""
+        span = _current.get()
+        return span.context if span is not None else None
+
+    def start_span(
+        self, name: str, kind: str = "internal", attributes: Optional[dict] = None,
+        parent: Optional[SpanContext] = None, new_trace: bool = True
+    ):
+        """
+        A span that the caller must end() (tracer.span() also makes it the
+        active one). Children of the active span unless a parent is given;
+        with new_trace=False, a no-op outside any trace.
+        """
+        if not self.enabled:
+            return NOOP
+        if parent is None:
+            active = _current.get()
+            parent = active.context if active is not None else None
+        if parent is None:
+            if not new_trace:
+                return NOOP
+            trace_id = f"{random.getrandbits(128):032x}"
+            sampled = self._sample(trace_id)
+        else:
+            trace_id, sampled = parent.trace_id, parent.sampled
+        context = SpanContext(trace_id, f"{random.getrandbits(64):016x}", sampled)
+        if not sampled:
+            return NonRecordingSpan(context)
+        return Span(name, context, parent.span_id if parent else None, kind, attributes)
+
+    def end(self, span):
+        if not span.recording:
+            return
+        span.end_ns = time.time_ns()
+        self.spans_recorded += 1
+        if len(self._finished) >= self.max_queued:
+            self.spans_dropped += 1
+            return
+        self._finished.append(span)
+
+    @contextmanager
+    def span(
+        self, name: str, kind: str = "internal", attributes: Optional[dict] = None,
+        parent: Optional[SpanContext] = None, new_trace: bool = True
+    ):
+        """Run a block as the active span; an exception escaping it marks the span failed"""
+        span = self.start_span(name, kind, attributes, parent, new_trace)
+        if span is NOOP:
+            yield span
+            return
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.record_exception(exc)
+            raise
+        finally:
+            _current.reset(token)
+            self.end(span)
+
+    @contextmanager
+    def use(self, context: Optional[SpanContext]):
+        """Make a captured context the active one (no new span), e.g. to enqueue work on its behalf"""
+        if not self.enabled or context is None:
+            yield
+            return
+        token = _current.set(NonRecordingSpan(context))
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def start(self, interval: float = TRACE_EXPORT_INTERVAL):
+        """Export finished spans in the background"""
+        if not self.enabled or (self._task is not None and not self._task.done()):
+            return
+        if self._exporter is None:
+            self._exporter = EXPORTERS[self.exporter_name]()
+        self._task = asyncio.create_task(self._loop(interval))
+
+    async def stop(self):
+        """Stop exporting after a last export of what has finished"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await asyncio.to_thread(self.flush)
+        await asyncio.to_thread(self._exporter.close)
+        self._exporter = None
+
+    async def _loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.flush)
+
+    def flush(self):
+        """Export everything finished so far, in batches; a failed batch is dropped"""
+        while self._finished:
+            batch = []
+            while self._finished and len(batch) < TRACE_EXPORT_BATCH:
+                batch.append(self._finished.popleft())
+            try:
+                self._exporter.export(encode_spans(batch))
+                self.spans_exported += len(batch)
+            except Exception as exc:
+                # One line per batch: a collector that is down would otherwise flood the log
+                logger.warning("Exporting %d spans failed: %r", len(batch), exc)
+                self.export_failures += 1
+                self.spans_dropped += len(batch)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "exporter": self.exporter_name or None,
+            "destination": (
+                TRACE_FILE_PATH if self.exporter_name == "file"
+                else TRACE_OTLP_ENDPOINT if self.exporter_name == "otlp" else None
+            ),
+            "sample_ratio": self.ratio,
+            "max_traces_per_second": self.max_per_second,
+            "traces_started": self.traces_started,
+            "traces_sampled": self.traces_sampled,
+            "traces_rate_limited": self.traces_rate_limited,
+            "spans_recorded": self.spans_recorded,
+            "spans_queued": len(self._finished),
+            "spans_dropped": self.spans_dropped,
+            "spans_exported": self.spans_exported,
+            "export_failures": self.export_failures,
+        }
+
+
+tracer = Tracer()
+
+
+def traced(name: Optional[str] = None, kind: str = "internal"):
+    """Decorator running each call of a function (sync or async) in a span, named module.function by default"""
+    def decorate(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await func(*args, **kwargs)
+                with tracer.span(span_name, kind):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return func(*args, **kwargs)
+                with tracer.span(span_name, kind):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class TracingMiddleware:
+    """ASGI middleware: a server span per HTTP request; a pass-through while tracing is off"""
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Optional[Dict[Callable, str]] = None
+
+    def _route(self, scope) -> Optional[str]:
+        """The matched route's path template (Starlette leaves the endpoint in the scope)"""
+        if self._routes is None and "app" in scope:
+            self._routes = {
+                getattr(route, "endpoint", None): route.path
+                for route in scope["app"].router.routes if hasattr(route, "path")
+            }
+        return (self._routes or {}).get(scope.get("endpoint"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        parent = None
+        for header, value in scope["headers"]:
+            if header == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1"))
+                break
+        method = scope["method"]
+        with tracer.span(method, "server", {
+            "http.request.method": method,
+            "url.path": scope["path"],
+            "client.address": scope["client"][0] if scope.get("client") else None,
+        }, parent=parent) as span:
+            traceparent = span.context.traceparent().encode("latin-1")
+
+            async def send_with_traceparent(message):
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    span.set_attribute("http.response.status_code", status)
+                    if status >= 500:
+                        span.set_error()
+                    message = {**message, "headers": [*message.get("headers", []), (b"traceparent", traceparent)]}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_traceparent)
+            finally:
+                if span.recording:
+                    route = self._route(scope)
+                    endpoint = scope.get("endpoint")
+                    span.name = f"{method} {route or scope['path']}"
+                    span.set_attribute("http.route", route)
+                    if endpoint is not None:
+                        span.set_attribute("code.function", f"{endpoint.__module__}.{endpoint.__qualname__}")
+
+
+# SQL statements, as client spans of whatever span issued them
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    if not tracer.enabled:
+        return
+    active = _current.get()
+    if active is None or not active.recording:
+        return
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+    span = tracer.start_span(operation, "client", {
+        "db.system": conn.dialect.name,
+        "db.name": conn.engine.url.database,
+        "db.operation": operation,
+        "db.statement": statement[:TRACE_STATEMENT_MAX],
+        "db.executemany": executemany or None,
+    })
+    conn.info.setdefault("trace_spans", []).append(span)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_statement(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if spans:
+        span = spans.pop()
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            span.set_attribute("db.rows", cursor.rowcount)
+        tracer.end(span)
+
+
+@event.listens_for(Engine, "handle_error")
+def _fail_statement(exception_context):
+    conn = exception_context.connection
+    spans = conn.info.get("trace_spans") if conn is not None else None
+    if spans:
+        span = spans.pop()
+        span.record_exception(exception_context.original_exception)
+        tracer.end(span)
@@ -0,0 +1,281 @@
+"""
+Airside transit between terminals.
+
+Each terminal's walkway graph (see routing.py) lives in its own coordinate
+space. Transfers join them, declared on the departing terminal in
+Terminal.layout_data["transfers"]:
+
+    [{"node": "j4", "terminal": "Terminal 2", "to": "j1", "minutes": 6},     # train
+     {"node": "gate:A12", "terminal": "Terminal 4", "to": "gate:B1", "minutes": 3,
+      "bidirectional": false}]
+
+"node" is a node in this terminal's walkway and "to" one in the other
+terminal's (a junction id, gate:<number> or restaurant:<id>). Travel time is
+converted to map units so it compares directly with walking distance.
+Airports with several terminals and no declared transfers get a default
+connection between each pair of terminals' most central nodes.
+
+Nodes with transfers are portals. Portal-to-portal distances (walks within a
+terminal plus transfers) are closed once per airport with Floyd-Warshall, and
+for each terminal the distance from every node to every portal is derived
+from that, so a cross-terminal lookup is one min-plus product over the
+destination terminal's portals rather than a graph search.
+"""
+import os
+import orjson
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+from app.models.airport import Terminal
+from app.services.distance import minutes_to_distance
+from app.services.routing import TerminalGraph, load_terminal_graphs, precompute_graphs
+from app.services.tracing import traced
+
+DEFAULT_TRANSFER_MINUTES = float(os.getenv("TRANSIT_DEFAULT_TRANSFER_MINUTES", "8"))
+TRANSIT_CACHE_SIZE = int(os.getenv("TRANSIT_CACHE_SIZE", "64"))
+
+# (terminal_id, walkway node key)
+Node = Tuple[int, str]
+Transfer = Tuple[Node, Node, float]
+
+
+class AirportTransit:
+    """Distances between any two walkway nodes of an airport, across terminals"""
+
+    def __init__(self, airport_id: int, graphs: Dict[int, TerminalGraph], transfers: Sequence[Transfer]):
+        self.airport_id = airport_id
+        self.graphs = graphs
+
+        self.portals: List[Node] = []
+        self.portal_index: Dict[Node, int] = {}
+        for a, b, _ in transfers:
+            for node in (a, b):
+                if node not in self.portal_index:
+                    self.portal_index[node] = len(self.portals)
+                    self.portals.append(node)
+        grouped: Dict[int, List[int]] = {}
+        for i, (terminal_id, _) in enumerate(self.portals):
+            grouped.setdefault(terminal_id, []).append(i)
+        self.terminal_portals: Dict[int, np.ndarray] = {tid: np.array(ix) for tid, ix in grouped.items()}
+        self.terminal_portal_keys: Dict[int, List[str]] = {
+            tid: [self.portals[i][1] for i in ix] for tid, ix in grouped.items()
+        }
+
+        n = len(self.portals)
+        dist = np.full((n, n), np.inf)
+        np.fill_diagonal(dist, 0.0)
+        # Walking between portals of the same terminal
+        for terminal_id, indexes in self.terminal_portals.items():
+            keys = self.terminal_portal_keys[terminal_id]
+            dist[np.ix_(indexes, indexes)] = graphs[terminal_id].distance_matrix(keys, keys)
+        # Transfers, remembering which direct hops ride one rather than walk
+        self._transfer_hop = np.zeros((n, n), dtype=bool)
+        for a, b, weight in transfers:
+            i, j = self.portal_index[a], self.portal_index[b]
+            if weight < dist[i, j]:
+                dist[i, j] = weight
+                self._transfer_hop[i, j] = True
+
+        # Floyd-Warshall over portals, keeping the first hop for path reconstruction
+        hop = np.where(np.isfinite(dist), np.arange(n)[None, :], -1)
+        for k in range(n):
+            via = dist[:, k:k + 1] + dist[k:k + 1, :]
+            better = via < dist
+            if better.any():
+                dist[better] = via[better]
+                hop[better] = np.broadcast_to(hop[:, k:k + 1], (n, n))[better]
+        self.closure = dist
+        self._hop = hop
+        self._leave: Dict[int, np.ndarray] = {}
+
+    def leave(self, terminal_id: int) -> np.ndarray:
+        """Precomputed |terminal nodes| x |portals| distances from each node to each portal"""
+        if terminal_id not in self._leave:
+            graph = self.graphs[terminal_id]
+            result = np.full((len(graph.keys), len(self.portals)), np.inf)
+            indexes = self.terminal_portals.get(terminal_id)
+            if indexes is not None:
+                for key, i in zip(self.terminal_portal_keys[terminal_id], indexes):
+                    np.minimum(result, graph.column(key)[:, None] + self.closure[i][None, :], out=result)
+            self._leave[terminal_id] = result
+        return self._leave[terminal_id]
+
+    def _group(self, nodes: Sequence[Node]) -> Dict[int, Tuple[List[int], List[int]]]:
+        """terminal_id -> (positions in nodes, indexes in that terminal's graph), skipping unknown nodes"""
+        groups: Dict[int, Tuple[List[int], List[int]]] = {}
+        for position, (terminal_id, key) in enumerate(nodes):
+            graph = self.graphs.get(terminal_id)
+            if graph is not None and key in graph:
+                positions, indexes = groups.setdefault(terminal_id, ([], []))
+                positions.append(position)
+                indexes.append(graph.index[key])
+        return groups
+
+    def distances_from(self, source: Node, targets: Sequence[Node]) -> np.ndarray:
+        """Bulk lookup: one source, many targets in any terminal (inf when unreachable)"""
+        result = np.full(len(targets), np.inf)
+        terminal_id, key = source
+        graph = self.graphs.get(terminal_id)
+        if graph is None or key not in graph:
+            return result
+        leave = self.leave(terminal_id)[graph.index[key]] if self.portals else None
+
+        for target_terminal, (positions, indexes) in self._group(targets).items():
+            best = np.full(len(indexes), np.inf)
+            if target_terminal == terminal_id:
+                best = graph.row(key)[indexes]
+            portal_indexes = self.terminal_portals.get(target_terminal)
+            if leave is not None and portal_indexes is not None:
+                target_graph = self.graphs[target_terminal]
+                enter = np.vstack([target_graph.row(k)[indexes] for k in self.terminal_portal_keys[target_terminal]])
+                best = np.minimum(best, (leave[portal_indexes][:, None] + enter).min(axis=0))
+            result[positions] = best
+        return result
+
+    def distances_to(self, target: Node, sources: Sequence[Node]) -> np.ndarray:
+        """Bulk lookup: many sources in any terminal, one target (inf when unreachable)"""
+        result = np.full(len(sources), np.inf)
+        terminal_id, key = target
+        graph = self.graphs.get(terminal_id)
+        if graph is None or key not in graph:
+            return result
+        portal_indexes = self.terminal_portals.get(terminal_id)
+        enter = None
+        if portal_indexes is not None:
+            enter = np.array([graph.distance(k, key) for k in self.terminal_portal_keys[terminal_id]])
+
+        for source_terminal, (positions, indexes) in self._group(sources).items():
+            best = np.full(len(indexes), np.inf)
+            if source_terminal == terminal_id:
+                best = graph.column(key)[indexes]
+            if enter is not None:
+                leave = self.leave(source_terminal)[indexes][:, portal_indexes]
+                best = np.minimum(best, (leave + enter[None, :]).min(axis=1))
+            result[positions] = best
+        return result
+
+    def distance(self, source: Node, target: Node) -> float:
+        return float(self.distances_from(source, [target])[0])
+
+    def shortest_path(self, source: Node, target: Node) -> Tuple[float, List[Node]]:
+        """Route as (distance, [(terminal_id, node key), ...]), walking legs via A*"""
+        (source_terminal, source_key), (target_terminal, target_key) = source, target
+        source_graph, target_graph = self.graphs.get(source_terminal), self.graphs.get(target_terminal)
+        if source_graph is None or target_graph is None or source_key not in source_graph or target_key not in target_graph:
+            return np.inf, []
+
+        direct = source_graph.distance(source_key, target_key) if source_terminal == target_terminal else np.inf
+        via, exit_portal, entry_portal = np.inf, None, None
+        exits, entries = self.terminal_portals.get(source_terminal), self.terminal_portals.get(target_terminal)
+        if exits is not None and entries is not None:
+            out = source_graph.distances_from(source_key, self.terminal_portal_keys[source_terminal])
+            into = target_graph.distance_matrix(self.terminal_portal_keys[target_terminal], [target_key])[:, 0]
+            costs = out[:, None] + self.closure[np.ix_(exits, entries)] + into[None, :]
+            i, j = np.unravel_index(int(np.argmin(costs)), costs.shape)
+            via, exit_portal, entry_portal = float(costs[i, j]), int(exits[i]), int(entries[j])
+
+        if not np.isfinite(min(direct, via)):
+            return np.inf, []
+        if direct <= via:
+            distance, keys = source_graph.shortest_path(source_key, target_key)
+            return distance, [(source_terminal, k) for k in keys]
+
+        path: List[Node] = [source]
+        self._walk(path, self.portals[exit_portal])
+        portal = exit_portal
+        while portal != entry_portal:
+            next_portal = int(self._hop[portal, entry_portal])
+            if self._transfer_hop[portal, next_portal]:
+                path.append(self.portals[next_portal])
+            else:
+                self._walk(path, self.portals[next_portal])
+            portal = next_portal
+        self._walk(path, target)
+        return via, path
+
+    def _walk(self, path: List[Node], to: Node):
+        """Extend path with the walking leg from its last node to `to` (same terminal)"""
+        terminal_id, key = path[-1]
+        if key == to[1]:
+            return
+        _, keys = self.graphs[terminal_id].shortest_path(key, to[1])
+        path.extend((terminal_id, k) for k in keys[1:])
+
+    def point(self, node: Node) -> Tuple[float, float]:
+        return self.graphs[node[0]].point(node[1])
+
+
+def _declared_transfers(terminals, graphs: Dict[int, TerminalGraph]) -> List[Transfer]:
+    by_name = {name: terminal_id for terminal_id, name, _ in terminals}
+    transfers: List[Transfer] = []
+    for terminal_id, _, layout_data in terminals:
+        for transfer in (layout_data or {}).get("transfers") or []:
+            other = by_name.get(transfer.get("terminal"))
+            a, b = (terminal_id, transfer.get("node")), (other, transfer.get("to"))
+            if other is None or a[1] not in graphs[terminal_id] or b[1] not in graphs[other]:
+                continue
+            weight = minutes_to_distance(float(transfer.get("minutes", 0.0)))
+            transfers.append((a, b, weight))
+            if transfer.get("bidirectional", True):
+                transfers.append((b, a, weight))
+    return transfers
+
+
+def _default_transfers(graphs: Dict[int, TerminalGraph]) -> List[Transfer]:
+    """Connect every pair of terminals between their most central nodes"""
+    hubs: Dict[int, str] = {}
+    for terminal_id, graph in graphs.items():
+        if graph.keys:
+            centre = graph.coords.mean(axis=0)
+            hubs[terminal_id] = graph.keys[int(np.argmin(np.hypot(*(graph.coords - centre).T)))]
+    weight = minutes_to_distance(DEFAULT_TRANSFER_MINUTES)
+    return [
+        ((a, hubs[a]), (b, hubs[b]), weight)
+        for a in hubs for b in hubs if a != b
+    ]
+
+
+_transit_cache: "OrderedDict[int, Tuple[bytes, AirportTransit]]" = OrderedDict()
+
+
+def _airport_graphs(db: Session, airport_id: int):
+    terminals = db.query(Terminal.id, Terminal.name, Terminal.layout_data).filter(
+        Terminal.airport_id == airport_id
+    ).all()
+    layouts = {terminal_id: layout_data for terminal_id, _, layout_data in terminals}
+    return terminals, load_terminal_graphs(db, list(layouts), layouts=layouts)
+
+
+def load_airport_transit(db: Session, airport_id: int) -> AirportTransit:
+    """Transit model for an airport, rebuilt only when a terminal graph or the transfers change"""
+    return _airport_transit(airport_id, *_airport_graphs(db, airport_id))
+
+
+@traced()
+async def prepare_airport_transit(db: Session, airport_id: int) -> AirportTransit:
+    """load_airport_transit() for async callers: large walkway graphs are closed in the compute pool first"""
+    terminals, graphs = _airport_graphs(db, airport_id)
+    await precompute_graphs(graphs.values())
+    return _airport_transit(airport_id, terminals, graphs)
+
+
+def _airport_transit(airport_id: int, terminals, graphs: Dict[int, TerminalGraph]) -> AirportTransit:
+    fingerprint = orjson.dumps(
+        sorted((terminal_id, name, (layout_data or {}).get("transfers")) for terminal_id, name, layout_data in terminals)
+    )
+    cached = _transit_cache.get(airport_id)
+    if cached and cached[0] == fingerprint and cached[1].graphs.keys() == graphs.keys() and all(
+        cached[1].graphs[terminal_id] is graph for terminal_id, graph in graphs.items()
+    ):
+        _transit_cache.move_to_end(airport_id)
+        return cached[1]
+
+    transfers = _declared_transfers(terminals, graphs)
+    if not transfers and len(graphs) > 1:
+        transfers = _default_transfers(graphs)
+    transit = AirportTransit(airport_id, graphs, transfers)
+    _transit_cache[airport_id] = (fingerprint, transit)
+    while len(_transit_cache) > TRANSIT_CACHE_SIZE:
+        _transit_cache.popitem(last=False)
+    return transit
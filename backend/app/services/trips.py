@@ -0,0 +1,280 @@
+"""
+Multi-order trips.
+
+An agent's active orders in one airport are carried as a single trip of up
+to TRIP_MAX_ORDERS orders. The trip is a sequence of pickup (restaurant) and
+drop-off (gate) stops, planned with a cheapest-insertion heuristic followed by
+relocate moves, under two constraints:
+
+- precedence: an order's pickup comes before its drop-off
+- time windows: pickups wait until the food is ready (created_at plus the
+  restaurant's prep time, or estimated_pickup_time); drop-offs are due by the
+  order's delivery deadline, lateness is heavily penalised
+
+Travel times come from the airport transit model, so stops may span terminals.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import not_
+from sqlalchemy.orm import Session, joinedload
+from app.models.airport import Airport, Gate, Terminal
+from app.models.delivery_agent import DeliveryAgent
+from app.models.order import Order, OrderStatus
+from app.services.distance import MINUTES_PER_UNIT
+from app.services.flights import schedule
+from app.services.routing import gate_node, restaurant_node
+from app.services.tracing import traced
+from app.services.transit import AirportTransit, Node, load_airport_transit
+
+TRIP_MAX_ORDERS = int(os.getenv("TRIP_MAX_ORDERS", "3"))
+TRIP_DELIVERY_SLA_MINUTES = float(os.getenv("TRIP_DELIVERY_SLA_MINUTES", "30"))
+# Orders join an existing trip only if both their restaurant and their gate
+# are this close (map units) to a stop already on it
+TRIP_BATCH_RADIUS = float(os.getenv("TRIP_BATCH_RADIUS", "250"))
+LATE_PENALTY = 10.0
+MAX_IMPROVEMENT_PASSES = 20
+
+CLOSED_STATUSES = (OrderStatus.DELIVERED, OrderStatus.CANCELLED)
+ONBOARD_STATUSES = (OrderStatus.PICKED_UP, OrderStatus.IN_TRANSIT)
+
+PICKUP = "pickup"
+DROPOFF = "dropoff"
+
+
+class Stop:
+    __slots__ = ("order", "action", "node", "ready", "deadline")
+
+    def __init__(self, order: Order, action: str, node: Node, ready: float, deadline: Optional[float]):
+        self.order = order
+        self.action = action
+        self.node = node
+        self.ready = ready          # minutes from now; can't be served earlier
+        self.deadline = deadline    # minutes from now; serving later is penalised
+
+
+def _minutes_from(now: datetime, moment: Optional[datetime]) -> Optional[float]:
+    if moment is None:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - now).total_seconds() / 60
+
+
+def ready_minutes(order: Order, now: datetime) -> float:
+    """When the food can be collected, in minutes from now (0 if already)"""
+    ready = _minutes_from(now, order.estimated_pickup_time)
+    if ready is None:
+        created = _minutes_from(now, order.created_at) or 0.0
+        ready = created + (order.restaurant.estimated_prep_time or 0)
+    return max(0.0, ready)
+
+
+def delivery_deadline(order: Order, airport, now: datetime) -> float:
+    """
+    When the order must reach the gate, in minutes from now: TRIP_DELIVERY_SLA_MINUTES
+    after the food is ready, or earlier if the flight schedule says boarding starts first
+    """
+    deadline = ready_minutes(order, now) + TRIP_DELIVERY_SLA_MINUTES
+    if airport is not None:
+        boarding = schedule.delivery_deadline(order.flight_number, airport.code, airport.timezone, now)
+        if boarding is not None:
+            deadline = min(deadline, _minutes_from(now, boarding))
+    return deadline
+
+
+def active_orders(db: Session, agent_id: int) -> List[Order]:
+    return db.query(Order).options(
+        joinedload(Order.restaurant),
+        joinedload(Order.delivery_agent)
+    ).filter(
+        Order.delivery_agent_id == agent_id,
+        not_(Order.status.in_(CLOSED_STATUSES))
+    ).order_by(Order.id).all()
+
+
+def order_airports(db: Session, orders: Sequence[Order]) -> Dict[int, object]:
+    """order id -> (id, code, timezone) of its airport, via the restaurant's terminal"""
+    airports = {row.terminal_id: row for row in db.query(
+        Terminal.id.label("terminal_id"), Airport.id, Airport.code, Airport.timezone
+    ).join(Airport).filter(Terminal.id.in_({o.restaurant.terminal_id for o in orders}))}
+    return {o.id: airports.get(o.restaurant.terminal_id) for o in orders}
+
+
+def current_trip(db: Session, agent_id: int) -> Tuple[Optional[int], List[Order], List[Order]]:
+    """
+    (airport_id, orders on the current trip, orders deferred to a later trip).
+    The trip is in the airport of the agent's oldest active order; orders already
+    picked up always ride along, the rest join oldest first up to TRIP_MAX_ORDERS.
+    """
+    orders = active_orders(db, agent_id)
+    if not orders:
+        return None, [], []
+    airports = {order_id: airport.id if airport else None for order_id, airport in order_airports(db, orders).items()}
+    onboard = [o for o in orders if o.status in ONBOARD_STATUSES]
+    airport_id = airports[(onboard or orders)[0].id]
+
+    trip = [o for o in onboard if airports[o.id] == airport_id]
+    for order in orders:
+        if order not in trip and airports[order.id] == airport_id and len(trip) < TRIP_MAX_ORDERS:
+            trip.append(order)
+    deferred = [o for o in orders if o not in trip]
+    return airport_id, trip, deferred
+
+
+def gate_terminals(db: Session, airport_id: int) -> Dict[str, int]:
+    return dict(db.query(Gate.gate_number, Gate.terminal_id).join(Terminal).filter(
+        Terminal.airport_id == airport_id
+    ))
+
+
+def build_stops(
+    orders: Sequence[Order], gates: Dict[str, int], airport, now: datetime
+) -> Tuple[List[Stop], List[Order]]:
+    """Pickup/drop-off stops for each order; orders whose gate is unknown are returned separately"""
+    stops, unroutable = [], []
+    for order in orders:
+        gate = (order.boarding_gate or "").upper()
+        if gate not in gates:
+            unroutable.append(order)
+            continue
+        ready = ready_minutes(order, now)
+        if order.status not in ONBOARD_STATUSES:
+            stops.append(Stop(order, PICKUP, (order.restaurant.terminal_id, restaurant_node(order.restaurant_id)), ready, None))
+        stops.append(Stop(order, DROPOFF, (gates[gate], gate_node(gate)), 0.0, delivery_deadline(order, airport, now)))
+    return stops, unroutable
+
+
+class TripPlanner:
+    """Orders a trip's stops; stop 0 of the distance matrix is the agent's start"""
+
+    def __init__(self, stops: Sequence[Stop], start: Optional[Node], transit: AirportTransit):
+        self.stops = list(stops)
+        nodes = [start] + [s.node for s in self.stops]
+        n = len(nodes)
+        self.minutes = np.zeros((n, n))
+        for i, node in enumerate(nodes):
+            if node is None:
+                continue  # unknown start: the first leg is free
+            self.minutes[i] = transit.distances_from(node, [m or node for m in nodes]) * MINUTES_PER_UNIT
+        self.minutes[:, 0] = 0.0
+
+    def evaluate(self, route: Sequence[int]) -> Tuple[float, List[Tuple[float, float]]]:
+        """Cost of a route of stop indexes (1-based), plus (arrival, lateness) per stop"""
+        clock, position, late, timeline = 0.0, 0, 0.0, []
+        for i in route:
+            stop = self.stops[i - 1]
+            clock = max(clock + self.minutes[position, i], stop.ready)
+            lateness = max(0.0, clock - stop.deadline) if stop.deadline is not None else 0.0
+            late += lateness
+            timeline.append((clock, lateness))
+            position = i
+        return clock + LATE_PENALTY * late, timeline
+
+    def _feasible(self, route: Sequence[int]) -> bool:
+        """Every drop-off comes after its order's pickup (if the order still has one)"""
+        awaiting = {s.order.id for s in self.stops if s.action == PICKUP}
+        for i in route:
+            stop = self.stops[i - 1]
+            if stop.action == PICKUP:
+                awaiting.discard(stop.order.id)
+            elif stop.order.id in awaiting:
+                return False
+        return True
+
+    def plan(self) -> List[int]:
+        # Cheapest insertion, most urgent orders first; each order's stops go in together
+        by_order: Dict[int, List[int]] = {}
+        for i, stop in enumerate(self.stops, start=1):
+            by_order.setdefault(stop.order.id, []).append(i)
+        route: List[int] = []
+        for ids in sorted(by_order.values(), key=lambda ids: min(self.stops[i - 1].deadline or np.inf for i in ids)):
+            best = None
+            if len(ids) == 1:
+                candidates = ([*route[:p], ids[0], *route[p:]] for p in range(len(route) + 1))
+            else:
+                pickup, dropoff = ids
+                candidates = (
+                    [*route[:p], pickup, *route[p:q], dropoff, *route[q:]]
+                    for p in range(len(route) + 1) for q in range(p, len(route) + 1)
+                )
+            for candidate in candidates:
+                cost = self.evaluate(candidate)[0]
+                if best is None or cost < best[0]:
+                    best = (cost, candidate)
+            route = best[1]
+
+        # Relocate moves until no single stop can be moved somewhere cheaper
+        cost = self.evaluate(route)[0]
+        for _ in range(MAX_IMPROVEMENT_PASSES):
+            improved = False
+            for i in range(len(route)):
+                rest = route[:i] + route[i + 1:]
+                for p in range(len(rest) + 1):
+                    candidate = rest[:p] + [route[i]] + rest[p:]
+                    if candidate == route or not self._feasible(candidate):
+                        continue
+                    candidate_cost = self.evaluate(candidate)[0]
+                    if candidate_cost < cost - 1e-9:
+                        route, cost, improved = candidate, candidate_cost, True
+                        break
+                if improved:
+                    break
+            if not improved:
+                break
+        return route
+
+
+@traced()
+def plan_trip(db: Session, agent: DeliveryAgent, now: Optional[datetime] = None) -> dict:
+    """The agent's current trip with its stops in order and ETAs"""
+    now = now or datetime.now(timezone.utc)
+    airport_id, orders, deferred = current_trip(db, agent.id)
+    plan = {
+        "agent_id": agent.id,
+        "order_ids": [],
+        "stops": [],
+        "total_distance": 0.0,
+        "total_minutes": 0.0,
+        "deferred_order_ids": [o.id for o in deferred],
+        "unroutable_order_ids": [],
+    }
+    if airport_id is None:
+        return plan
+
+    gates = gate_terminals(db, airport_id)
+    airport = order_airports(db, orders[:1])[orders[0].id]
+    stops, unroutable = build_stops(orders, gates, airport, now)
+    plan["unroutable_order_ids"] = [o.id for o in unroutable]
+    if not stops:
+        return plan
+
+    location = (agent.current_location or "").upper()
+    here = location in gates and agent.airport_id in (None, airport_id)  # the same gate number elsewhere isn't a start
+    start = (gates[location], gate_node(location)) if here else None
+    planner = TripPlanner(stops, start, load_airport_transit(db, airport_id))
+    route = planner.plan()
+    _, timeline = planner.evaluate(route)
+
+    position = 0
+    for i, (arrival, lateness) in zip(route, timeline):
+        stop = planner.stops[i - 1]
+        leg = planner.minutes[position, i] / MINUTES_PER_UNIT
+        plan["stops"].append({
+            "order_id": stop.order.id,
+            "action": stop.action,
+            "location": stop.order.restaurant.name if stop.action == PICKUP else stop.order.boarding_gate,
+            "terminal_id": stop.node[0],
+            "node": stop.node[1],
+            "distance": round(float(leg), 2),
+            "eta": now + timedelta(minutes=arrival),
+            "late_minutes": round(lateness, 1),
+        })
+        plan["total_distance"] += float(leg)
+        position = i
+    plan["order_ids"] = list(dict.fromkeys(s["order_id"] for s in plan["stops"]))
+    plan["total_distance"] = round(plan["total_distance"], 2)
+    plan["total_minutes"] = round(timeline[-1][0], 1) if timeline else 0.0
+    return plan
+
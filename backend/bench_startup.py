@@ -0,0 +1,66 @@
+"""
+Startup-time benchmark - measures how long a fresh worker takes to become ready.
+Each run starts a new interpreter and reports:
+  - import:   time to import app.main
+  - startup:  time for the lifespan startup hooks
+  - first:    time to serve the first GET /health
+  - db_conns: database connections opened during import (should be 0)
+
+Usage: python bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import json, time
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+connections = []
+event.listen(Pool, "connect", lambda *args: connections.append(1))
+
+t0 = time.perf_counter()
+from app.main import app
+t1 = time.perf_counter()
+db_conns = len(connections)
+
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    t2 = time.perf_counter()
+    response = client.get("/health")
+    t3 = time.perf_counter()
+
+print(json.dumps({
+    "import": t1 - t0,
+    "startup": t2 - t1,
+    "first": t3 - t2,
+    "db_conns": db_conns,
+    "status": response.status_code,
+}))
+"""
+
+
+def run_once() -> dict:
+    result = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark worker cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    print(f"Cold start over {args.runs} runs (ms):")
+    for key in ("import", "startup", "first"):
+        values = [r[key] * 1000 for r in results]
+        print(f"  {key:<8} median {statistics.median(values):7.1f}   min {min(values):7.1f}   max {max(values):7.1f}")
+    print(f"  db connections during import: {max(r['db_conns'] for r in results)}")
+    return 0 if all(r["status"] == 200 for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+Alembic environment. Uses the application's engine URL and model metadata,
+so `alembic revision --autogenerate` diffs against app/models. app.migrate
+passes each shard's URL in config.attributes["url"].
+"""
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import create_engine, pool
+from app.database import DATABASE_URL, Base
+import app.models  # noqa: F401 - registers every table on Base.metadata
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+url = config.attributes.get("url", DATABASE_URL)
+
+# SQLite can't ALTER most constraints; batch mode recreates the table instead
+render_as_batch = url.startswith("sqlite")
+
+
+def run_migrations_offline():
+    context.configure(
+        url=url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=render_as_batch,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    connectable = create_engine(url, poolclass=pool.NullPool)
+
+    with connectable.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            render_as_batch=render_as_batch,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
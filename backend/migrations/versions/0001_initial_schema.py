@@ -0,0 +1,130 @@
+"""Initial schema (tables previously created by Base.metadata.create_all)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+agent_status = sa.Enum('AVAILABLE', 'ASSIGNED', 'ON_DELIVERY', 'OFFLINE', name='agentstatus')
+order_status = sa.Enum(
+    'ORDER_PLACED', 'RESTAURANT_PREPARING', 'AGENT_ASSIGNED', 'PICKED_UP',
+    'IN_TRANSIT', 'DELIVERED', 'CANCELLED', name='orderstatus'
+)
+
+
+def upgrade():
+    op.create_table(
+        'airports',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('code', sa.String(length=3), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('city', sa.String(length=100), nullable=False),
+        sa.Column('state', sa.String(length=50), nullable=False),
+        sa.Column('timezone', sa.String(length=50), nullable=False),
+        sa.Column('latitude', sa.String(length=20), nullable=True),
+        sa.Column('longitude', sa.String(length=20), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_airports_code', 'airports', ['code'], unique=True)
+    op.create_index('ix_airports_id', 'airports', ['id'], unique=False)
+
+    op.create_table(
+        'delivery_agents',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('agent_code', sa.String(length=20), nullable=False),
+        sa.Column('password', sa.String(length=255), nullable=True),
+        sa.Column('status', agent_status, nullable=False),
+        sa.Column('current_location', sa.String(length=100), nullable=True),
+        sa.Column('contact', sa.String(length=255), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('agent_code'),
+    )
+    op.create_index('ix_delivery_agents_id', 'delivery_agents', ['id'], unique=False)
+
+    op.create_table(
+        'terminals',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('airport_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('layout_data', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['airport_id'], ['airports.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_terminals_id', 'terminals', ['id'], unique=False)
+
+    op.create_table(
+        'gates',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('terminal_id', sa.Integer(), nullable=False),
+        sa.Column('gate_number', sa.String(length=20), nullable=False),
+        sa.Column('coordinates', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['terminal_id'], ['terminals.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_gates_id', 'gates', ['id'], unique=False)
+
+    op.create_table(
+        'restaurants',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('terminal_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('cuisine_type', sa.String(length=100), nullable=True),
+        sa.Column('location', sa.JSON(), nullable=True),
+        sa.Column('nearby_gates', sa.JSON(), nullable=True),
+        sa.Column('estimated_prep_time', sa.Integer(), nullable=True),
+        sa.Column('mock_ordering_slug', sa.String(length=100), nullable=True),
+        sa.Column('description', sa.String(length=500), nullable=True),
+        sa.ForeignKeyConstraint(['terminal_id'], ['terminals.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_restaurants_id', 'restaurants', ['id'], unique=False)
+
+    op.create_table(
+        'orders',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('order_confirmation', sa.String(length=50), nullable=False),
+        sa.Column('restaurant_id', sa.Integer(), nullable=False),
+        sa.Column('user_name', sa.String(length=255), nullable=False),
+        sa.Column('user_contact', sa.String(length=255), nullable=False),
+        sa.Column('boarding_gate', sa.String(length=20), nullable=False),
+        sa.Column('flight_number', sa.String(length=20), nullable=True),
+        sa.Column('estimated_pickup_time', sa.DateTime(), nullable=True),
+        sa.Column('status', order_status, nullable=False),
+        sa.Column('delivery_agent_id', sa.Integer(), nullable=True),
+        sa.Column('delivery_otp', sa.String(length=6), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['delivery_agent_id'], ['delivery_agents.id']),
+        sa.ForeignKeyConstraint(['restaurant_id'], ['restaurants.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_orders_id', 'orders', ['id'], unique=False)
+    op.create_index('ix_orders_order_confirmation', 'orders', ['order_confirmation'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_orders_order_confirmation', table_name='orders')
+    op.drop_index('ix_orders_id', table_name='orders')
+    op.drop_table('orders')
+    op.drop_index('ix_restaurants_id', table_name='restaurants')
+    op.drop_table('restaurants')
+    op.drop_index('ix_gates_id', table_name='gates')
+    op.drop_table('gates')
+    op.drop_index('ix_terminals_id', table_name='terminals')
+    op.drop_table('terminals')
+    op.drop_index('ix_delivery_agents_id', table_name='delivery_agents')
+    op.drop_table('delivery_agents')
+    op.drop_index('ix_airports_id', table_name='airports')
+    op.drop_index('ix_airports_code', table_name='airports')
+    op.drop_table('airports')
+    order_status.drop(op.get_bind(), checkfirst=True)
+    agent_status.drop(op.get_bind(), checkfirst=True)
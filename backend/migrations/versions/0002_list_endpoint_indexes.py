@@ -0,0 +1,32 @@
+"""Indexes backing keyset pagination and filters on list endpoints
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_terminals_airport_id', 'terminals', ['airport_id'], unique=False)
+    op.create_index('ix_gates_terminal_gate_number', 'gates', ['terminal_id', 'gate_number'], unique=False)
+    op.create_index('ix_restaurants_terminal_id_id', 'restaurants', ['terminal_id', 'id'], unique=False)
+    op.create_index('ix_restaurants_terminal_cuisine', 'restaurants', ['terminal_id', 'cuisine_type'], unique=False)
+    op.create_index('ix_orders_agent_id', 'orders', ['delivery_agent_id', 'id'], unique=False)
+    op.create_index('ix_orders_status', 'orders', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_orders_status', table_name='orders')
+    op.drop_index('ix_orders_agent_id', table_name='orders')
+    op.drop_index('ix_restaurants_terminal_cuisine', table_name='restaurants')
+    op.drop_index('ix_restaurants_terminal_id_id', table_name='restaurants')
+    op.drop_index('ix_gates_terminal_gate_number', table_name='gates')
+    op.drop_index('ix_terminals_airport_id', table_name='terminals')
@@ -0,0 +1,26 @@
+"""Index orders by flight number for gate-change ingest
+
+Flight numbers are stored normalized (upper case, no spaces) from now on;
+existing rows are normalized here so the index lookup finds them.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("UPDATE orders SET flight_number = upper(replace(flight_number, ' ', '')) WHERE flight_number IS NOT NULL")
+    op.create_index('ix_orders_flight_number', 'orders', ['flight_number', 'status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_orders_flight_number', table_name='orders')
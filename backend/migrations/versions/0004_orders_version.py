@@ -0,0 +1,28 @@
+"""Version orders for optimistic concurrency
+
+Every order write bumps orders.version and is conditional on it (or on the
+status it moves from), so concurrent writers get a conflict instead of
+overwriting each other.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('orders') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('orders') as batch_op:
+        batch_op.drop_column('version')
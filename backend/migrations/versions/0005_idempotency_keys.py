@@ -0,0 +1,34 @@
+"""Store responses for Idempotency-Key retries
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('headers', sa.JSON(), nullable=True),
+        sa.Column('body', sa.LargeBinary(), nullable=True),
+        sa.Column('created_at', sa.Float(), nullable=False),
+        sa.Column('expires_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_keys_expires_at', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
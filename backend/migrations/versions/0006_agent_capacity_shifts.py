@@ -0,0 +1,31 @@
+"""Agent capacity and shift windows
+
+Dispatch only gives an agent orders while they are on shift and below their
+capacity (max active orders); other orders wait in the dispatch queue.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('delivery_agents') as batch_op:
+        batch_op.add_column(sa.Column('capacity', sa.Integer(), server_default='3', nullable=False))
+        batch_op.add_column(sa.Column('shift_start', sa.DateTime(timezone=True), nullable=True))
+        batch_op.add_column(sa.Column('shift_end', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('delivery_agents') as batch_op:
+        batch_op.drop_column('shift_end')
+        batch_op.drop_column('shift_start')
+        batch_op.drop_column('capacity')
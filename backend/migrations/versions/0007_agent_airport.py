@@ -0,0 +1,44 @@
+"""Agents belong to an airport
+
+Gate numbers repeat across airports (B1 at JFK and at LAX), so an agent's
+current_location alone doesn't say where they are. Existing agents are
+placed in the airport of their latest order; the rest stay unplaced (NULL)
+until dispatch first gives them one.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('delivery_agents') as batch_op:
+        batch_op.add_column(sa.Column('airport_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_delivery_agents_airport_id', 'airports', ['airport_id'], ['id'])
+        batch_op.create_index('ix_delivery_agents_airport_id', ['airport_id'])
+    op.execute(
+        """
+        UPDATE delivery_agents SET airport_id = (
+            SELECT terminals.airport_id FROM orders
+            JOIN restaurants ON restaurants.id = orders.restaurant_id
+            JOIN terminals ON terminals.id = restaurants.terminal_id
+            WHERE orders.delivery_agent_id = delivery_agents.id
+            ORDER BY orders.id DESC LIMIT 1
+        )
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('delivery_agents') as batch_op:
+        batch_op.drop_index('ix_delivery_agents_airport_id')
+        batch_op.drop_constraint('fk_delivery_agents_airport_id', type_='foreignkey')
+        batch_op.drop_column('airport_id')
@@ -1,21 +1,11 @@
 """
-Reset database script - Deletes old database and recreates with new schema
-Run this when you've added new columns to models
+Reset database script - Drops all tables and rebuilds them from the migrations
+Run this to start over with an empty database (development only).
+After changing a model, add a migration instead:
+    alembic revision --autogenerate -m "describe the change"
 """
-import os
-from app.database import engine, Base
-from app.models import Airport, Terminal, Gate, Restaurant, Order, DeliveryAgent
+from app.migrate import reset
 
-# Delete old database
-db_file = "airport_delivery.db"
-if os.path.exists(db_file):
-    os.remove(db_file)
-    print(f"✅ Deleted old database: {db_file}")
-
-# Create new tables with updated schema
-Base.metadata.create_all(bind=engine)
-print("✅ Created new database with updated schema")
+reset()
+print("✅ Rebuilt database schema from migrations")
 print("\nNow run: python seed_data.py")
-
-
-
@@ -0,0 +1,108 @@
+"""
+Capacity planning - simulates a stretch of delivery operations and reports
+delivery times, agent utilization and missed flights. See
+app/services/simulation.py for the model and the demand/roster formats.
+
+    python simulate.py --airport JFK --hours 4 --orders-per-hour 40 --agents 6
+    python simulate.py --demand recorded.json --roster roster.json
+    python simulate.py --synthetic 20 --agents 4 --json    # generated airports
+
+The simulation never touches the configured database: it runs against a
+throwaway SQLite file with its own flight feed.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+# Point the app at a scratch database and flight feed before anything reads the configuration
+_workdir = tempfile.mkdtemp(prefix="simulation-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'simulation.db')}"
+os.environ["FLIGHT_SCHEDULE_PATH"] = os.path.join(_workdir, "flights.json")
+for _name in ("DATABASE_SHARDS", "DATABASE_REPLICA_URLS"):
+    os.environ.pop(_name, None)
+
+import shutil  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.migrate import upgrade  # noqa: E402
+from app.services.seeding import generate_fixture, load_fixture  # noqa: E402
+from app.services.simulation import Simulation, synthetic_demand, synthetic_roster  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate delivery operations for capacity planning")
+    parser.add_argument("--fixture", help="Airports fixture (default: app/fixtures/airports.json)")
+    parser.add_argument("--synthetic", type=int, metavar="AIRPORTS", help="Generate this many airports instead")
+    parser.add_argument("--airport", action="append", help="Only these airport codes (repeatable)")
+    parser.add_argument("--demand", help="Recorded demand: JSON list of order arrivals")
+    parser.add_argument("--hours", type=float, default=4, help="Synthetic demand: hours of arrivals")
+    parser.add_argument("--orders-per-hour", type=float, default=30, help="Synthetic demand: orders per airport per hour")
+    parser.add_argument("--roster", help="Agent roster: JSON list of agents")
+    parser.add_argument("--agents", type=int, default=5, help="Synthetic roster: agents per airport")
+    parser.add_argument("--capacity", type=int, default=3, help="Synthetic roster: orders per agent at once")
+    parser.add_argument("--shift-minutes", type=float, help="Synthetic roster: staggered shifts of this length")
+    parser.add_argument("--drain", type=float, default=240, help="Minutes to keep running after the last arrival")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        fixture = generate_fixture(airports=args.synthetic, agents=0, seed=args.seed)
+    else:
+        fixture = load_fixture(args.fixture) if args.fixture else load_fixture()
+    if args.airport:
+        codes = {code.upper() for code in args.airport}
+        fixture["airports"] = [a for a in fixture["airports"] if a["code"] in codes]
+
+    if args.demand:
+        with open(args.demand) as f:
+            demand = json.load(f)
+    else:
+        demand = synthetic_demand(fixture, args.orders_per_hour, args.hours, seed=args.seed)
+    if args.roster:
+        with open(args.roster) as f:
+            roster = json.load(f)
+    else:
+        roster = synthetic_roster(
+            fixture, args.agents, capacity=args.capacity, seed=args.seed,
+            shift_minutes=args.shift_minutes, hours=args.hours
+        )
+
+    try:
+        upgrade()
+        simulation = Simulation(fixture, roster, demand, drain_minutes=args.drain)
+        with open(os.environ["FLIGHT_SCHEDULE_PATH"], "w") as f:
+            json.dump(simulation.flight_feed(), f)
+        db = SessionLocal()
+        try:
+            simulation.seed(db)
+            report = simulation.run(db)
+        finally:
+            db.close()
+    finally:
+        shutil.rmtree(_workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    print(f"Simulated {report['simulated_minutes']:.0f} minutes in {report['wall_seconds']:.1f}s "
+          f"({report['speedup']}x real time)")
+    print(f"{'airport':<8} {'orders':>6} {'deliv.':>6} {'p50':>6} {'p90':>6} {'p99':>6} "
+          f"{'missed':>7} {'agents':>6} {'util.':>6}")
+    for code, section in [*report["airports"].items(), ("ALL", report)]:
+        times = section["delivery_minutes"]
+        missed = section["missed_flight_rate"]
+        utilization = section["utilization"]
+        print(
+            f"{code:<8} {section['orders']:>6} {section['delivered']:>6} "
+            f"{times.get('p50', 0):>6.1f} {times.get('p90', 0):>6.1f} {times.get('p99', 0):>6.1f} "
+            f"{(missed or 0) * 100:>6.1f}% {section['agents']:>6} "
+            f"{(utilization['mean'] if utilization else 0) * 100:>5.0f}%"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,7 +7,9 @@ if [ -n "$DATABASE_URL" ]; then
   echo "Database URL configured: ${DATABASE_URL:0:20}..."
 fi
 
-# Run database migrations/create tables (handled by main.py)
+# Run database migrations (the app never creates tables itself)
+python -m app.migrate
+
 # Seed data if database is empty (optional - run manually via Railway CLI)
 # python seed_data.py
 
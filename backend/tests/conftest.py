@@ -0,0 +1,78 @@
+"""
+Shared fixtures. The app reads its configuration at import, so a scratch
+SQLite database (migrated to head) and quiet background loops are set up
+before anything under app/ is imported.
+
+    cd backend && python -m pytest
+"""
+import os
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="airport-delivery-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_scratch, 'test.db')}",
+    "DATABASE_SHARDS": "",
+    "DATABASE_REPLICA_URLS": "",
+    "COMPUTE_WORKERS": "0",
+    "SNAPSHOT_PATH": "",
+    "TRACE_EXPORTER": "",
+    "NOTIFY_LOG_PATH": os.path.join(_scratch, "notifications.log"),
+    # Rounds only when a test asks for one
+    "DISPATCH_INTERVAL": "3600",
+    "LIVE_COUNTS_RECONCILE": "3600",
+})
+
+import pytest  # noqa: E402
+from alembic import command  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from app.database import Base, all_shards  # noqa: E402
+from app.migrate import alembic_config  # noqa: E402
+from app.services.agent_load import agent_load  # noqa: E402
+from app.services.demand import demand  # noqa: E402
+from app.services.live_counts import live_counts  # noqa: E402
+from app.services.order_cache import order_cache  # noqa: E402
+from app.services.scheduler import scheduler  # noqa: E402
+from app.services.seeding import seed_from_fixture  # noqa: E402
+
+
+def pytest_sessionstart(session):
+    for shard in all_shards():
+        command.upgrade(alembic_config(shard), "head")
+
+
+@pytest.fixture
+def db():
+    """A session on an empty database, with every in-memory view of it reset"""
+    shard = all_shards()[0]
+    session = shard.SessionLocal()
+    for table in reversed(Base.metadata.sorted_tables):
+        session.execute(table.delete())
+    session.commit()
+    order_cache.clear()
+    scheduler.queues.clear()
+    scheduler.deadlines.clear()
+    scheduler.airports.clear()
+    agent_load.reconcile(session)
+    live_counts.reconcile(session)
+    demand.rebuild(session)
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def seed(db):
+    """seed(fixture) loads airports and agents into the test database"""
+    def load(fixture: dict):
+        seed_from_fixture(db, {"airports": [], "agents": [], **fixture})
+        agent_load.reconcile(db)
+    return load
+
+
+@pytest.fixture
+def client(db):
+    """The app with its lifespan running (background jobs, scheduler, sockets)"""
+    from app.main import app
+    with TestClient(app) as test_client:
+        yield test_client
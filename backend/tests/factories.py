@@ -0,0 +1,47 @@
+"""Small fixtures (in the seed file format) and orders for tests"""
+from app.models.order import Order, OrderStatus
+from app.models.restaurant import Restaurant
+
+
+def terminal(name: str, gates, restaurants) -> dict:
+    return {
+        "name": name,
+        "layout_data": {"width": 800, "height": 600},
+        "gates": [
+            {"gate_number": gate, "coordinates": {"x": 100 + 50 * n, "y": 200}} for n, gate in enumerate(gates)
+        ],
+        "restaurants": [
+            {
+                "name": restaurant, "cuisine_type": "Test", "location": {"x": 300 + 40 * n, "y": 300},
+                "nearby_gates": list(gates), "estimated_prep_time": 15,
+            }
+            for n, restaurant in enumerate(restaurants)
+        ],
+    }
+
+
+def airport(code: str, gates=("A1", "B1"), restaurants=("Cafe",)) -> dict:
+    return {
+        "code": code, "name": f"{code} Airport", "city": code, "state": "NY", "timezone": "America/New_York",
+        "terminals": [terminal("Terminal 1", gates, restaurants)],
+    }
+
+
+def agent(code: str, **fields) -> dict:
+    return {"name": f"Agent {code}", "agent_code": code, **fields}
+
+
+def restaurant_in(db, airport_code: str) -> int:
+    return next(r.id for r in db.query(Restaurant).all() if r.terminal.airport.code == airport_code)
+
+
+def place(db, confirmation: str, airport_code: str = "JFK", gate: str = "A1",
+          status: OrderStatus = OrderStatus.ORDER_PLACED, **fields) -> int:
+    """An order written straight to the database, bypassing dispatch"""
+    order = Order(
+        order_confirmation=confirmation, restaurant_id=restaurant_in(db, airport_code),
+        user_name="Test", user_contact="test@example.com", boarding_gate=gate, status=status, **fields
+    )
+    db.add(order)
+    db.commit()
+    return order.id
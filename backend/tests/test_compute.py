@@ -0,0 +1,31 @@
+import asyncio
+import logging
+import numpy as np
+from app.services.compute import compute
+import app.services.routing  # registers "all_pairs"  # noqa: F401
+
+
+def edges():
+    return np.array([0, 1]), np.array([1, 2]), np.array([1.0, 2.0])
+
+
+def test_submit_returns_awaitables_that_fan_out():
+    async def run():
+        return await asyncio.gather(*(compute.submit("all_pairs", 3, *edges()) for _ in range(2)))
+
+    first, second = asyncio.run(run())
+    assert first[0][2] == second[0][2] == 3.0
+
+
+def test_call_on_event_loop_warns_once(caplog, monkeypatch):
+    # alembic's fileConfig in conftest's migrations disables loggers that already exist
+    monkeypatch.setattr(logging.getLogger("app.services.compute"), "disabled", False)
+    compute._warned.discard("all_pairs")
+
+    async def run():
+        compute.call("all_pairs", 3, *edges())
+        compute.call("all_pairs", 3, *edges())
+
+    with caplog.at_level(logging.WARNING, logger="app.services.compute"):
+        asyncio.run(run())
+    assert len([r for r in caplog.records if "blocks it" in r.getMessage()]) == 1
@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import event
+from app.models.order import Order, OrderStatus
+from app.routers import flights
+from app.services.gate_changes import apply_gate_changes
+from app.schemas.flight import GateChange
+from factories import airport, place
+
+FEED = {"changes": [{"flight_number": "DL 100", "new_gate": "B1"}]}
+
+
+@pytest.fixture
+def flight(db, seed):
+    seed({"airports": [airport("JFK")]})
+    return {
+        "open": place(db, "C1", flight_number="DL100"),
+        "delivered": place(db, "C2", flight_number="DL100", status=OrderStatus.DELIVERED),
+    }
+
+
+def gate(db, order_id: int) -> str:
+    db.expire_all()
+    return db.get(Order, order_id).boarding_gate
+
+
+def test_ingest_requires_feed_token(client, flight, monkeypatch):
+    monkeypatch.setattr(flights, "GATE_FEED_TOKEN", "feed-secret")
+    assert client.post("/api/flights/gate-changes", json=FEED).status_code == 401
+    wrong = client.post("/api/flights/gate-changes", json=FEED, headers={"Authorization": "Bearer nope"})
+    assert wrong.status_code == 403
+
+
+def test_ingest_refused_without_configured_token(client, flight, monkeypatch):
+    monkeypatch.setattr(flights, "GATE_FEED_TOKEN", "")
+    response = client.post("/api/flights/gate-changes", json=FEED, headers={"Authorization": "Bearer "})
+    assert response.status_code == 401
+    response = client.post("/api/flights/gate-changes", json=FEED, headers={"Authorization": "Bearer x"})
+    assert response.status_code == 403
+
+
+def test_ingest_moves_open_orders_only(client, db, flight, monkeypatch):
+    monkeypatch.setattr(flights, "GATE_FEED_TOKEN", "feed-secret")
+    response = client.post("/api/flights/gate-changes", json=FEED, headers={"Authorization": "Bearer feed-secret"})
+    assert response.status_code == 200, response.text
+    assert [u["order_id"] for u in response.json()["updates"]] == [flight["open"]]
+    assert gate(db, flight["open"]) == "B1"
+    assert gate(db, flight["delivered"]) == "A1"
+
+
+def test_order_closed_mid_ingest_keeps_its_gate(db, flight):
+    """An order delivered between the lookup and the UPDATE isn't moved or reported"""
+    engine = db.get_bind()
+    raced = []
+
+    def deliver_first(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE orders SET boarding_gate") and not raced:
+            raced.append(True)
+            conn.exec_driver_sql("UPDATE orders SET status = 'DELIVERED' WHERE id = ?", (flight["open"],))
+
+    event.listen(engine, "before_cursor_execute", deliver_first)
+    try:
+        result = apply_gate_changes(db, [GateChange(flight_number="DL100", new_gate="B1")])
+    finally:
+        event.remove(engine, "before_cursor_execute", deliver_first)
+    assert raced and result["updates"] == []
+    assert gate(db, flight["open"]) == "A1"
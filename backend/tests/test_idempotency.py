@@ -0,0 +1,49 @@
+import uuid
+import pytest
+from app.models.order import Order
+from factories import airport, restaurant_in
+
+
+@pytest.fixture
+def order_body(db, seed):
+    seed({"airports": [airport("JFK")]})
+    restaurant_id = restaurant_in(db, "JFK")
+
+    def body(confirmation: str) -> dict:
+        return {
+            "order_confirmation": confirmation, "restaurant_id": restaurant_id,
+            "user_name": "Test", "user_contact": "test@example.com", "boarding_gate": "A1",
+        }
+    return body
+
+
+def post(client, body: dict, key: str):
+    return client.post("/api/orders/", json=body, headers={"Idempotency-Key": key})
+
+
+def test_retry_is_replayed_not_rerun(client, db, order_body):
+    key = str(uuid.uuid4())
+    first = post(client, order_body("C1"), key)
+    retry = post(client, order_body("C1"), key)
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert db.query(Order).count() == 1
+
+
+def test_same_key_with_another_body_is_rejected(client, order_body):
+    key = str(uuid.uuid4())
+    assert post(client, order_body("C1"), key).status_code == 200
+    assert post(client, order_body("C2"), key).status_code == 422
+
+
+
+def test_keys_are_scoped_to_the_method_and_path(client, order_body):
+    key = str(uuid.uuid4())
+    order = post(client, order_body("C1"), key).json()
+    update = client.put(
+        f"/api/orders/{order['id']}/status", json={"status": "restaurant_preparing"}, headers={"Idempotency-Key": key}
+    )
+    assert update.status_code == 200
+    assert "Idempotent-Replayed" not in update.headers
+    assert update.json()["status"] == "restaurant_preparing"
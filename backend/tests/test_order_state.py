@@ -0,0 +1,86 @@
+import pytest
+from fastapi import HTTPException
+from app.models.delivery_agent import DeliveryAgent
+from app.models.order import Order, OrderStatus
+from app.services.order_state import compare_and_set, transition
+from factories import agent, airport, place
+
+
+@pytest.fixture
+def agents(db, seed):
+    seed({"airports": [airport("JFK")], "agents": [agent("A1"), agent("A2")]})
+    return [a.id for a in db.query(DeliveryAgent).order_by(DeliveryAgent.agent_code)]
+
+
+def current(db, order_id: int) -> Order:
+    db.expire_all()
+    return db.get(Order, order_id)
+
+
+def test_compare_and_set_bumps_version_and_refuses_stale_writes(db, agents):
+    order_id = place(db, "C1")
+    assert compare_and_set(db, order_id, OrderStatus.CANCELLED, expected_version=1)
+    db.commit()
+    assert (current(db, order_id).status, current(db, order_id).version) == (OrderStatus.CANCELLED, 2)
+    assert not compare_and_set(db, order_id, OrderStatus.CANCELLED, expected_version=1)
+
+
+@pytest.mark.parametrize("kwargs, status, code", [
+    ({"expected_version": 7}, OrderStatus.PICKED_UP, 409),
+    ({}, OrderStatus.DELIVERED, 409),
+    ({"agent_id": -1}, OrderStatus.PICKED_UP, 403),
+])
+def test_transition_explains_a_miss(db, agents, kwargs, status, code):
+    order_id = place(db, "C1", status=OrderStatus.AGENT_ASSIGNED, delivery_agent_id=agents[0])
+    with pytest.raises(HTTPException) as miss:
+        transition(db, order_id, status, **kwargs)
+    assert miss.value.status_code == code
+    assert current(db, order_id).status == OrderStatus.AGENT_ASSIGNED
+
+
+def test_trip_pickup_moves_what_it_can(client, db, agents):
+    mine = place(db, "C1", status=OrderStatus.AGENT_ASSIGNED, delivery_agent_id=agents[0])
+    other = place(db, "C2", status=OrderStatus.AGENT_ASSIGNED, delivery_agent_id=agents[1])
+    body = client.put(f"/api/agents/{agents[0]}/trip/pickup", json={"order_ids": [mine, other, 999]}).json()
+
+    assert [o["order"]["id"] for o in body["orders"]] == [mine]
+    assert {f["order_id"]: f["detail"] for f in body["failed"]} == {
+        other: "Order not assigned to this agent", 999: "Order not found",
+    }
+    assert current(db, mine).status == OrderStatus.PICKED_UP and current(db, mine).delivery_otp
+    assert current(db, other).status == OrderStatus.AGENT_ASSIGNED
+
+
+def test_trip_deliver_checks_each_otp(client, db, agents):
+    first = place(db, "C1", status=OrderStatus.PICKED_UP, delivery_agent_id=agents[0], delivery_otp="111111")
+    second = place(db, "C2", status=OrderStatus.PICKED_UP, delivery_agent_id=agents[0], delivery_otp="222222")
+    body = client.post(f"/api/agents/{agents[0]}/trip/deliver", json={"deliveries": [
+        {"order_id": first, "otp": "111111"}, {"order_id": second, "otp": "000000"},
+    ]}).json()
+
+    assert [o["id"] for o in body["orders"]] == [first]
+    assert body["failed"] == [{"order_id": second, "detail": "Invalid OTP"}]
+    assert current(db, second).status == OrderStatus.PICKED_UP
+
+
+@pytest.mark.parametrize("status, target", [
+    (OrderStatus.PICKED_UP, OrderStatus.DELIVERED),
+    (OrderStatus.IN_TRANSIT, OrderStatus.DELIVERED),
+    (OrderStatus.AGENT_ASSIGNED, OrderStatus.PICKED_UP),
+    (OrderStatus.PICKED_UP, OrderStatus.IN_TRANSIT),
+    (OrderStatus.ORDER_PLACED, OrderStatus.AGENT_ASSIGNED),
+])
+def test_status_endpoint_refuses_agent_and_dispatch_moves(client, db, agents, status, target):
+    agent_id = None if status == OrderStatus.ORDER_PLACED else agents[0]
+    order_id = place(db, "C1", status=status, delivery_agent_id=agent_id, delivery_otp="123456")
+    response = client.put(f"/api/orders/{order_id}/status", json={"status": target.value})
+    assert response.status_code == 400
+    assert current(db, order_id).status == status
+
+
+@pytest.mark.parametrize("target", [OrderStatus.RESTAURANT_PREPARING, OrderStatus.CANCELLED])
+def test_status_endpoint_sets_restaurant_and_cancel_moves(client, db, agents, target):
+    order_id = place(db, "C1")
+    response = client.put(f"/api/orders/{order_id}/status", json={"status": target.value})
+    assert response.status_code == 200, response.text
+    assert current(db, order_id).status == target
@@ -0,0 +1,71 @@
+import pytest
+from fastapi import HTTPException
+from app.services.pagination import decode_cursor, encode_cursor
+from factories import airport, terminal
+
+RESTAURANTS = ("Bagels", "Burgers", "Noodles", "Salads", "Tacos")
+
+
+@pytest.fixture
+def restaurants(seed):
+    fixture = airport("JFK")
+    fixture["terminals"] = [terminal("Terminal 1", ("A1", "A2"), RESTAURANTS)]
+    seed({"airports": [fixture]})
+
+
+def page_through(client, url: str, **params) -> list:
+    pages, cursor = [], None
+    while True:
+        body = client.get(url, params={**params, **({"cursor": cursor} if cursor else {})}).json()
+        assert body["total"] == len(RESTAURANTS)
+        pages.append([r["name"] for r in body["restaurants"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(12.5, 7), 2) == [12.5, 7]
+    for bad in ("not-base64!", encode_cursor(1), encode_cursor(1, 2, 3)):
+        with pytest.raises(HTTPException) as error:
+            decode_cursor(bad, 2)
+        assert error.value.status_code == 400
+
+
+def test_unpaged_without_limit(client, restaurants):
+    body = client.get("/api/restaurants/airport/JFK").json()
+    assert [r["name"] for r in body["restaurants"]] == list(RESTAURANTS)
+    assert body["total"] == len(RESTAURANTS)
+    assert body["next_cursor"] is None
+
+
+def test_pages_by_id_cover_every_restaurant_once(client, restaurants):
+    pages = page_through(client, "/api/restaurants/airport/JFK", limit=2)
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sum(pages, []) == list(RESTAURANTS)
+
+
+def test_pages_by_distance_keep_the_distance_order(client, restaurants):
+    unpaged = client.get("/api/restaurants/airport/JFK", params={"gate": "A1"}).json()["restaurants"]
+    pages = page_through(client, "/api/restaurants/airport/JFK", gate="A1", limit=2)
+    assert sum(pages, []) == [r["name"] for r in unpaged]
+    distances = [r["distance_from_gate"] for r in unpaged]
+    assert distances == sorted(distances)
+
+
+def test_invalid_cursor_is_a_400(client, restaurants):
+    response = client.get("/api/restaurants/airport/JFK", params={"limit": 2, "cursor": "garbage"})
+    assert response.status_code == 400
+
+
+def test_airports_unpaged_without_limit(client, seed):
+    codes = ["ATL", "BOS", "JFK", "LAX", "SFO"]
+    seed({"airports": [airport(code) for code in reversed(codes)]})
+    unpaged = client.get("/api/airports/", params={"depth": 0})
+    assert [a["code"] for a in unpaged.json()] == codes
+    assert "X-Next-Cursor" not in unpaged.headers
+
+    first = client.get("/api/airports/", params={"depth": 0, "limit": 3})
+    rest = client.get("/api/airports/", params={"depth": 0, "limit": 3, "cursor": first.headers["X-Next-Cursor"]})
+    assert [a["code"] for a in first.json() + rest.json()] == codes
+    assert "X-Next-Cursor" not in rest.headers
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+from app.models.airport import Airport
+from app.models.delivery_agent import DeliveryAgent
+from app.models.order import Order, OrderStatus
+from app.services.order_service import claim_agent
+from app.services.scheduler import scheduler
+from factories import agent, airport, place, restaurant_in
+
+
+def agent_of(db, order_id: int):
+    db.expire_all()
+    return db.get(Order, order_id).delivery_agent_id
+
+
+def test_new_order_assigned_inline(client, db, seed):
+    seed({"airports": [airport("JFK")], "agents": [agent("A1")]})
+    response = client.post("/api/orders/", json={
+        "order_confirmation": "C1", "restaurant_id": restaurant_in(db, "JFK"),
+        "user_name": "Test", "user_contact": "test@example.com", "boarding_gate": "A1",
+    })
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "agent_assigned"
+
+
+def test_new_order_waits_behind_more_urgent_one(db, seed):
+    seed({"airports": [airport("JFK")]})
+    first = place(db, "C1")
+    assert not scheduler.dispatch_order(db, first)
+
+    seed({"agents": [agent("A1", capacity=1)]})
+    second = place(db, "C2")
+    assert not scheduler.dispatch_order(db, second)  # didn't jump the queue
+    assert agent_of(db, first) is None
+
+    assert scheduler.dispatch_pending(db) == [first]
+    assert agent_of(db, second) is None
+
+
+def test_new_order_queues_only_itself(db, seed):
+    seed({"airports": [airport("JFK")], "agents": [agent("A1")]})
+    older = place(db, "C1")  # waiting, but not queued on this worker yet
+    new = place(db, "C2")
+    assert scheduler.dispatch_order(db, new)
+    assert older not in scheduler.queue(db)  # left for the background round to pick up
+    assert agent_of(db, older) is None
+
+
+def agent_id(db, code: str) -> int:
+    return db.query(DeliveryAgent.id).filter(DeliveryAgent.agent_code == code).scalar()
+
+
+def test_busy_airport_does_not_hold_up_another(db, seed):
+    """JFK's agent is busy and its order waits; LAX's order still goes to the idle LAX agent at B1"""
+    seed({
+        "airports": [airport("JFK"), airport("LAX")],
+        "agents": [
+            agent("J1", airport="JFK", current_location="B1", capacity=1),
+            agent("L1", airport="LAX", current_location="B1"),
+        ],
+    })
+    place(db, "JFK-1", "JFK", status=OrderStatus.AGENT_ASSIGNED, delivery_agent_id=agent_id(db, "J1"))
+    soon = datetime.now(timezone.utc) - timedelta(minutes=30)
+    waiting = place(db, "JFK-2", "JFK", estimated_pickup_time=soon)
+    lax = place(db, "LAX-1", "LAX", gate="B1")
+
+    scheduler.sync(db, datetime.now(timezone.utc))
+    assert next(iter(scheduler.queue(db))) == waiting  # the most urgent order can't be served
+    assert scheduler.dispatch_pending(db) == [lax]
+    assert agent_of(db, lax) == agent_id(db, "L1")
+    assert agent_of(db, waiting) is None
+
+
+def test_gate_numbers_are_matched_within_the_airport(db, seed):
+    seed({
+        "airports": [airport("JFK"), airport("LAX")],
+        "agents": [agent("J1", airport="JFK", current_location="B1"), agent("L1", airport="LAX", current_location="B1")],
+    })
+    lax = place(db, "LAX-1", "LAX")
+    assert scheduler.dispatch_pending(db) == [lax]
+    assert agent_of(db, lax) == agent_id(db, "L1")
+
+
+def test_unplaced_agent_joins_the_order_airport(db, seed):
+    seed({"airports": [airport("JFK"), airport("LAX")], "agents": [agent("U1")]})
+    lax = place(db, "LAX-1", "LAX", gate="A1")
+    assert scheduler.dispatch_pending(db) == [lax]
+    db.expire_all()
+    placed = db.get(DeliveryAgent, agent_id(db, "U1"))
+    assert placed.airport_id == db.query(Airport.id).filter(Airport.code == "LAX").scalar()
+    assert placed.current_location == "A1"
+
+
+def test_claim_rechecks_capacity_in_the_database(db, seed):
+    seed({"airports": [airport("JFK")], "agents": [agent("J1", airport="JFK", capacity=1)]})
+    j1 = db.get(DeliveryAgent, agent_id(db, "J1"))
+    now = datetime.now(timezone.utc)
+    assert claim_agent(db, j1, now) is not None
+    db.rollback()
+    place(db, "JFK-1", status=OrderStatus.AGENT_ASSIGNED, delivery_agent_id=j1.id)
+    assert claim_agent(db, j1, now) is None
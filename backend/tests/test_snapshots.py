@@ -0,0 +1,32 @@
+import numpy as np
+from app.services.snapshots import read_snapshot, write_snapshot
+
+
+def test_round_trip_with_empty_arrays(tmp_path):
+    path = str(tmp_path / "warm.snapshot")
+    arrays = {
+        "matrix": np.arange(12, dtype=float).reshape(3, 4),
+        "none_yet": np.zeros((0, 3), dtype=np.int64),
+        "counts": np.array([7, 8, 9], dtype=np.int32),
+        "empty": np.array([], dtype=float),
+    }
+    write_snapshot(path, {"tables": ({"terminals": [1]}, arrays)})
+
+    header, sections = read_snapshot(path)
+    meta, restored = sections["tables"]
+    assert meta == {"terminals": [1]}
+    assert restored.keys() == arrays.keys()
+    for key, array in arrays.items():
+        assert restored[key].dtype == array.dtype and restored[key].shape == array.shape
+        np.testing.assert_array_equal(restored[key], array)
+
+
+def test_snapshot_of_only_empty_arrays(tmp_path):
+    path = str(tmp_path / "warm.snapshot")
+    write_snapshot(path, {"demand": ({}, {"rings": np.zeros((0, 96))})})
+    _, sections = read_snapshot(path)
+    assert sections["demand"][1]["rings"].shape == (0, 96)
+
+
+def test_missing_snapshot_reads_as_none(tmp_path):
+    assert read_snapshot(str(tmp_path / "absent")) is None
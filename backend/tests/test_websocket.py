@@ -0,0 +1,45 @@
+import asyncio
+import pytest
+from starlette.websockets import WebSocketDisconnect
+from app.routers import websocket as ws
+
+
+def test_rejected_socket_gets_try_again_close_code(client, monkeypatch):
+    monkeypatch.setattr(ws, "WS_MAX_PER_ORDER", 1)
+    with client.websocket_connect("/ws/order/999") as first:
+        with client.websocket_connect("/ws/order/999") as second:
+            with pytest.raises(WebSocketDisconnect) as refused:
+                second.receive_text()
+    assert refused.value.code == 1013
+    assert ws.manager.rejected_total >= 1
+
+
+class SlowSocket:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.sent = []
+
+    async def send_text(self, text: str):
+        await asyncio.sleep(self.delay)
+        self.sent.append(text)
+
+    async def close(self, code: int, reason: str = ""):
+        pass
+
+
+def test_heartbeat_pings_sockets_concurrently(monkeypatch):
+    manager = ws.ConnectionManager()
+    sockets = [SlowSocket(0.2) for _ in range(5)]
+    for n, socket in enumerate(sockets):
+        manager.active_connections[n] = [socket]
+        manager.connections[socket] = ws.ConnectionInfo(n, "127.0.0.1")
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await manager.heartbeat_once()
+        return loop.time() - started
+
+    elapsed = asyncio.run(run())
+    assert all(len(socket.sent) == 1 for socket in sockets)
+    assert elapsed < 0.6  # one slow send's worth, not five
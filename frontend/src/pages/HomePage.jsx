@@ -16,7 +16,7 @@ function HomePage() {
   const loadAirports = async () => {
     try {
       setLoading(true);
-      const response = await getAirports();
+      const response = await getAirports({ fields: 'code,name,city,state', depth: 0 });
       setAirports(response.data);
     } catch (err) {
       setError('Failed to load airports. Please try again.');
@@ -161,22 +161,9 @@ function OrderTrackingPage() {
     });
   };
 
-  const getNextStatus = () => {
-    const statuses = [
-      'order_placed',
-      'restaurant_preparing',
-      'agent_assigned',
-      'picked_up',
-      'in_transit',
-      'delivered',
-    ];
-    
-    const currentIndex = statuses.indexOf(order?.status);
-    if (currentIndex < statuses.length - 1) {
-      return statuses[currentIndex + 1];
-    }
-    return null;
-  };
+  // Only the restaurant step is set by hand; assignment, pickup and
+  // delivery come from dispatch and the agent app
+  const getNextStatus = () => (order?.status === 'order_placed' ? 'restaurant_preparing' : null);
 
   const handleAdvanceStatus = async () => {
     const nextStatus = getNextStatus();
@@ -374,7 +361,7 @@ function OrderTrackingPage() {
                     <p className="text-white/60 text-sm">
                       {getNextStatus() 
                         ? `Advance to: ${statusConfig[getNextStatus()]?.label}`
-                        : 'Order completed'}
+                        : 'Next updates come from the delivery agent'}
                     </p>
                   </div>
                   {getNextStatus() && (
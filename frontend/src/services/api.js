@@ -9,8 +9,45 @@ const api = axios.create({
   },
 });
 
+// Read-your-writes: after a write, send back the server's token so the next
+// reads aren't served by a replica that hasn't caught up yet
+let readAfter = null;
+api.interceptors.request.use((config) => {
+  if (readAfter) {
+    config.headers['X-Read-After'] = readAfter;
+  }
+  return config;
+});
+api.interceptors.response.use((response) => {
+  const token = response.headers['x-read-after'];
+  if (token) {
+    readAfter = token;
+  }
+  return response;
+});
+
+// Writes that must not run twice get one Idempotency-Key per call, reused by
+// its retries, so a retry after a lost response replays the first result.
+// Retried only when no response came back, or the first try is still running (409)
+const WRITE_RETRIES = 2;
+const RETRY_DELAY_MS = 500;
+const sendOnce = async (request) => {
+  const headers = { 'Idempotency-Key': crypto.randomUUID() };
+  for (let attempt = 0; ; attempt += 1) {
+    try {
+      return await request({ headers });
+    } catch (err) {
+      const retryable = !err.response || err.response.status === 409;
+      if (!retryable || attempt >= WRITE_RETRIES) {
+        throw err;
+      }
+      await new Promise((resolve) => setTimeout(resolve, RETRY_DELAY_MS * (attempt + 1)));
+    }
+  }
+};
+
 // Airports API
-export const getAirports = () => api.get('/api/airports');
+export const getAirports = (params = {}) => api.get('/api/airports', { params });
 export const getAirport = (code) => api.get(`/api/airports/${code}`);
 
 // Restaurants API
@@ -21,31 +58,39 @@ export const getRestaurantsByAirport = (airportCode, gate = null) => {
 export const getRestaurant = (id) => api.get(`/api/restaurants/${id}`);
 
 // Orders API
-export const createOrder = (orderData) => api.post('/api/orders', orderData);
+export const createOrder = (orderData) => sendOnce((config) => api.post('/api/orders', orderData, config));
 export const getOrder = (id) => api.get(`/api/orders/${id}`);
 export const getOrderByConfirmation = (confirmation) => 
   api.get(`/api/orders/confirmation/${confirmation}`);
-export const updateOrderStatus = (id, status) => 
-  api.put(`/api/orders/${id}/status`, { status });
+export const updateOrderStatus = (id, status, version) => 
+  api.put(`/api/orders/${id}/status`, version === undefined ? { status } : { status, version });
 
 // Agents API
 export const getAgentOrders = (agentId) => api.get(`/api/agents/${agentId}/orders`);
 export const getAgent = (agentId) => api.get(`/api/agents/${agentId}`);
-export const markPickedUp = (orderId, agentId) => 
-  api.put(`/api/agents/orders/${orderId}/pickup?agent_id=${agentId}`);
+export const markPickedUp = (orderId, agentId) =>
+  sendOnce((config) => api.put(`/api/agents/orders/${orderId}/pickup?agent_id=${agentId}`, undefined, config));
 export const markInTransit = (orderId, agentId) => 
   api.put(`/api/agents/orders/${orderId}/transit?agent_id=${agentId}`);
-export const markDelivered = (orderId, agentId, otp) => 
-  api.post(`/api/agents/orders/${orderId}/deliver?agent_id=${agentId}`, { otp });
+export const markDelivered = (orderId, agentId, otp) =>
+  sendOnce((config) => api.post(`/api/agents/orders/${orderId}/deliver?agent_id=${agentId}`, { otp }, config));
+export const getAgentTrip = (agentId) => api.get(`/api/agents/${agentId}/trip`);
+export const pickUpTrip = (agentId, orderIds) =>
+  sendOnce((config) => api.put(`/api/agents/${agentId}/trip/pickup`, orderIds ? { order_ids: orderIds } : undefined, config));
+export const deliverTrip = (agentId, deliveries) =>
+  sendOnce((config) => api.post(`/api/agents/${agentId}/trip/deliver`, { deliveries }, config));
 
-// WebSocket helper
-export const getWebSocketUrl = (orderId) => {
+// WebSocket helpers
+const getWebSocketBase = () => {
   const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
   const wsHost = import.meta.env.VITE_API_URL 
     ? new URL(import.meta.env.VITE_API_URL).host
     : 'localhost:8000';
-  return `${wsProtocol}//${wsHost}/ws/order/${orderId}`;
+  return `${wsProtocol}//${wsHost}/ws`;
 };
 
+export const getWebSocketUrl = (orderId) => `${getWebSocketBase()}/order/${orderId}`;
+export const getAgentWebSocketUrl = (agentId) => `${getWebSocketBase()}/agent/${agentId}`;
+
 export default api;
 
@@ -29,6 +29,11 @@ export class OrderWebSocket {
       this.ws.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data);
+          // Answer server heartbeats so the connection isn't reaped as idle
+          if (data.type === 'ping') {
+            this.send({ type: 'pong' });
+            return;
+          }
           this.onMessage(data);
         } catch (error) {
           console.error('Error parsing WebSocket message:', error);
@@ -12,8 +12,11 @@ if [ ! -d "venv/lib" ]; then
     pip install -r requirements.txt
 fi
 
+# Apply database migrations
+python -m app.migrate
+
 # Check if database is seeded
-if [ ! -f "airport_delivery.db" ] && [ ! -f ".db_seeded" ]; then
+if [ ! -f ".db_seeded" ]; then
     echo "Seeding database..."
     python seed_data.py
     touch .db_seeded